@@ -0,0 +1,36 @@
+import json
+
+from tpphypemonitor.baseline import BaselineStore, MIN_SAMPLES
+from tpphypemonitor.detector import BaselineDetector
+
+
+def test_typical_ratio_without_hints_in_history():
+    baseline = BaselineStore()
+
+    for index in range(MIN_SAMPLES):
+        baseline.add(index * 60, 'hint', 0)
+
+    assert baseline.typical(0, 'hint') == 0
+    assert baseline.typical_ratio(0, 'hint', 0) == 0
+
+    ratio = baseline.typical_ratio(0, 'hint', 0.06)
+    assert ratio < 1
+    json.dumps({'vs_typical': ratio}, allow_nan=False)
+
+    assert baseline.typical_ratio(0, 'hint', 1.0) > 3
+
+
+def test_baseline_detector_ignores_small_bump_over_zero_history():
+    baseline = BaselineStore()
+
+    for index in range(MIN_SAMPLES):
+        baseline.add(index * 60, 'hint', 0)
+
+    detector = BaselineDetector('hint', baseline=baseline, warmup=0)
+    values = [0, 0, 0.1, 0.1, 0.1, 0] + [1.0] * 6
+    results = [
+        detector.update(value, index * 10)
+        for index, value in enumerate(values)
+    ]
+
+    assert results.index('begin') >= 6
@@ -0,0 +1,73 @@
+import tpphypemonitor.bot.stats
+from tpphypemonitor.bot.stats import SendScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.current_time = 1000.0
+
+    def time(self):
+        return self.current_time
+
+    def monotonic(self):
+        return self.current_time
+
+
+def _scheduler(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tpphypemonitor.bot.stats, 'time', clock)
+    sent = []
+    scheduler = SendScheduler(
+        lambda channel, text: sent.append((channel, text)), rate=1, burst=3)
+    return clock, scheduler, sent
+
+
+def test_scheduler_spends_one_token_per_line(monkeypatch):
+    clock, scheduler, sent = _scheduler(monkeypatch)
+
+    for index in range(5):
+        scheduler.add_announcement('#a', str(index))
+
+    scheduler.pump()
+    assert [text for channel, text in sent] == ['0', '1', '2']
+
+    scheduler.pump()
+    assert len(sent) == 3
+
+    clock.current_time += 1.5
+    scheduler.pump()
+    assert [text for channel, text in sent] == ['0', '1', '2', '3']
+
+    clock.current_time += 0.5
+    scheduler.pump()
+    assert len(sent) == 5
+    assert scheduler.pending_count == 0
+
+    # Tokens refill up to the burst only
+    clock.current_time += 100
+    scheduler.add_stats('#a', ['1', '2', '3', '4'])
+    scheduler.pump()
+    assert len(sent) == 5
+
+
+def test_scheduler_sends_snapshot_lines_together(monkeypatch):
+    clock, scheduler, sent = _scheduler(monkeypatch)
+    scheduler.add_announcement('#a', 'hype')
+    scheduler.add_stats('#a', ['old 1', 'old 2'])
+    scheduler.add_stats('#b', ['b 1', 'b 2'])
+    scheduler.add_stats('#a', ['new 1', 'new 2'])
+    scheduler.pump()
+
+    # The newer snapshot for #a keeps its place and the older one is dropped
+    assert sent == [('#a', 'hype'), ('#a', 'new 1'), ('#a', 'new 2')]
+
+    # Not enough tokens for both lines yet
+    clock.current_time += 1
+    scheduler.pump()
+    assert len(sent) == 3
+
+    clock.current_time += 1
+    scheduler.pump()
+    assert sent[3:] == [('#b', 'b 1'), ('#b', 'b 2')]
+    assert scheduler.pending_count == 0
+
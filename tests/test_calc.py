@@ -0,0 +1,145 @@
+import pickle
+
+import tpphypemonitor.calc
+from tpphypemonitor.button import ButtonInputParser
+from tpphypemonitor.calc import BIN_SIZES, DataSet, HypeCalculator
+from tpphypemonitor.heuristics import TextAnalyzer
+
+
+class OldDataPoint(object):
+    __slots__ = (
+        'line_count',
+        'button_count',
+        'hint_score',
+        'timestamp',
+    )
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.line_count = 3
+        self.button_count = 1
+        self.hint_score = 0.5
+
+
+# Pickled under the current name as an older version would have
+OldDataPoint.__module__ = 'tpphypemonitor.calc'
+OldDataPoint.__qualname__ = 'DataPoint'
+
+
+def test_restore_data_point_pickled_before_emote_counts(monkeypatch):
+    monkeypatch.setattr(tpphypemonitor.calc, 'DataPoint', OldDataPoint)
+    data = pickle.dumps({60: OldDataPoint(60)})
+    monkeypatch.undo()
+
+    data_set = DataSet(pickle.loads(data), 60)
+    data_set.add_chat_data_point(timestamp=60, emote_count=2)
+    data_set.add_hint_data_point(timestamp=60, hint_index=1)
+
+    data_point = data_set[60]
+    assert data_point.line_count == 4
+    assert data_point.button_count == 1
+    assert data_point.emote_count == 2
+    assert list(data_point.hint_counts) == [0, 1]
+
+
+def _graph_calculator(end_timestamp):
+    calculator = HypeCalculator(ButtonInputParser(), TextAnalyzer(0))
+
+    for timestamp in range(end_timestamp - 14400, end_timestamp, 5):
+        calculator._activity.add_chat_data_point(timestamp=timestamp)
+
+    calculator._last_timestamp = end_timestamp - 1
+
+    for bin_size in BIN_SIZES:
+        calculator._sealed_until[bin_size] = \
+            (end_timestamp - 30) // bin_size * bin_size
+
+    return calculator
+
+
+def test_graph_string_reuses_sealed_values():
+    end_timestamp = 1000 * 3600
+    calculator = _graph_calculator(end_timestamp)
+    graph_string = calculator.graph_string()
+
+    assert len(calculator._graph_cache) == 24 * 2 - 1 + 30 * 2 - 1
+
+    # Sealed bins are taken from the cache and the open ones are recomputed
+    for data_set in calculator._activity.data_sets.values():
+        for data_point in data_set.values():
+            data_point.line_count *= 2
+
+    values = calculator.graph_values(
+        'rate', end_timestamp - 3600, end_timestamp, 60)
+
+    assert values[:-1] == [12 / 60] * 59
+    assert values[-1] == 24 / 60
+    assert calculator.graph_string() != graph_string
+
+
+def test_graph_values_aggregate_bins():
+    end_timestamp = 1000 * 3600
+    calculator = _graph_calculator(end_timestamp)
+    data_set = calculator._activity.data_sets[60]
+    data_set[end_timestamp - 7200].line_count = 60
+
+    # An hour per value is taken from the 15 minute bins
+    values = calculator.graph_values(
+        'rate', end_timestamp - 7200, end_timestamp, 2, aggregate='mean')
+
+    assert values == [180 / 900, 180 / 900]
+
+    # A minute per value is taken from the 1 minute bins
+    values = calculator.graph_values(
+        'rate', end_timestamp - 7200, end_timestamp, 120)
+
+    assert values[0] == 1.0
+    assert values[1:] == [12 / 60] * 119
+
+
+def _chat(timestamp, text='hello', tags=None):
+    return 'chat', 'nick', text, timestamp, None, tags
+
+
+def test_seal_bins_by_watermark_with_allowed_lateness():
+    calculator = HypeCalculator(ButtonInputParser(), TextAnalyzer(0),
+                                allowed_lateness=2)
+    sealed_bins = []
+    calculator.add_sealed_bin_listener(
+        lambda bin_size, data_point: sealed_bins.append(
+            (bin_size, data_point.timestamp, data_point.line_count))
+        if bin_size == 10 else None)
+
+    calculator._process_batch([_chat(100), _chat(105), _chat(111)])
+    # Within the allowed lateness
+    calculator._process_batch([_chat(109), _chat(112)])
+
+    # Bins without lines are sealed too
+    assert sealed_bins == [(10, 90, 0), (10, 100, 3)]
+    assert calculator.late_count == 0
+
+    # 119 is after the watermark passed 120 and is late too
+    calculator._process_batch([_chat(108), _chat(125), _chat(119)])
+
+    assert sealed_bins[2:] == [(10, 110, 2)]
+    assert calculator.late_count == 2
+    assert calculator._sealed_until[10] == 120
+
+
+def test_count_emotes_and_hint_emotes_from_tags():
+    calculator = HypeCalculator(ButtonInputParser(), TextAnalyzer(0))
+    calculator._process_batch([
+        _chat(100, 'PogChamp PogChamp', {'emotes': '88:0-7,9-16'}),
+        _chat(101, 'Kappa FailFish', {'emotes': '25:0-4/360:6-13'}),
+        _chat(102, 'we did it', {'emotes': ''}),
+        # Without the emotes tag the text is searched
+        _chat(103, 'PogChamp', {}),
+        _chat(104, 'PogChamp'),
+    ])
+
+    data_point = calculator._activity.data_sets[10][100]
+    assert data_point.line_count == 5
+    assert data_point.emote_count == 4
+    assert data_point.hint_score == 5
+    assert calculator.hint_breakdown(10, 104) == {
+        'PogChamp': 3, 'FailFish': 1, 'we did it': 1}
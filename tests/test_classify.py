@@ -0,0 +1,106 @@
+import random
+
+from tpphypemonitor.button import ButtonInputParser
+from tpphypemonitor.classify import ClassifierPool, classify_batch
+from tpphypemonitor.heuristics import TextAnalyzer, make_pattern_set, \
+    parse_emotes
+
+FRAGMENTS = (
+    'a', 'b2', 'up', 'start', 'left+', 'right9', 'select', ' ', '  ', '\n',
+    'PogChamp', 'pogchamp', 'PogChampPogChamp', 'FailFish', 'we did it',
+    'we', 'did', 'it', 'victory', 'riot', 'Kappa', 'lol', '!', 'é', '漢字',
+)
+PATTERNS = (
+    r'\bPogChamp\b',
+    r'\bwe did it\b',
+    r'\bvictory riot\b',
+    r'\bFailFish\b',
+    r'^lol$',
+    r'it\s+victory',
+    r'\Ariot',
+    r'(?<=!)Kappa',
+)
+
+
+def _random_lines(rng, count):
+    lines = []
+
+    for index in range(count):
+        if lines and rng.random() < 0.2:
+            lines.append(rng.choice(lines))
+            continue
+
+        text = ''.join(
+            rng.choice(FRAGMENTS) for index in range(rng.randint(0, 6)))
+        tags = rng.choice((
+            None, {}, {'emotes': ''}, {'emotes': '88:0-7'},
+            {'emotes': '360:0-7,9-16'}, {'emotes': '25:0-4/88:6-13'},
+        ))
+        lines.append((text, tags))
+
+    return lines
+
+
+def test_batch_classify_matches_per_line():
+    rng = random.Random(5)
+    button_input_parser = ButtonInputParser()
+
+    for chat_patterns in (PATTERNS[:4], PATTERNS):
+        text_analyzer = TextAnalyzer(0)
+        text_analyzer._pattern_set = make_pattern_set(chat_patterns)
+
+        for batch_index in range(30):
+            lines = _random_lines(rng, rng.randint(1, 100))
+            button_flags, hint_indexes, hint_keys, emote_totals = \
+                classify_batch(button_input_parser, text_analyzer, lines)
+
+            for index, (text, tags) in enumerate(lines):
+                emote_counts = parse_emotes(tags['emotes']) \
+                    if tags is not None and 'emotes' in tags else None
+                hint = text_analyzer.analyze_chat(text, emote_counts)
+
+                assert button_flags[index] == \
+                    bool(button_input_parser.parse_button(text))
+                assert (hint_keys[hint_indexes[index]]
+                        if hint_indexes[index] >= 0 else None) == \
+                    (hint.key if hint else None)
+                assert emote_totals[index] == \
+                    sum((emote_counts or {}).values())
+
+
+def test_classifier_pool_keeps_batch_order():
+    rng = random.Random(6)
+    button_input_parser = ButtonInputParser()
+    text_analyzer = TextAnalyzer(0)
+    pool = ClassifierPool(button_input_parser, text_analyzer, 2,
+                          min_batch_size=50)
+
+    try:
+        batches = []
+
+        for size in (300, 10, 200, 120):
+            items = [
+                ('chat', 'nick', text, 0, None, tags)
+                for text, tags in _random_lines(rng, size)
+            ] + [('live_thread', {}, 0)]
+            batches.append(items)
+            pool.submit(items)
+
+        for items in batches:
+            popped_items, classified = pool.pop(wait=True)
+
+            assert popped_items is items
+
+            if len(items) < 50:
+                assert classified is None
+                continue
+
+            expected = classify_batch(
+                button_input_parser, text_analyzer,
+                [(item[2], item[5]) for item in items if item[0] == 'chat'])
+            assert [list(value) for value in classified] == \
+                [list(value) for value in expected]
+
+        assert pool.pop() is None
+    finally:
+        pool.close()
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from tpphypemonitor.button import ButtonInputParser
+from tpphypemonitor.calc import DataPoint, HypeCalculator
+from tpphypemonitor.cluster import BinDeltaSender, BinDeltaServer
+from tpphypemonitor.heuristics import TextAnalyzer
+
+
+class NodeCalculator(object):
+    hint_keys = ()
+
+
+def _data_point(timestamp, line_count):
+    data_point = DataPoint(timestamp)
+    data_point.line_count = line_count
+    return data_point
+
+
+def test_aggregate_nodes_on_localhost():
+    calculator = HypeCalculator(ButtonInputParser(), TextAnalyzer(0))
+    server = BinDeltaServer(port=0)
+    server.start_source(calculator)
+    thread = threading.Thread(target=calculator.process_forever)
+    thread.daemon = True
+    thread.start()
+
+    address = ('127.0.0.1', server.port)
+    senders = [
+        BinDeltaSender(address, NodeCalculator(), node_id=node_id,
+                       group=group)
+        for node_id, group in (('a1', 'A'), ('a2', 'A'), ('b1', 'B'))
+    ]
+    timestamp_start = int(time.time()) // 10 * 10
+
+    for index in range(16):
+        timestamp = timestamp_start + index * 10
+        senders[0].add_data_point(10, _data_point(timestamp, 100))
+        # Lossy connection to the same chat
+        senders[1].add_data_point(10, _data_point(timestamp, 70))
+        # Clock 30 seconds behind
+        senders[2].add_data_point(10, _data_point(timestamp - 30, 5))
+        time.sleep(0.01)
+
+    deadline = time.monotonic() + 10
+
+    while calculator._sealed_until.get(10, 0) < timestamp_start + 120 and \
+            time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    data_set = calculator._activity.data_sets[10]
+
+    # Bins the lagging node sent before it held back sealing are late
+    for timestamp in range(timestamp_start + 30, timestamp_start + 130, 10):
+        assert data_set[timestamp].line_count == 105
+
+    assert calculator._sealed_until[10] <= timestamp_start + 130
@@ -0,0 +1,85 @@
+import random
+import statistics
+
+from tpphypemonitor.button import ButtonInputParser
+from tpphypemonitor.calc import HypeCalculator
+from tpphypemonitor.detector import CUSUMDetector, RollingWindow
+from tpphypemonitor.heuristics import TextAnalyzer
+
+
+def _run(detector, values):
+    return [
+        (index, result) for index, result in
+        enumerate(detector.update(value) for value in values)
+        if result
+    ]
+
+
+def test_cusum_stationary_has_no_events():
+    rng = random.Random(1)
+    # Lines/sec of 10 second bins of chat at a steady 2 lines/sec
+    values = [rng.gauss(20, 20 ** 0.5) / 10 for index in range(2000)]
+    detector = CUSUMDetector()
+
+    assert _run(detector, values) == []
+    assert abs(detector._mean - 2.0) < 0.2
+
+
+def test_cusum_step_begins_and_ends():
+    rng = random.Random(2)
+    values = [rng.gauss(2, 0.4) for index in range(300)] + \
+        [rng.gauss(8, 1) for index in range(30)] + \
+        [rng.gauss(2, 0.4) for index in range(300)]
+    detector = CUSUMDetector()
+
+    events = _run(detector, values)
+
+    assert events[0][1] == 'begin'
+    assert 300 <= events[0][0] < 305
+    assert events[1][1] == 'end'
+    assert 330 <= events[1][0] < 345
+    assert len(events) == 2
+
+
+def test_rolling_window_matches_full_recompute():
+    rng = random.Random(8)
+    values = [rng.choice((0, 1, 2.5, rng.random() * 10)) for index in range(500)]
+    window = RollingWindow(90, median=True)
+
+    for index, value in enumerate(values):
+        window.append(value)
+        recent_values = values[max(0, index - 89):index + 1]
+
+        assert abs(window.mean() - statistics.mean(recent_values)) < 1e-9
+        assert window.median() == statistics.median(recent_values)
+
+
+def test_default_detection_per_closed_bin():
+    rng = random.Random(9)
+    calculator = HypeCalculator(ButtonInputParser(), TextAnalyzer(0))
+    timestamp_start = 1451606400
+    items = []
+
+    # About 1 line/sec with 2 minutes of 10 lines/sec from bin 150
+    for bin_index in range(300):
+        rate = 10 if 150 <= bin_index < 162 else 1
+        count = sum(1 for index in range(rate * 20) if rng.random() < 0.5)
+        items.extend(
+            ('chat', 'nick', 'hello',
+             timestamp_start + bin_index * 10 + index * 10 / count, None, None)
+            for index in range(count)
+        )
+
+    for start in range(0, len(items), 500):
+        calculator._process_batch(items[start:start + 500])
+
+    step_start = timestamp_start + 1500
+    events = calculator.recent_hype_events
+
+    # Stamped when the bins close, without waiting for a minute to pass.
+    # The lines/sec averages are medians, so half the short window has to
+    # change.
+    assert [(kind, event_type) for kind, event_type, event_time, hints
+            in events] == [('begin', 'chat'), ('end', 'chat')]
+    assert step_start + 10 <= events[0][2] <= step_start + 30
+    assert step_start + 120 < events[1][2] <= step_start + 180
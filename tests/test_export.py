@@ -0,0 +1,37 @@
+from tpphypemonitor.export import BinExporter
+
+
+class EventsCalculator(object):
+    def __init__(self, events):
+        self.recent_hype_events = tuple(events)
+
+
+def _intervals(exporter):
+    begin_column, end_column, type_column = exporter._event_columns
+
+    return list(zip(begin_column.read(), end_column.read(),
+                    type_column.read()))
+
+
+def test_export_pairs_events_by_type(tmp_path):
+    events = [
+        ('begin', 'hint', 3020.0, {}),
+        ('begin', 'chat-zscore', 3100.0, {}),
+        ('end', 'chat-zscore', 3150.0, {}),
+        ('begin', 'hint-cusum', 3200.0, {}),
+        ('end', 'hint', 3420.0, {}),
+    ]
+    exporter = BinExporter(str(tmp_path))
+    exporter.export(EventsCalculator(events))
+
+    assert _intervals(exporter) == [
+        (3100.0, 3150.0, 'chat-zscore'),
+        (3020.0, 3420.0, 'hint'),
+    ]
+
+    # Exporting again, with an event ending at the same time as the last
+    # one, only adds the new interval
+    events.append(('end', 'hint-cusum', 3420.0, {}))
+    exporter.export(EventsCalculator(events))
+
+    assert _intervals(exporter)[2:] == [(3200.0, 3420.0, 'hint-cusum')]
@@ -0,0 +1,99 @@
+import itertools
+import socket
+import threading
+
+import tpphypemonitor.fastchat
+from tpphypemonitor.fastchat import TwitchChatReader
+from tpphypemonitor.loadtest import FakeTwitchServer, synthetic_messages
+
+
+def _start_reader(port, messages):
+    reader = TwitchChatReader(
+        '127.0.0.1', '#TwitchPlaysPokemon',
+        lambda nick, text, tags: messages.append((nick, text, tags)),
+        port=port)
+    thread = threading.Thread(target=reader.run)
+    thread.daemon = True
+    thread.start()
+
+    return reader, thread
+
+
+def test_read_chat_from_fake_server():
+    server = FakeTwitchServer(synthetic_messages(), rate=1000)
+    server.start()
+    messages = []
+    received_event = threading.Event()
+
+    def on_message(nick, text, tags):
+        messages.append((nick, text, tags))
+
+        if len(messages) == 20:
+            received_event.set()
+
+    reader = TwitchChatReader('127.0.0.1', '#twitchplayspokemon', on_message,
+                              port=server.port)
+    thread = threading.Thread(target=reader.run)
+    thread.daemon = True
+    thread.start()
+
+    assert received_event.wait(10)
+    reader.stop()
+
+    assert messages[0] == ('user0', 'a 0', {'emotes': ''})
+    assert messages[10] == ('user10', 'PogChamp', {'emotes': '88:0-7'})
+    assert messages[12] == ('user12', 'FailFish why', {'emotes': ''})
+
+
+def _read_line(file):
+    return file.readline().rstrip(b'\r\n')
+
+
+def _accept_login(listener):
+    connection, address = listener.accept()
+    file = connection.makefile('rb')
+
+    assert _read_line(file).startswith(b'CAP REQ ')
+    assert _read_line(file).startswith(b'NICK justinfan')
+
+    return connection, file
+
+
+def test_answer_ping_and_reconnect(monkeypatch):
+    monkeypatch.setattr(tpphypemonitor.fastchat, 'RECONNECT_MIN_INTERVAL',
+                        0.01)
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    listener.settimeout(10)
+    messages = []
+    reader, thread = _start_reader(listener.getsockname()[1], messages)
+
+    connection, file = _accept_login(listener)
+    connection.sendall(b':tmi.twitch.tv 001 justinfan1 :Welcome, GLHF!\r\n')
+    assert _read_line(file) == b'JOIN #twitchplayspokemon'
+
+    connection.sendall(b'PING :tmi.twitch.tv\r\n')
+    assert _read_line(file) == b'PONG :tmi.twitch.tv'
+
+    connection.sendall(
+        b':other!other@other.tmi.twitch.tv PRIVMSG #other :elsewhere\r\n'
+        b'@badges=;emotes=;color=#FF0000 :Nick1!nick1@nick1.tmi.twitch.tv '
+        b'PRIVMSG #twitchplayspokemon :hello chat\r\n'
+        b':nick2!nick2@nick2.tmi.twitch.tv PRIVMSG #twitchplayspokemon :a\r\n'
+        b':tmi.twitch.tv RECONNECT\r\n')
+
+    # The reader logs in again on a new connection
+    connection2, file2 = _accept_login(listener)
+
+    reader.stop()
+    connection2.close()
+    connection.close()
+    listener.close()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert messages == [
+        ('nick1', 'hello chat', {'emotes': ''}),
+        ('nick2', 'a', None),
+    ]
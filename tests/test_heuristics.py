@@ -0,0 +1,39 @@
+import json
+import os
+
+from tpphypemonitor.heuristics import Hint, TextAnalyzer
+
+
+def _write_patterns(filename, doc):
+    with open(filename, 'w') as file:
+        json.dump(doc, file)
+
+
+def test_emotes_without_pattern_are_not_hints(tmp_path):
+    filename = str(tmp_path / 'patterns.json')
+    _write_patterns(filename, {'chat_patterns': ['\\bwe did it\\b']})
+    text_analyzer = TextAnalyzer(0, filename)
+
+    assert text_analyzer.analyze_chat('PogChamp', {'88': 1}) is None
+    assert text_analyzer.analyze_chat('PogChamp') is None
+    assert text_analyzer.analyze_chat('we did it PogChamp', {'88': 1}) == \
+        Hint('chat:\\bwe did it\\b', 'we did it')
+
+
+def test_keep_patterns_while_file_is_missing(tmp_path):
+    filename = str(tmp_path / 'patterns.json')
+    _write_patterns(filename, {'chat_patterns': ['\\bvictory riot\\b']})
+    text_analyzer = TextAnalyzer(0, filename)
+    os.remove(filename)
+
+    text_analyzer.reload_patterns()
+
+    assert text_analyzer.analyze_chat('victory riot') == \
+        Hint('chat:\\bvictory riot\\b', 'victory riot')
+
+    _write_patterns(filename, {'chat_patterns': ['\\bwe did it\\b']})
+    os.utime(filename, (1, 1))
+    text_analyzer.reload_patterns()
+
+    assert text_analyzer.analyze_chat('victory riot') is None
+    assert text_analyzer.analyze_chat('we did it')
@@ -0,0 +1,65 @@
+import sqlite3
+
+from tpphypemonitor.button import ButtonInputParser
+from tpphypemonitor.calc import HypeCalculator
+from tpphypemonitor.heuristics import TextAnalyzer
+from tpphypemonitor.history import HypeHistory, query_hype_events
+
+
+def test_recent_hype_events_are_read_from_history(tmp_path):
+    filename = str(tmp_path / 'hype.db')
+    calculator = HypeCalculator(ButtonInputParser(), TextAnalyzer(0))
+    history = HypeHistory(filename)
+    calculator.set_history(history)
+
+    calculator._append_hype_event(('begin', 'chat', 10, {'PogChamp': 3}))
+    calculator._append_hype_event(('begin', 'hint', 20, {}))
+    calculator._append_hype_event(('end', 'chat', 30, {'PogChamp': 5}))
+
+    assert calculator.recent_hype_events == (
+        ('begin', 'chat', 10, {'PogChamp': 3}),
+        ('begin', 'hint', 20, {}),
+        ('end', 'chat', 30, {'PogChamp': 5}),
+    )
+    assert not calculator._recent_hype_events
+
+    history.close()
+
+    # Still there after a restart
+    history = HypeHistory(filename)
+    assert history.recent_events(2) == [
+        ('begin', 'hint', 20, {}),
+        ('end', 'chat', 30, {'PogChamp': 5}),
+    ]
+    history.close()
+
+
+def test_open_history_from_before_begin_hints(tmp_path):
+    filename = str(tmp_path / 'hype.db')
+    connection = sqlite3.connect(filename)
+
+    with connection:
+        connection.execute(
+            'CREATE TABLE hype_events (id INTEGER PRIMARY KEY, '
+            'event_type TEXT NOT NULL, begin_time REAL NOT NULL, '
+            'end_time REAL, run_start_timestamp REAL, peak_rate REAL, '
+            'average_rate REAL, peak_hint_rate REAL, average_hint_rate REAL, '
+            'top_hints TEXT, UNIQUE (event_type, begin_time))')
+        connection.execute(
+            "INSERT INTO hype_events (event_type, begin_time, end_time) "
+            "VALUES ('chat', 1, 2)")
+
+    connection.close()
+
+    history = HypeHistory(filename)
+    history.add_hype_event(('begin', 'hint', 5, {'FailFish': 1}))
+
+    assert history.recent_events(10) == [
+        ('begin', 'chat', 1, {}),
+        ('end', 'chat', 2, {}),
+        ('begin', 'hint', 5, {'FailFish': 1}),
+    ]
+    history.close()
+
+    assert [row['event_type'] for row in query_hype_events(filename)] == \
+        ['chat', 'hint']
@@ -0,0 +1,45 @@
+import itertools
+
+import pytest
+
+from tpphypemonitor.loadtest import log_messages, parse_args
+
+
+def test_log_messages_replays_chat_log(tmp_path):
+    filename = str(tmp_path / 'chat.log')
+
+    with open(filename, 'w') as file:
+        file.write('2016-01-01T00:00:00 privmsg - :nick0 :a\n')
+        file.write('2016-01-01T00:00:01 join - :nick1 :\n')
+        file.write('2016-01-01T00:00:02 privmsg - :nick1 :hello chat\n')
+
+    messages = list(itertools.islice(log_messages([filename]), 4))
+
+    assert messages == [
+        ('nick0', 'a'), ('nick1', 'hello chat'),
+        ('nick0', 'a'), ('nick1', 'hello chat'),
+    ]
+
+
+def test_log_messages_requires_lines(tmp_path):
+    filename = str(tmp_path / 'chat.log')
+    open(filename, 'w').close()
+
+    with pytest.raises(ValueError):
+        log_messages([filename])
+
+
+@pytest.mark.parametrize('argv', [
+    ['run', '--fast', '--classify-workers', '2'],
+    ['run', '--fast', '--', '--classify-workers', '2'],
+])
+def test_run_passes_monitor_args(argv):
+    args = parse_args(argv)
+
+    assert args.fast
+    assert args.monitor_args == ['--classify-workers', '2']
+
+
+def test_server_rejects_unknown_args():
+    with pytest.raises(SystemExit):
+        parse_args(['server', '--classify-workers', '2'])
@@ -0,0 +1,61 @@
+import datetime
+import os
+
+from tpphypemonitor.logindex import find_offset, index_filename, load_index
+from tpphypemonitor.simulation import ChatLogReader
+
+TIMESTAMP_START = 1451606400
+
+
+def _write_log(filename, timestamp_start, count, step=7):
+    lines = []
+
+    with open(filename, 'w') as file:
+        for index in range(count):
+            timestamp = timestamp_start + index * step
+            date = datetime.datetime.utcfromtimestamp(timestamp)
+            file.write('{} privmsg - :nick{} :line {}\n'.format(
+                date.strftime('%Y-%m-%dT%H:%M:%S'), index % 5, index))
+            lines.append((timestamp, 'nick{}'.format(index % 5),
+                          'line {}'.format(index)))
+
+    return lines
+
+
+def test_start_date_seeks_with_index(tmp_path):
+    filenames = [str(tmp_path / 'chat-1.log'), str(tmp_path / 'chat-2.log')]
+    lines = _write_log(filenames[0], TIMESTAMP_START, 1000) + \
+        _write_log(filenames[1], TIMESTAMP_START + 7000, 1000)
+
+    for timestamp_start in (TIMESTAMP_START + 3001, TIMESTAMP_START + 9000):
+        reader = ChatLogReader(filenames, timestamp_start=timestamp_start)
+
+        assert [item[:3] for item in reader.items()] == \
+            [line for line in lines if line[0] >= timestamp_start]
+
+    # One entry per minute pointing at the first line of that minute
+    entries = load_index(filenames[0])['entries']
+    assert len(entries) == (7000 - 1) // 60 + 1
+
+    with open(filenames[0], 'rb') as file:
+        file.seek(find_offset(filenames[0], TIMESTAMP_START + 3001))
+        assert file.readline().startswith(b'2016-01-01T00:50:03 ')
+
+    # The first file ends in the minute before this so it is skipped
+    assert find_offset(filenames[0], TIMESTAMP_START + 7020) is None
+
+
+def test_rebuild_index_when_log_changes(tmp_path):
+    filename = str(tmp_path / 'chat.log')
+    _write_log(filename, TIMESTAMP_START, 100)
+    load_index(filename)
+
+    lines = _write_log(filename, TIMESTAMP_START + 600, 100)
+    os.utime(filename, (1, 1))
+
+    assert find_offset(filename, TIMESTAMP_START + 600) == 0
+    assert os.path.exists(index_filename(filename))
+    assert [
+        item[:3] for item in
+        ChatLogReader([filename], TIMESTAMP_START + 1200).items()
+    ] == [line for line in lines if line[0] >= TIMESTAMP_START + 1200]
@@ -0,0 +1,84 @@
+import glob
+import os
+import random
+
+from tpphypemonitor.recording import INDEX_SUFFIX, RecordingReader, \
+    RecordingWriter
+
+
+def _items(rng, timestamp_start, count):
+    items = []
+    timestamp = timestamp_start
+
+    for index in range(count):
+        timestamp += rng.random() * 2
+
+        if rng.random() < 0.05:
+            items.append(('live_thread', {
+                'body': '**caught** Pidgey {}'.format(index),
+                'created_utc': int(timestamp)
+            }, timestamp))
+        else:
+            tags = rng.choice((None, {}, {'emotes': '88:0-7', 'mod': '0'}))
+            items.append((
+                'chat', 'nick{}'.format(rng.randint(0, 50)),
+                rng.choice(('a', 'PogChamp', 'up2 é', '漢字')) * rng.randint(1, 3),
+                timestamp, None, tags
+            ))
+
+    return items
+
+
+def _as_read(item):
+    # Read items have the timestamp second
+    if item[0] == 'chat':
+        return 'chat', item[3], item[1], item[2], None, item[5]
+    else:
+        return 'live_thread', item[2], item[1]
+
+
+def test_recording_round_trip_and_seek(tmp_path):
+    directory = str(tmp_path)
+    rng = random.Random(6)
+    items = _items(rng, 1000000, 10000)
+    writer = RecordingWriter(directory, segment_max_duration=3600)
+
+    for start in range(0, len(items), 100):
+        writer.add_items(items[start:start + 100])
+
+    writer.close()
+
+    assert len(glob.glob(os.path.join(directory, '*.rec'))) == 3
+    assert list(RecordingReader(directory).items()) == \
+        [_as_read(item) for item in items]
+
+    for timestamp_start in (1000000, items[1234][3], items[-1][3] - 5,
+                            items[-1][3] + 1):
+        assert list(RecordingReader(directory, timestamp_start).items()) == [
+            _as_read(item) for item in items
+            if _as_read(item)[1] >= timestamp_start
+        ]
+
+
+def test_recording_without_index_and_partial_block(tmp_path):
+    directory = str(tmp_path)
+    items = _items(random.Random(7), 1000000, 500)
+    writer = RecordingWriter(directory)
+    writer.add_items(items)
+    writer.close()
+
+    filename = glob.glob(os.path.join(directory, '*.rec'))[0]
+    os.remove(filename + INDEX_SUFFIX)
+
+    with open(filename, 'ab') as file:
+        file.write(b'BLK1\0\0')
+
+    assert list(RecordingReader(directory, items[250][3]).items()) == \
+        [_as_read(item) for item in items[250:]]
+
+    # A new writer continues after the existing segments
+    writer = RecordingWriter(directory)
+    writer.add_items(_items(random.Random(8), 1010000, 10))
+    writer.close()
+
+    assert len(list(RecordingReader(directory).items())) == 510
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+import time
+
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+import tornado.websocket
+
+from tpphypemonitor.button import ButtonInputParser
+from tpphypemonitor.calc import HypeCalculator
+from tpphypemonitor.heuristics import TextAnalyzer
+from tpphypemonitor.reddit import LiveThreadInputSource
+
+RUN_DURATION = 86400
+
+
+def _post(index, created_utc):
+    return {
+        'id': str(index),
+        'name': 'LiveUpdate_{}'.format(index),
+        'author': 'updater',
+        'body': '[1d 0h 0m] **caught** Pidgey {}'.format(index),
+        'created_utc': created_utc,
+    }
+
+
+# Stand-in for the live thread's about, updates and websocket endpoints.
+# The websocket sends one update and then drops, and two updates are
+# posted while the reader is disconnected.
+class LiveThreadServer(object):
+    def __init__(self):
+        self.posts = [_post(0, time.time() - 120)]
+        self.connect_count = 0
+        self.port = None
+        self._ready = threading.Event()
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        server = self
+
+        class AboutHandler(tornado.web.RequestHandler):
+            def get(self, thread_id):
+                self.write({'data': {
+                    'websocket_url':
+                        'ws://127.0.0.1:{}/live'.format(server.port)
+                }})
+
+        class UpdatesHandler(tornado.web.RequestHandler):
+            def get(self, thread_id):
+                # Newest first, only those newer than before
+                posts = list(reversed(server.posts))
+                before = self.get_argument('before', None)
+                names = [post['name'] for post in posts]
+
+                if before in names:
+                    posts = posts[:names.index(before)]
+
+                posts = posts[:int(self.get_argument('limit'))]
+                self.write({'data': {'children': [
+                    {'data': post} for post in posts]}})
+
+        class LiveHandler(tornado.websocket.WebSocketHandler):
+            def open(self):
+                server.connect_count += 1
+
+                if server.connect_count > 1:
+                    return
+
+                post = _post(1, time.time())
+                server.posts.append(post)
+                self.write_message(json.dumps({
+                    'type': 'update', 'payload': {'data': post}}))
+                server.posts.append(_post(2, time.time() - 60))
+                server.posts.append(_post(3, time.time() - 30))
+                self.close()
+
+        app = tornado.web.Application([
+            (r'/live/(\w+)/about.json', AboutHandler),
+            (r'/live/(\w+).json', UpdatesHandler),
+            (r'/live', LiveHandler),
+        ])
+        sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+        tornado.httpserver.HTTPServer(app).add_sockets(sockets)
+        self.port = sockets[0].getsockname()[1]
+        self._ready.set()
+        asyncio.get_event_loop().run_forever()
+
+
+def test_backfilled_updates_reach_the_bins():
+    server = LiveThreadServer()
+    calculator = HypeCalculator(
+        ButtonInputParser(), TextAnalyzer(int(time.time()) - RUN_DURATION),
+        wall_clock=True)
+    thread = threading.Thread(target=calculator.process_forever)
+    thread.daemon = True
+    thread.start()
+
+    # Bins from before the disconnect are sealed
+    deadline = time.monotonic() + 5
+
+    while calculator._sealed_until.get(10, 0) < time.time() - 20 and \
+            time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    source = LiveThreadInputSource(
+        'thread', base_url='http://127.0.0.1:{}'.format(server.port))
+    source.start_source(calculator)
+    deadline = time.monotonic() + 15
+
+    while (server.connect_count < 2 or
+           calculator._input_queue.qsize()) and \
+            time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    time.sleep(0.5)
+
+    # The update seen before the reader started is not counted
+    assert calculator.hint_breakdown(3600, time.time() + 10) == \
+        {'caught': 3}
+    assert calculator.late_count == 0
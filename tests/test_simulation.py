@@ -0,0 +1,45 @@
+import time
+
+from tpphypemonitor.simulation import ChatLogReader, SimulationInputSource
+
+
+class RecordingCalculator(object):
+    def __init__(self):
+        self.lines = []
+
+    def add_chat_activity(self, nick, text, timestamp=None, position=None,
+                          tags=None):
+        self.lines.append((nick, text))
+
+    def add_live_thread_activity(self, doc, timestamp=None):
+        pass
+
+
+def _wait_for(func, timeout=5):
+    deadline = time.monotonic() + timeout
+
+    while not func() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def test_follow_delivers_appended_lines(tmp_path):
+    filename = str(tmp_path / 'chat.log')
+
+    with open(filename, 'w') as file:
+        file.write('2016-01-01T00:00:00 privmsg - :nick0 :hello\n')
+
+    # Built the same way as the follow command
+    reader = ChatLogReader([filename], follow=True, poll_interval=0.05)
+    input_source = SimulationInputSource([reader], time_scale=0)
+    calculator = RecordingCalculator()
+    input_source.start_source(calculator)
+
+    with open(filename, 'a') as file:
+        for index in range(1, 7):
+            file.write('2016-01-01T00:00:{:02d} privmsg - :nick{} :a\n'
+                       .format(index, index))
+
+    _wait_for(lambda: len(calculator.lines) == 7)
+
+    assert len(calculator.lines) == 7
+    assert calculator.lines[-1] == ('nick6', 'a')
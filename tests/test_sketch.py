@@ -0,0 +1,70 @@
+import bisect
+import random
+
+from tpphypemonitor.sketch import TDigest, WindowedDigest
+
+
+def _rank_error(sorted_values, estimate, quantile):
+    # Any rank among values equal to the estimate is exact
+    low_rank = bisect.bisect_left(sorted_values, estimate) / len(sorted_values)
+    high_rank = bisect.bisect_right(sorted_values, estimate) / len(sorted_values)
+    return max(0, low_rank - quantile, quantile - high_rank)
+
+
+def test_tdigest_quantile_accuracy():
+    rng = random.Random(3)
+
+    for values in (
+            [rng.gauss(5, 2) for index in range(20000)],
+            [rng.expovariate(0.5) for index in range(20000)],
+            [rng.choice((0, 0, 0, rng.random() * 10))
+             for index in range(20000)],
+    ):
+        digest = TDigest()
+
+        for value in values:
+            digest.add(value)
+
+        sorted_values = sorted(values)
+
+        assert len(digest) == len(values)
+        assert len(digest._means) < 200
+        assert digest.quantile(0) == sorted_values[0]
+        assert digest.quantile(1) == sorted_values[-1]
+
+        for quantile, max_error in ((0.5, 0.005), (0.9, 0.003), (0.99, 0.001)):
+            assert _rank_error(
+                sorted_values, digest.quantile(quantile), quantile) <= max_error
+
+
+def test_tdigest_merge_matches_single_digest():
+    rng = random.Random(4)
+    values = [rng.lognormvariate(0, 1) for index in range(10000)]
+    merged = TDigest()
+
+    for start in range(0, len(values), 1000):
+        digest = TDigest()
+
+        for value in values[start:start + 1000]:
+            digest.add(value)
+
+        merged.merge(digest)
+
+    sorted_values = sorted(values)
+
+    for quantile in (0.5, 0.9, 0.99):
+        assert _rank_error(
+            sorted_values, merged.quantile(quantile), quantile) <= 0.01
+
+
+def test_windowed_digest_drops_old_slots():
+    digest = WindowedDigest(3600, 12)
+
+    for timestamp in range(0, 3600, 10):
+        digest.add(timestamp, 100)
+
+    for timestamp in range(3600, 7200, 10):
+        digest.add(timestamp, 1)
+
+    assert digest.digest(7190).quantile(0.99) == 1
+    assert len(digest.digest(7190)) == 360
@@ -0,0 +1,58 @@
+import os
+
+from tpphypemonitor.bot.stats import StatsStreamSource
+from tpphypemonitor.stream import BinStreamReader, BinStreamWriter
+
+
+def test_seek_end_skips_history(tmp_path):
+    directory = str(tmp_path)
+    writer = BinStreamWriter(directory)
+    writer.add_hype_event(('begin', 'chat', 1, {}))
+    writer.add_stats(2, {'duration': 'old'})
+
+    reader = BinStreamReader(directory)
+    reader.seek_end()
+
+    assert reader.read() == []
+
+    writer.add_stats(3, {'duration': 'new'})
+
+    assert [record['stats'] for record in reader.read()] == \
+        [{'duration': 'new'}]
+
+
+def test_seek_end_stops_before_partial_line(tmp_path):
+    directory = str(tmp_path)
+    writer = BinStreamWriter(directory)
+    writer.add_stats(1, {})
+    writer.close()
+
+    segment_name = [
+        name for name in os.listdir(directory) if name.endswith('.ndjson')
+    ][0]
+
+    with open(os.path.join(directory, segment_name), 'ab') as file:
+        file.write(b'{"type":"stats"')
+
+    reader = BinStreamReader(directory)
+    reader.seek_end()
+
+    assert reader.position[1] == os.path.getsize(
+        os.path.join(directory, segment_name)) - len(b'{"type":"stats"')
+
+
+def test_stream_source_announces_only_new_events(tmp_path):
+    directory = str(tmp_path)
+    writer = BinStreamWriter(directory)
+    writer.add_hype_event(('begin', 'chat', 1, {}))
+
+    source = StatsStreamSource(directory)
+
+    assert source.poll() == (None, [])
+
+    writer.add_hype_event(('begin', 'hint', 3, {'PogChamp': 4}))
+    writer.add_stats(4, {'duration': '1m'})
+    doc, events = source.poll()
+
+    assert doc['stats'] == {'duration': '1m'}
+    assert events == [('begin', 'hint', 3, {'PogChamp': 4})]
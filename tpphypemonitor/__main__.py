@@ -1,4 +1,5 @@
 import argparse
+import datetime
 import json
 import logging
 import os
@@ -7,15 +8,10 @@ import threading
 import time
 import atexit
 
-import arrow
-
 from tpphypemonitor.button import ButtonInputParser
 from tpphypemonitor.calc import HypeCalculator
-from tpphypemonitor.chat import TwitchInputSource
+from tpphypemonitor.detector import DETECTOR_CLASSES, create_detectors
 from tpphypemonitor.heuristics import TextAnalyzer
-from tpphypemonitor.reddit import LiveThreadInputSource
-from tpphypemonitor.simulation import ChatLogReader, LiveThreadReader, \
-    SimulationInputSource
 from tpphypemonitor.text import format_summary, stats_doc
 
 _logger = logging.getLogger(__name__)
@@ -24,6 +20,8 @@ _logger = logging.getLogger(__name__)
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('--server', default='irc.twitch.tv')
+    arg_parser.add_argument('--port', type=int, default=6667)
+    arg_parser.add_argument('--reddit-url', default='https://www.reddit.com')
 
     subparsers = arg_parser.add_subparsers(dest='command')
     subparsers.required = True
@@ -32,16 +30,57 @@ def main():
     irc_parser.add_argument('--channel', default='#twitchplayspokemon')
     irc_parser.add_argument('--pickle')
     irc_parser.add_argument('--live-thread-id')
+    irc_parser.add_argument('--fast', action='store_true')
+
+    follow_parser = subparsers.add_parser('follow')
+    follow_parser.add_argument('chat_log', nargs='+')
+    follow_parser.add_argument('--pickle')
+    follow_parser.add_argument('--live-thread-id')
+    follow_parser.add_argument('--poll-interval', type=float, default=1.0)
 
     simulate_parser = subparsers.add_parser('simulate')
-    simulate_parser.add_argument('chat_log', nargs='+')
-    simulate_parser.add_argument('--live-thread-log')
+    simulate_parser.add_argument('chat_log', nargs='*')
+    simulate_parser.add_argument('--chat-log-stream', nargs='+',
+                                 action='append', default=[])
+    simulate_parser.add_argument('--live-thread-log', action='append',
+                                 default=[])
+    simulate_parser.add_argument('--recording', action='append', default=[])
+    simulate_parser.add_argument('--dedup', action='store_true')
     simulate_parser.add_argument('--start-date')
     simulate_parser.add_argument('--time-scale', type=float, default=1.0)
 
+    aggregate_parser = subparsers.add_parser('aggregate')
+    aggregate_parser.add_argument('--host', default='127.0.0.1')
+    aggregate_parser.add_argument('--listen-port', type=int, default=6700)
+
+    index_parser = subparsers.add_parser('index')
+    index_parser.add_argument('chat_log', nargs='+')
+
+    history_parser = subparsers.add_parser('history')
+    history_parser.add_argument('--since')
+    history_parser.add_argument('--until')
+    history_parser.add_argument('--type')
+    history_parser.add_argument('--run-day', type=int)
+    history_parser.add_argument('--limit', type=int)
+    history_parser.add_argument('--json', action='store_true')
+
     arg_parser.add_argument('--run-date')
     arg_parser.add_argument('--print-summary-interval', default=60, type=int)
     arg_parser.add_argument('--stats-output-filename')
+    arg_parser.add_argument('--stats-output-interval', type=float, default=60)
+    arg_parser.add_argument('--export-dir')
+    arg_parser.add_argument('--stream-dir')
+    arg_parser.add_argument('--history-db')
+    arg_parser.add_argument('--record-dir')
+    arg_parser.add_argument('--aggregator')
+    arg_parser.add_argument('--node-id')
+    arg_parser.add_argument('--node-group', default='default')
+    arg_parser.add_argument('--hint-patterns')
+    arg_parser.add_argument('--baseline-file')
+    arg_parser.add_argument('--classify-workers', type=int, default=0)
+    arg_parser.add_argument('--allowed-lateness', type=float, default=2)
+    arg_parser.add_argument('--detector', action='append', default=[],
+                            choices=sorted(DETECTOR_CLASSES))
     arg_parser.add_argument('--debug', action='store_const',
                             dest='log_level',
                             default=logging.INFO, const=logging.DEBUG)
@@ -49,39 +88,105 @@ def main():
     args = arg_parser.parse_args()
     logging.basicConfig(level=args.log_level)
 
-    pickle_path = args.pickle if args.command == 'irc' else None
+    if args.command == 'index':
+        from tpphypemonitor.logindex import load_index
+
+        for filename in args.chat_log:
+            load_index(filename)
+
+        return
+
+    if args.command == 'history':
+        _print_history(args)
+        return
+
+    pickle_path = args.pickle if args.command in ('irc', 'follow') else None
+
+    if args.baseline_file:
+        from tpphypemonitor.baseline import BaselineStore
+
+        baseline = BaselineStore(args.baseline_file)
+    else:
+        baseline = None
 
     scheduler = sched.scheduler()
     button_input_parser = ButtonInputParser()
-    text_analyzer = TextAnalyzer(arrow.get(args.run_date or time.time()).timestamp)
+    text_analyzer = TextAnalyzer(_parse_date(args.run_date) or int(time.time()),
+                                 patterns_filename=args.hint_patterns)
     calculator = HypeCalculator(button_input_parser, text_analyzer,
-                                pickle_path=pickle_path)
-
-    if args.command == 'irc':
-        input_source = TwitchInputSource(args.server, args.channel)
+                                pickle_path=pickle_path,
+                                detectors=create_detectors(
+                                    args.detector, baseline=baseline),
+                                allowed_lateness=args.allowed_lateness,
+                                wall_clock=args.command == 'irc',
+                                baseline=baseline,
+                                classify_workers=args.classify_workers)
+
+    # Source modules are imported per command since the network stacks are
+    # slow to import and not needed for simulations.
+    if args.command in ('irc', 'follow'):
+        if args.command == 'irc' and args.fast:
+            from tpphypemonitor.fastchat import FastTwitchInputSource
+
+            input_source = FastTwitchInputSource(
+                args.server, args.channel, port=args.port)
+        elif args.command == 'irc':
+            from tpphypemonitor.chat import TwitchInputSource
+
+            input_source = TwitchInputSource(
+                args.server, args.channel, port=args.port)
+        else:
+            from tpphypemonitor.simulation import ChatLogReader, \
+                SimulationInputSource
+
+            # The resume position is needed before the reader starts
+            calculator.load_pickle()
+            chat_log_reader = ChatLogReader(
+                args.chat_log, follow=True,
+                position=calculator.input_position,
+                poll_interval=args.poll_interval)
+            input_source = SimulationInputSource(
+                [chat_log_reader], time_scale=0)
 
         if args.live_thread_id:
-            reddit_input_source = LiveThreadInputSource(args.live_thread_id)
+            from tpphypemonitor.reddit import LiveThreadInputSource
+
+            reddit_input_source = LiveThreadInputSource(
+                args.live_thread_id, base_url=args.reddit_url)
         else:
             reddit_input_source = None
-    else:
-        timestamp_start = None
-        reddit_input_source = None
-
-        if args.start_date:
-            timestamp_start = arrow.get(args.start_date).timestamp
+    elif args.command == 'aggregate':
+        from tpphypemonitor.cluster import BinDeltaServer
 
-        chat_log_reader = ChatLogReader(
-            args.chat_log, timestamp_start=timestamp_start)
+        input_source = BinDeltaServer(args.host, args.listen_port)
+        reddit_input_source = None
+    else:
+        from tpphypemonitor.recording import RecordingReader
+        from tpphypemonitor.simulation import ChatLogReader, \
+            LiveThreadReader, SimulationInputSource
 
-        if args.live_thread_log:
-            live_thread_reader = LiveThreadReader(
-                args.live_thread_log, timestamp_start=timestamp_start)
-        else:
-            live_thread_reader = None
+        reddit_input_source = None
+        timestamp_start = _parse_date(args.start_date)
+
+        chat_log_readers = [
+            ChatLogReader(filenames, timestamp_start=timestamp_start)
+            for filenames in [args.chat_log] + args.chat_log_stream
+            if filenames
+        ]
+        live_thread_readers = [
+            LiveThreadReader(filename, timestamp_start=timestamp_start)
+            for filename in args.live_thread_log
+        ]
+
+        recording_readers = [
+            RecordingReader(directory, timestamp_start=timestamp_start)
+            for directory in args.recording
+        ]
 
         input_source = SimulationInputSource(
-            chat_log_reader, live_thread_reader, time_scale=args.time_scale)
+            chat_log_readers, live_thread_readers,
+            time_scale=args.time_scale, dedup=args.dedup,
+            recording_readers=recording_readers)
 
     if pickle_path:
         def save_pickle():
@@ -90,11 +195,91 @@ def main():
 
         save_pickle()
 
+    if baseline:
+        def save_baseline():
+            baseline.save()
+            scheduler.enter(300, 0, save_baseline)
+
+        scheduler.enter(300, 0, save_baseline)
+
+    if args.export_dir:
+        from tpphypemonitor.export import BinExporter
+
+        exporter = BinExporter(args.export_dir)
+        calculator.add_sealed_bin_listener(exporter.add_data_point)
+
+        def export_bins():
+            exporter.export(calculator)
+            scheduler.enter(60, 0, export_bins)
+
+        scheduler.enter(60, 0, export_bins)
+    else:
+        exporter = None
+
+    if args.stream_dir:
+        from tpphypemonitor.stream import BinStreamWriter
+
+        stream_writer = BinStreamWriter(args.stream_dir)
+        calculator.add_sealed_bin_listener(stream_writer.add_data_point)
+        calculator.add_hype_event_listener(stream_writer.add_hype_event)
+
+        def write_stream_stats():
+            if calculator.last_timestamp:
+                stream_writer.add_stats(
+                    calculator.last_timestamp, stats_doc(calculator))
+
+            scheduler.enter(60, 0, write_stream_stats)
+
+        scheduler.enter(60, 0, write_stream_stats)
+    else:
+        stream_writer = None
+
+    if args.history_db:
+        from tpphypemonitor.history import HypeHistory
+
+        history = HypeHistory(
+            args.history_db, text_analyzer.run_start_timestamp, calculator)
+        calculator.set_history(history)
+    else:
+        history = None
+
+    if args.aggregator:
+        from tpphypemonitor.cluster import BinDeltaSender, parse_address
+
+        bin_delta_sender = BinDeltaSender(
+            parse_address(args.aggregator), calculator,
+            node_id=args.node_id, group=args.node_group)
+        calculator.add_sealed_bin_listener(bin_delta_sender.add_data_point)
+
+    if args.record_dir:
+        from tpphypemonitor.recording import RecordingWriter
+
+        recording_writer = RecordingWriter(args.record_dir)
+        calculator.add_ingest_listener(recording_writer.add_items)
+    else:
+        recording_writer = None
+
     @atexit.register
     def cleanup():
         if pickle_path:
             calculator.save_pickle()
 
+        if baseline:
+            baseline.save()
+
+        if exporter:
+            exporter.export(calculator)
+            exporter.close()
+
+        if stream_writer:
+            stream_writer.close()
+
+        if history:
+            history.close()
+
+        if recording_writer:
+            recording_writer.close()
+
     def print_stats():
         _logger.info('Summary - ' + format_summary(calculator))
         delay = args.print_summary_interval
@@ -118,11 +303,18 @@ def main():
             json.dump(doc, file)
 
         os.rename(new_filename, args.stats_output_filename)
-        scheduler.enter(60, 0, write_output)
+        scheduler.enter(args.stats_output_interval, 0, write_output)
 
     if args.stats_output_filename:
         write_output()
 
+    if args.hint_patterns:
+        def reload_patterns():
+            text_analyzer.reload_patterns()
+            scheduler.enter(10, 0, reload_patterns)
+
+        scheduler.enter(10, 0, reload_patterns)
+
     if args.print_summary_interval:
         print_stats()
 
@@ -151,5 +343,58 @@ def main():
 
     _logger.info('Done')
 
+
+def _print_history(args):
+    from tpphypemonitor.history import query_hype_events
+    from tpphypemonitor.text import format_duration
+
+    if not args.history_db:
+        raise SystemExit('--history-db is required')
+
+    if args.run_day is not None and not args.run_date:
+        raise SystemExit('--run-date is required for --run-day')
+
+    rows = query_hype_events(
+        args.history_db, since=_parse_date(args.since),
+        until=_parse_date(args.until), event_type=args.type,
+        run_start_timestamp=_parse_date(args.run_date), run_day=args.run_day,
+        limit=args.limit)
+
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+            continue
+
+        duration = row['end_time'] - row['begin_time'] \
+            if row['end_time'] else None
+
+        print('{begin} {elapsed} {event_type} {duration}s '
+              'peak {peak_rate} mean {average_rate} {top_hints}'.format(
+                  begin=datetime.datetime.utcfromtimestamp(
+                      row['begin_time']).isoformat(),
+                  elapsed=format_duration(
+                      row['begin_time'] - row['run_start_timestamp'])
+                  if row['run_start_timestamp'] else '-',
+                  event_type=row['event_type'],
+                  duration=int(duration) if duration else '-',
+                  peak_rate='{:.2f}'.format(row['peak_rate'])
+                  if row['peak_rate'] is not None else '-',
+                  average_rate='{:.2f}'.format(row['average_rate'])
+                  if row['average_rate'] is not None else '-',
+                  top_hints=' '.join(
+                      '{}:{}'.format(label, count)
+                      for label, count in row['top_hints']),
+              ))
+
+
+def _parse_date(date_str):
+    if not date_str:
+        return
+
+    import arrow
+
+    return arrow.get(date_str).timestamp
+
+
 if __name__ == '__main__':
     main()
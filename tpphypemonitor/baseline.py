@@ -0,0 +1,138 @@
+import array
+import bisect
+import math
+import os
+import struct
+
+HOURS_PER_WEEK = 168
+SERIES_NAMES = ('rate', 'hint')
+# Log spaced histogram buckets from 0.01/sec to about 1000/sec
+BUCKET_EDGES = tuple(0.01 * 10 ** (index / 12) for index in range(61))
+NUM_BUCKETS = len(BUCKET_EDGES) + 1
+QUANTILES = (0.1, 0.5, 0.9)
+MIN_SAMPLES = 30
+FILE_MAGIC = b'TPPBASE1'
+BASELINE_BIN_SIZE = 60
+# Typical values are at least this when comparing, since many hours have no
+# hints at all and a few would otherwise count as far above typical
+TYPICAL_MIN_VALUE = 0.1
+
+
+def hour_of_week(timestamp):
+    # The epoch is a Thursday; hour 0 is Monday 00:00 UTC
+    return (int(timestamp) // 3600 + 72) % HOURS_PER_WEEK
+
+
+class BaselineStore(object):
+    def __init__(self, filename=None):
+        self._filename = filename
+        self._counts = array.array(
+            'L', bytes(array.array('L').itemsize * HOURS_PER_WEEK *
+                       len(SERIES_NAMES) * NUM_BUCKETS))
+        self._quantiles = {}
+
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def _offset(self, hour, series):
+        return (hour * len(SERIES_NAMES) + SERIES_NAMES.index(series)) * \
+            NUM_BUCKETS
+
+    def load(self):
+        with open(self._filename, 'rb') as file:
+            header = file.read(len(FILE_MAGIC) + 4)
+
+            if header[:len(FILE_MAGIC)] != FILE_MAGIC or \
+                    struct.unpack('<I', header[len(FILE_MAGIC):])[0] != NUM_BUCKETS:
+                raise ValueError('Unknown baseline file format')
+
+            counts = array.array('L')
+            counts.frombytes(file.read())
+
+        if len(counts) != len(self._counts):
+            raise ValueError('Unexpected baseline file size')
+
+        self._counts = counts
+        self._quantiles = {}
+
+    def save(self):
+        new_filename = self._filename + '-new'
+
+        with open(new_filename, 'wb') as file:
+            file.write(FILE_MAGIC)
+            file.write(struct.pack('<I', NUM_BUCKETS))
+            file.write(self._counts.tobytes())
+
+        os.rename(new_filename, self._filename)
+
+    def add(self, timestamp, series, value):
+        hour = hour_of_week(timestamp)
+        bucket = bisect.bisect_right(BUCKET_EDGES, value) if value > 0 else 0
+        self._counts[self._offset(hour, series) + bucket] += 1
+        self._quantiles.pop((hour, series), None)
+
+    def add_data_point(self, bin_size, data_point):
+        if bin_size != BASELINE_BIN_SIZE:
+            return
+
+        self.add(data_point.timestamp, 'rate',
+                 data_point.line_count / bin_size)
+        self.add(data_point.timestamp, 'hint',
+                 data_point.hint_score / bin_size)
+
+    def quantiles(self, timestamp, series):
+        # Quantiles are computed once per hour and series until new data
+        # arrives, so lookups are constant time.
+        hour = hour_of_week(timestamp)
+        key = (hour, series)
+
+        if key not in self._quantiles:
+            self._quantiles[key] = self._compute_quantiles(hour, series)
+
+        return self._quantiles[key]
+
+    def _compute_quantiles(self, hour, series):
+        offset = self._offset(hour, series)
+        counts = self._counts[offset:offset + NUM_BUCKETS]
+        total = sum(counts)
+
+        if total < MIN_SAMPLES:
+            return
+
+        results = []
+        cumulative = 0
+        bucket = 0
+
+        for quantile in QUANTILES:
+            target = quantile * total
+
+            while cumulative + counts[bucket] < target:
+                cumulative += counts[bucket]
+                bucket += 1
+
+            results.append(self._bucket_value(bucket))
+
+        return tuple(results)
+
+    def _bucket_value(self, bucket):
+        if bucket == 0:
+            return 0
+        elif bucket >= len(BUCKET_EDGES):
+            return BUCKET_EDGES[-1]
+        else:
+            # Geometric middle of the bucket
+            return math.sqrt(BUCKET_EDGES[bucket - 1] * BUCKET_EDGES[bucket])
+
+    def typical(self, timestamp, series):
+        quantiles = self.quantiles(timestamp, series)
+
+        if quantiles:
+            return quantiles[QUANTILES.index(0.5)]
+
+    def typical_ratio(self, timestamp, series, value):
+        typical = self.typical(timestamp, series)
+
+        if typical is None:
+            return
+
+        return value / max(typical, TYPICAL_MIN_VALUE)
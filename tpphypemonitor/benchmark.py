@@ -0,0 +1,235 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from tpphypemonitor.button import ButtonInputParser
+from tpphypemonitor.calc import HypeCalculator, BIN_SIZES, LIVE_INTERVAL
+from tpphypemonitor.classify import classify_batch
+from tpphypemonitor.fastchat import TwitchChatReader
+from tpphypemonitor.heuristics import TextAnalyzer
+from tpphypemonitor.loadtest import FakeTwitchServer
+
+CHAT_CHANNEL = '#twitchplayspokemon'
+
+
+def _time_import(module, repeat):
+    durations = []
+
+    for dummy in range(repeat):
+        time_start = time.monotonic()
+        subprocess.check_call([sys.executable, '-c', 'import ' + module])
+        durations.append(time.monotonic() - time_start)
+
+    return min(durations)
+
+
+def _fill_calculator(calculator, max_time=14400):
+    timestamp_end = int(time.time()) // LIVE_INTERVAL * LIVE_INTERVAL
+
+    for bin_size in BIN_SIZES:
+        data_set = calculator._activity.data_sets[bin_size]
+
+        for timestamp in range(timestamp_end - max_time, timestamp_end,
+                               bin_size):
+            data_set.add_chat_data_point(
+                is_button=random.random() < 0.5, timestamp=timestamp)
+            data_set.add_hint_data_point(
+                score=random.random(), timestamp=timestamp)
+
+
+def benchmark_startup(args):
+    print('Import interpreter only: {:.3f}s'.format(
+        _time_import('sys', args.repeat)))
+    print('Import tpphypemonitor.__main__: {:.3f}s'.format(
+        _time_import('tpphypemonitor.__main__', args.repeat)))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pickle_path = os.path.join(temp_dir, 'state.pickle')
+        calculator = HypeCalculator(
+            ButtonInputParser(), TextAnalyzer(time.time()), pickle_path)
+        calculator.load_pickle()
+        _fill_calculator(calculator)
+
+        time_start = time.monotonic()
+        calculator.save_pickle()
+        print('Save state: {:.3f}s ({} bytes)'.format(
+            time.monotonic() - time_start, os.path.getsize(pickle_path)))
+
+        durations = []
+
+        for dummy in range(args.repeat):
+            time_start = time.monotonic()
+            calculator = HypeCalculator(
+                ButtonInputParser(), TextAnalyzer(time.time()), pickle_path)
+            calculator.load_pickle()
+            durations.append(time.monotonic() - time_start)
+
+        print('Restore state: {:.3f}s'.format(min(durations)))
+
+
+def _make_chat_lines(count):
+    texts = ('a', 'up', 'start9', 'PogChamp', 'we did it', 'democracy',
+             'left2right2', 'FailFish why')
+
+    return [
+        '@badges=;color=#FF0000;display-name=Nick{0};emotes={1};'
+        'subscriber=0;turbo=0;user-type= :nick{0}!nick{0}@nick{0}.tmi.twitch.tv '
+        'PRIVMSG {2} :{3}'.format(
+            index, '88:0-7' if index % 8 == 3 else '', CHAT_CHANNEL,
+            texts[index % 8])
+        for index in range(count)
+    ]
+
+
+# Sends the same prepared lines to each client after it joins, as fast as
+# the client reads them
+class ReplayServer(FakeTwitchServer):
+    def __init__(self, data):
+        super().__init__(iter(()), channel=CHAT_CHANNEL)
+        self._data = data
+
+    def _send_messages(self, connection):
+        connection.sendall(self._data)
+        self._drain(connection)
+
+
+def _time_fastchat(port, count):
+    received = [0]
+    done_event = threading.Event()
+
+    def on_message(nick, text, tags):
+        received[0] += 1
+
+        if received[0] == count:
+            done_event.set()
+
+    reader = TwitchChatReader('127.0.0.1', CHAT_CHANNEL, on_message, port=port)
+    thread = threading.Thread(target=reader.run)
+    thread.daemon = True
+
+    time_start = time.monotonic()
+    thread.start()
+    done_event.wait()
+    duration = time.monotonic() - time_start
+
+    reader.stop()
+
+    return duration
+
+
+def _time_irc(port, count):
+    import irc.client
+    import irc.strings
+
+    channel = irc.strings.lower(CHAT_CHANNEL)
+    received = [0]
+
+    def on_welcome(connection, event):
+        connection.join(channel)
+
+    def on_pubmsg(connection, event):
+        # The same work as TwitchClient.on_pubmsg
+        if irc.strings.lower(event.target) != channel:
+            return
+
+        irc.strings.lower(event.source.nick)
+        dict((tag['key'], tag['value']) for tag in event.tags or ())
+        received[0] += 1
+
+    # TwitchClient schedules its keep alive with the reactor API of the irc
+    # version it was written for, so a plain reactor is timed instead
+    reactor = irc.client.Reactor()
+    reactor.add_global_handler('welcome', on_welcome)
+    reactor.add_global_handler('pubmsg', on_pubmsg)
+
+    time_start = time.monotonic()
+    connection = reactor.server().connect('127.0.0.1', port, 'justinfan1')
+
+    while received[0] < count:
+        reactor.process_once(0.2)
+
+    duration = time.monotonic() - time_start
+
+    connection.disconnect()
+
+    return duration
+
+
+def benchmark_chat(args):
+    # Both clients connect to a local server so the socket reads, line
+    # splitting and dispatch are timed as they run live
+    data = ''.join(
+        line + '\r\n' for line in _make_chat_lines(args.count)
+    ).encode('utf8')
+    server = ReplayServer(data)
+    server.start()
+
+    duration = _time_fastchat(server.port, args.count)
+    print('fastchat: {:.0f} lines/sec'.format(args.count / duration))
+
+    try:
+        import irc.client
+    except ImportError:
+        print('irc: not installed')
+        return
+
+    duration = _time_irc(server.port, args.count)
+    print('irc: {:.0f} lines/sec'.format(args.count / duration))
+
+
+def benchmark_classify(args):
+    texts = ('a', 'up', 'start9', 'PogChamp', 'we did it', 'democracy',
+             'left2right2', 'FailFish why', 'hello chat', 'b')
+    lines = [
+        (texts[index % len(texts)] if index % 3 else
+         'message number {}'.format(index), None)
+        for index in range(args.count)
+    ]
+    button_input_parser = ButtonInputParser()
+    text_analyzer = TextAnalyzer(time.time())
+
+    time_start = time.monotonic()
+    for text, tags in lines:
+        button_input_parser.parse_button(text)
+        text_analyzer.analyze_chat(text)
+    duration = time.monotonic() - time_start
+    print('Per line: {:.0f} lines/sec'.format(args.count / duration))
+
+    time_start = time.monotonic()
+    for index in range(0, args.count, args.batch_size):
+        classify_batch(button_input_parser, text_analyzer,
+                       lines[index:index + args.batch_size])
+    duration = time.monotonic() - time_start
+    print('Batch of {}: {:.0f} lines/sec'.format(
+        args.batch_size, args.count / duration))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    subparsers = arg_parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    startup_parser = subparsers.add_parser('startup')
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.set_defaults(func=benchmark_startup)
+
+    chat_parser = subparsers.add_parser('chat')
+    chat_parser.add_argument('--count', type=int, default=100000)
+    chat_parser.set_defaults(func=benchmark_chat)
+
+    classify_parser = subparsers.add_parser('classify')
+    classify_parser.add_argument('--count', type=int, default=100000)
+    classify_parser.add_argument('--batch-size', type=int, default=1000)
+    classify_parser.set_defaults(func=benchmark_classify)
+
+    args = arg_parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
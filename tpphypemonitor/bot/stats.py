@@ -1,31 +1,196 @@
 import argparse
+import collections
 import json
+import os
 import random
 import time
 
 import math
 
-from tpphypemonitor.irc import IRCClient
+from tpphypemonitor.irc import IRCClient, IRC_RATE_LIMIT
+from tpphypemonitor.text import format_hint_breakdown
 
 SHORT_INTERVAL = 60 * 5
 LONG_INTERVAL = 60 * 10
+POLL_INTERVAL = 5
+PUMP_INTERVAL = 0.5
+SEND_BURST = 3
+STATS_MAX_AGE = 120
+ANNOUNCEMENT_MAX_AGE = 60
+
+
+# Token bucket send queue. Hype announcements are sent first, in order.
+# Stats are kept per channel and a newer snapshot replaces one not sent yet,
+# so at most one snapshot per channel waits behind the rate limit and
+# nothing goes out stale.
+class SendScheduler(object):
+    def __init__(self, send_func, rate=IRC_RATE_LIMIT, burst=SEND_BURST):
+        self._send_func = send_func
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last_time = time.monotonic()
+        self._announcements = collections.deque()
+        # Channel to (timestamp, lines) in the order channels were queued
+        self._stats = collections.OrderedDict()
+
+    @property
+    def pending_count(self):
+        return len(self._announcements) + len(self._stats)
+
+    def add_announcement(self, channel, text):
+        self._announcements.append((time.time(), channel, text))
+
+    def add_stats(self, channel, lines, timestamp=None):
+        # Replacing keeps the channel's place in the queue
+        self._stats[channel] = (timestamp or time.time(), lines)
+
+    def pump(self):
+        current_time = time.monotonic()
+        self._tokens = min(
+            self._burst,
+            self._tokens + (current_time - self._last_time) * self._rate)
+        self._last_time = current_time
+
+        while self._announcements and self._tokens >= 1:
+            timestamp, channel, text = self._announcements.popleft()
+
+            if time.time() - timestamp > ANNOUNCEMENT_MAX_AGE:
+                continue
+
+            self._send_func(channel, text)
+            self._tokens -= 1
+
+        while self._stats and not self._announcements:
+            channel, (timestamp, lines) = next(iter(self._stats.items()))
+
+            if time.time() - timestamp > STATS_MAX_AGE:
+                del self._stats[channel]
+                continue
+
+            # A snapshot's lines are sent together
+            if self._tokens < len(lines):
+                break
+
+            del self._stats[channel]
+
+            for line in lines:
+                self._send_func(channel, line)
+
+            self._tokens -= len(lines)
+
+
+# Stats file written by --stats-output-filename. It is only parsed again
+# when its modification time changes.
+class StatsFileSource(object):
+    def __init__(self, filename):
+        self._filename = filename
+        self._mtime = None
+        self._doc = None
+        self._last_event_time = None
+
+    def poll(self):
+        # Returns the newest stats doc and hype events not seen before
+        try:
+            mtime = os.stat(self._filename).st_mtime
+        except OSError:
+            return self._doc, []
+
+        if mtime == self._mtime:
+            return self._doc, []
+
+        with open(self._filename) as file:
+            self._doc = json.load(file)
+
+        self._mtime = mtime
+        events = [
+            event for event in self._doc.get('recent_hype_events', ())
+            if self._last_event_time is not None and
+            event[2] > self._last_event_time
+        ]
+
+        # Events from before the bot started are not announced
+        for event in self._doc.get('recent_hype_events', ()):
+            self._last_event_time = max(self._last_event_time or 0, event[2])
+
+        return self._doc, events
+
+
+# Records appended by --stream-dir. Only records written since the last poll
+# are read.
+class StatsStreamSource(object):
+    def __init__(self, directory):
+        from tpphypemonitor.stream import BinStreamReader
+
+        self._reader = BinStreamReader(directory)
+        self._doc = None
+
+        # Earlier events are not announced
+        self._reader.seek_end()
+
+    def poll(self):
+        events = []
+
+        for record in self._reader.read():
+            if record['type'] == 'stats':
+                self._doc = {
+                    'utc_timestamp': record['utc_timestamp'],
+                    'stats': record['stats'],
+                }
+            elif record['type'] == 'hype':
+                events.append((
+                    record['kind'], record['event_type'], record['timestamp'],
+                    record['hint_breakdown']
+                ))
+
+        return self._doc, events
 
 
 class StatsBot(IRCClient):
-    def __init__(self, channel, stats_filename):
-        super().__init__()
-        self._channel = channel
-        self._stats_filename = stats_filename
+    def __init__(self, channels, stats_source):
+        # The send scheduler paces messages instead of the connection, which
+        # would sleep in the reactor for each line of a burst
+        super().__init__(rate_limit=None)
+        self._channels = channels
+        self._stats_source = stats_source
+        self._doc = None
+        self._scheduler = SendScheduler(self._privmsg)
 
         next_time = math.ceil(time.time() / SHORT_INTERVAL) * SHORT_INTERVAL
         self.reactor.execute_at(next_time, self._sched_send_stats)
+        self.reactor.execute_every(POLL_INTERVAL, self._poll_stats)
+        self.reactor.execute_every(PUMP_INTERVAL, self._pump)
 
     def on_welcome(self, connection, event):
-        self.connection.join(self._channel)
+        for channel in self._channels:
+            self.connection.join(channel)
 
     def on_nicknameinuse(self, connection, event):
         connection.nick(connection.get_nickname() + str(random.randint(0, 9)))
 
+    def _privmsg(self, channel, text):
+        self.connection.privmsg(channel, text)
+
+    def _pump(self):
+        if self.connection.is_connected():
+            self._scheduler.pump()
+
+    def _poll_stats(self):
+        doc, events = self._stats_source.poll()
+        self._doc = doc
+
+        for kind, event_type, event_time, hint_breakdown in events:
+            if kind != 'begin':
+                continue
+
+            text = 'Hype started ({event_type})'.format(event_type=event_type)
+
+            if hint_breakdown:
+                text += ' · ' + format_hint_breakdown(hint_breakdown, 3)
+
+            for channel in self._channels:
+                self._scheduler.add_announcement(channel, text)
+
     def _sched_send_stats(self):
         self._send_stats()
         next_time = int(math.ceil(time.time() / SHORT_INTERVAL) * SHORT_INTERVAL)
@@ -34,11 +199,9 @@ class StatsBot(IRCClient):
     def _send_stats(self):
         time_now = time.time()
         time_rounded = int(time_now // SHORT_INTERVAL * SHORT_INTERVAL)
+        doc = self._doc
 
-        with open(self._stats_filename) as file:
-            doc = json.load(file)
-
-        if abs(doc['utc_timestamp'] - time_now) > 120:
+        if not doc or abs(doc['utc_timestamp'] - time_now) > STATS_MAX_AGE:
             return
 
         if doc['stats']['averages']:
@@ -50,20 +213,20 @@ class StatsBot(IRCClient):
         else:
             return
 
-        text = '[{duration}] Lines/sec {averages_str} · Hints/sec {hint_averages_str}'.format(
-            duration=doc['stats']['duration'],
-            averages_str=doc['stats']['averages_str'],
-            hint_averages_str=doc['stats']['hint_averages_str'],
-        )
-
-        self.connection.privmsg(self._channel, text)
-
-        text = 'Chat {chat_graph} · Hint {hint_graph}'.format(
-            chat_graph=doc['stats']['chat_graph'],
-            hint_graph=doc['stats']['hint_graph'],
-        )
-
-        self.connection.privmsg(self._channel, text)
+        lines = [
+            '[{duration}] Lines/sec {averages_str} · Hints/sec {hint_averages_str}'.format(
+                duration=doc['stats']['duration'],
+                averages_str=doc['stats']['averages_str'],
+                hint_averages_str=doc['stats']['hint_averages_str'],
+            ),
+            'Chat {chat_graph} · Hint {hint_graph}'.format(
+                chat_graph=doc['stats']['chat_graph'],
+                hint_graph=doc['stats']['hint_graph'],
+            ),
+        ]
+
+        for channel in self._channels:
+            self._scheduler.add_stats(channel, lines, doc['utc_timestamp'])
 
 if __name__ == '__main__':
     arg_parser = argparse.ArgumentParser()
@@ -74,7 +237,12 @@ if __name__ == '__main__':
     with open(args.config_filename) as file:
         doc = json.load(file)
 
-    client = StatsBot(doc['channel'], doc['stats_filename'])
+    if doc.get('stream_dir'):
+        stats_source = StatsStreamSource(doc['stream_dir'])
+    else:
+        stats_source = StatsFileSource(doc['stats_filename'])
+
+    client = StatsBot(doc.get('channels') or [doc['channel']], stats_source)
 
     if doc.get('password'):
         password = doc['password']
@@ -1,6 +1,9 @@
+import array
 import re
 
 BUTTON_REGEX = r'((a|b|select|start|up|down|left|right)(\d|\+))+'
+# Button input has to begin with a button
+BUTTON_FIRST_CHARS = frozenset('absudlr')
 
 
 class ButtonInputParser(object):
@@ -32,3 +35,21 @@ class ButtonInputParser(object):
             return
 
         return buttons
+
+    def classify_batch(self, texts):
+        # Returns 1 for each text that is button input, otherwise 0
+        results = array.array('b', bytes(len(texts)))
+        cache = {}
+
+        for index, text in enumerate(texts):
+            if not text or text[0] not in BUTTON_FIRST_CHARS:
+                continue
+
+            result = cache.get(text)
+
+            if result is None:
+                result = cache[text] = 1 if self.parse_button(text) else 0
+
+            results[index] = result
+
+        return results
@@ -1,3 +1,4 @@
+import array
 import datetime
 import queue
 import threading
@@ -10,6 +11,11 @@ import pickle
 
 import math
 
+from tpphypemonitor.classify import MAX_BATCH_SIZE, ClassifierPool, \
+    classify_batch
+from tpphypemonitor.detector import PercentChangeDetector
+from tpphypemonitor.heuristics import hint_label
+from tpphypemonitor.sketch import SketchSet, WindowedDigest
 from tpphypemonitor.text import text_graph, format_duration
 
 _logger = logging.getLogger(__name__)
@@ -20,6 +26,8 @@ class DataPoint(object):
         'line_count',
         'button_count',
         'hint_score',
+        'emote_count',
+        'hint_counts',
         'timestamp',
     )
 
@@ -28,6 +36,67 @@ class DataPoint(object):
         self.line_count = 0
         self.button_count = 0
         self.hint_score = 0
+        self.emote_count = 0
+        # Counts per hint key index, only allocated once there are hints
+        self.hint_counts = None
+
+    def __setstate__(self, state):
+        # Pickles from before emote and hint counts lack those slots
+        self.emote_count = 0
+        self.hint_counts = None
+        dict_state, slot_state = state
+
+        for name, value in (slot_state or {}).items():
+            setattr(self, name, value)
+
+    def add_hint_count(self, index, count=1):
+        if self.hint_counts is None:
+            self.hint_counts = array.array('l')
+
+        if len(self.hint_counts) <= index:
+            self.hint_counts.extend([0] * (index + 1 - len(self.hint_counts)))
+
+        self.hint_counts[index] += count
+
+
+DATA_POINT_FIELDS = (
+    ('line_count', 'q'),
+    ('button_count', 'q'),
+    ('hint_score', 'd'),
+    ('emote_count', 'q'),
+)
+
+
+def _restore_data_set(bin_size, max_len, timestamps, columns,
+                      hint_counts=()):
+    data_set = DataSet((), bin_size, max_len)
+    timestamp_array = array.array('d')
+    timestamp_array.frombytes(timestamps)
+    column_arrays = []
+
+    for field, typecode in DATA_POINT_FIELDS:
+        if field not in columns:
+            continue
+
+        column = columns[field]
+        column_array = array.array(typecode)
+        column_array.frombytes(column)
+        column_arrays.append((field, column_array))
+
+    for index, timestamp in enumerate(timestamp_array):
+        timestamp = int(timestamp)
+        data_point = DataPoint(timestamp)
+
+        for field, column_array in column_arrays:
+            setattr(data_point, field, column_array[index])
+
+        data_set[timestamp] = data_point
+
+    for timestamp, counts in hint_counts:
+        data_set[timestamp].hint_counts = array.array('l')
+        data_set[timestamp].hint_counts.frombytes(counts)
+
+    return data_set
 
 
 class DataSet(dict):
@@ -40,6 +109,32 @@ class DataSet(dict):
     def bin_size(self):
         return self._bin_size
 
+    @property
+    def max_len(self):
+        return self._max_len
+
+    def __reduce__(self):
+        # Pickled as flat columns instead of one object per bin so that
+        # restoring a checkpoint is a handful of bulk array copies.
+        timestamps = array.array('d', sorted(self))
+        columns = {}
+
+        for field, typecode in DATA_POINT_FIELDS:
+            columns[field] = array.array(
+                typecode, (getattr(self[timestamp], field)
+                      for timestamp in sorted(self))
+            ).tobytes()
+
+        hint_counts = [
+            (timestamp, data_point.hint_counts.tobytes())
+            for timestamp, data_point in self.items()
+            if data_point.hint_counts
+        ]
+
+        return (_restore_data_set,
+                (self._bin_size, self._max_len, timestamps.tobytes(), columns,
+                 hint_counts))
+
     def _bump_data_point(self, timestamp=None):
         if not timestamp:
             timestamp = time.time()
@@ -56,21 +151,37 @@ class DataSet(dict):
 
         return timestamp
 
-    def add_chat_data_point(self, is_button=False, timestamp=None):
+    def add_chat_data_point(self, is_button=False, timestamp=None,
+                            emote_count=0):
         timestamp = self._bump_data_point(timestamp=timestamp)
 
         data_point = self[timestamp]
         data_point.line_count += 1
+        data_point.emote_count += emote_count
 
         if is_button:
             data_point.button_count += 1
 
-    def add_hint_data_point(self, score=1.0, timestamp=None):
+    def add_hint_data_point(self, score=1.0, timestamp=None, hint_index=None):
         timestamp = self._bump_data_point(timestamp=timestamp)
 
         data_point = self[timestamp]
         data_point.hint_score += score
 
+        if hint_index is not None:
+            data_point.add_hint_count(hint_index)
+
+    def add_counts(self, timestamp, counts, hint_counts=()):
+        timestamp = self._bump_data_point(timestamp=timestamp)
+
+        data_point = self[timestamp]
+
+        for field, value in counts.items():
+            setattr(data_point, field, getattr(data_point, field) + value)
+
+        for hint_index, count in hint_counts:
+            data_point.add_hint_count(hint_index, count)
+
     def iter_timestamp(self):
         yield from sorted(self)
 
@@ -102,13 +213,18 @@ class DataSets(object):
     def data_sets(self):
         return self._data_sets
 
-    def add_chat_data_point(self, is_button=False, timestamp=None):
+    def add_chat_data_point(self, is_button=False, timestamp=None,
+                            emote_count=0):
         for data_set in self._data_sets.values():
-            data_set.add_chat_data_point(is_button, timestamp)
+            data_set.add_chat_data_point(is_button, timestamp, emote_count)
 
-    def add_hint_data_point(self, score=1.0, timestamp=None):
+    def add_hint_data_point(self, score=1.0, timestamp=None, hint_index=None):
         for data_set in self._data_sets.values():
-            data_set.add_hint_data_point(score, timestamp)
+            data_set.add_hint_data_point(score, timestamp, hint_index)
+
+    def add_counts(self, timestamp, counts, hint_counts=()):
+        for data_set in self._data_sets.values():
+            data_set.add_counts(timestamp, counts, hint_counts)
 
     def has_data(self):
         return all(len(data_set) for data_set in self._data_sets.values())
@@ -131,29 +247,60 @@ SHORT_INTERVAL = 60
 MEDIUM_INTERVAL = 300
 LONG_INTERVAL = 900
 BIN_SIZES = (LIVE_INTERVAL, SHORT_INTERVAL, MEDIUM_INTERVAL, LONG_INTERVAL)
+ALLOWED_LATENESS = 2
+GRAPH_CACHE_MAX_LEN = 2000
+RECENT_HYPE_EVENTS_MAX_LEN = 100
+INGEST_LAG_SPAN = 60
+# Nodes not heard from for this long no longer hold back sealing
+NODE_TIMEOUT = 30
 
 
 class HypeCalculator(object):
-    def __init__(self, button_input_parser, text_analyzer, pickle_path=None):
+    def __init__(self, button_input_parser, text_analyzer, pickle_path=None,
+                 detectors=(), allowed_lateness=ALLOWED_LATENESS,
+                 wall_clock=False, baseline=None, classify_workers=0):
         self._button_input_parser = button_input_parser
         self._text_analyzer = text_analyzer
         self._pickle_path = pickle_path
-
-        if pickle_path and os.path.exists(pickle_path):
-            with open(pickle_path, 'rb') as file:
-                doc = pickle.load(file)
-                self._activity = doc['all_activity']
-                self._hype_events = doc.get('hype_events', {})
-                self._recent_hype_events = doc.get('recent_hype_events', [])
-        else:
-            self._activity = DataSets(BIN_SIZES)
-            self._hype_events = {}
-            self._recent_hype_events = []
+        self._activity = DataSets(BIN_SIZES)
+        self._hype_events = {}
+        self._recent_hype_events = collections.deque(
+            maxlen=RECENT_HYPE_EVENTS_MAX_LEN)
+        self._history = None
+        self._input_position = None
+        self._detectors = list(detectors)
+        self._change_detectors = [
+            PercentChangeDetector('rate', median=True),
+            PercentChangeDetector('hint'),
+        ]
+        self._allowed_lateness = allowed_lateness
+        self._wall_clock = wall_clock
+        self._sealed_until = {}
+        self._late_count = 0
+        self._sealed_bin_listeners = []
+        self._hype_event_listeners = []
+        self._ingest_listeners = []
+        self._hint_keys = []
+        self._hint_indexes = {}
+        self._graph_cache = collections.OrderedDict()
+        # Largest counts so far per (bin timestamp, node group) of bins
+        # that aren't sealed yet
+        self._bin_delta_maxima = {}
+        # Node to [end of its latest bin, time it was received]
+        self._node_watermarks = {}
+        self._baseline = baseline
+        self._sketches = SketchSet()
+        self._classify_workers = classify_workers
+        # Runtime metrics, not saved
+        self._lines_processed = 0
+        self._last_batch_size = 0
+        self._ingest_lag = WindowedDigest(INGEST_LAG_SPAN, 6)
+        self._ingest_lock = threading.Lock()
+        self._loaded = threading.Event()
 
         self._thread_lock = threading.Lock()
         self._input_queue = queue.Queue()
         self._last_timestamp = 0
-        self._last_compute_timestamp = 0
 
     @property
     def last_timestamp(self):
@@ -170,12 +317,95 @@ class HypeCalculator(object):
 
         return self._last_timestamp - self._text_analyzer.run_start_timestamp
 
+    @property
+    def input_position(self):
+        return self._input_position
+
+    @property
+    def hint_keys(self):
+        return tuple(self._hint_keys)
+
+    @property
+    def late_count(self):
+        return self._late_count
+
     @property
     def recent_hype_events(self):
+        if self._history:
+            return tuple(
+                self._history.recent_events(RECENT_HYPE_EVENTS_MAX_LEN))
+
         with self._thread_lock:
             return tuple(self._recent_hype_events)
 
+    def set_history(self, history):
+        # Hype events are then stored in and read from the HypeHistory
+        # instead of being kept in memory
+        self._history = history
+        self.add_hype_event_listener(history.add_hype_event)
+
+    def load_pickle(self):
+        if self._loaded.is_set():
+            return
+
+        with self._thread_lock:
+            if self._loaded.is_set():
+                return
+
+            if self._pickle_path and os.path.exists(self._pickle_path):
+                _logger.info('Loading state %s', self._pickle_path)
+
+                with open(self._pickle_path, 'rb') as file:
+                    doc = pickle.load(file)
+
+                self._activity = doc['all_activity']
+                self._hype_events = doc.get('hype_events', {})
+                self._recent_hype_events = collections.deque(
+                    doc.get('recent_hype_events', ()),
+                    maxlen=RECENT_HYPE_EVENTS_MAX_LEN)
+                self._input_position = doc.get('input_position')
+                self._sealed_until = doc.get('sealed_until', {})
+                self._late_count = doc.get('late_count', 0)
+                self._hint_keys = doc.get('hint_keys', [])
+                self._hint_indexes = dict(
+                    (key, index) for index, key in enumerate(self._hint_keys))
+                self._sketches = doc.get('sketches') or self._sketches
+                self._restore_detectors(doc.get('detectors', ()))
+
+                if 'change_detectors' in doc:
+                    self._change_detectors = doc['change_detectors']
+                else:
+                    self._hype_events = {}
+
+            self._loaded.set()
+
+    def _restore_detectors(self, saved_detectors):
+        saved_detectors = dict(
+            (detector.event_type, detector) for detector in saved_detectors)
+
+        for detector in self._detectors:
+            if detector.event_type in saved_detectors:
+                detector.restore(saved_detectors[detector.event_type])
+
+    def add_sealed_bin_listener(self, callback):
+        # Called on the process thread with the bin size and data point of
+        # each bin once it can no longer change.
+        self._sealed_bin_listeners.append(callback)
+
+    def add_ingest_listener(self, callback):
+        # Called on the process thread with each batch of queue items
+        # before they are processed, including items that arrive late.
+        self._ingest_listeners.append(callback)
+
+    def add_hype_event_listener(self, callback):
+        # Called on the process thread with each hype event begin or end.
+        self._hype_event_listeners.append(callback)
+
     def save_pickle(self):
+        if not self._loaded.is_set():
+            # Don't clobber the saved state before it is restored
+            return
+
         new_path = self._pickle_path + '-new'
         with self._thread_lock, open(new_path, 'wb') as file:
             pickle.dump(
@@ -183,60 +413,320 @@ class HypeCalculator(object):
                     'all_activity': self._activity,
                     'hype_events': self._hype_events,
                     'recent_hype_events': self._recent_hype_events,
+                    'input_position': self._input_position,
+                    'sealed_until': self._sealed_until,
+                    'late_count': self._late_count,
+                    'hint_keys': self._hint_keys,
+                    'detectors': self._detectors,
+                    'change_detectors': self._change_detectors,
+                    'sketches': self._sketches,
                 },
                 file)
 
         os.rename(new_path, self._pickle_path)
 
-    def add_chat_activity(self, nick, text, timestamp=None):
-        self._input_queue.put(('chat', nick, text, timestamp))
+    def add_chat_activity(self, nick, text, timestamp=None, position=None,
+                          tags=None):
+        if not timestamp:
+            timestamp = time.time()
+
+        self._input_queue.put(('chat', nick, text, timestamp, position, tags))
 
     def add_live_thread_activity(self, doc, timestamp=None):
+        if not timestamp:
+            timestamp = time.time()
+
         self._input_queue.put(('live_thread', doc, timestamp))
 
+    def add_bin_delta(self, record):
+        # A live bin from another monitor node
+        self._input_queue.put(('bin_delta', record, record['timestamp']))
+
     def process_forever(self):
-        while True:
-            item = self._input_queue.get()
+        # Restored here so input sources can connect and queue messages
+        # while the previous state is loaded.
+        self.load_pickle()
 
+        if self._wall_clock:
+            timeout = 1
+        else:
+            timeout = None
+
+        if self._classify_workers:
+            classifier_pool = ClassifierPool(
+                self._button_input_parser, self._text_analyzer,
+                self._classify_workers)
+        else:
+            classifier_pool = None
+
+        while True:
+            # Lines are classified a batch at a time. With workers, later
+            # batches are classified while the oldest batch is applied.
+            try:
+                items = self._get_batch(
+                    block=not classifier_pool or
+                    not classifier_pool.pending_count,
+                    timeout=timeout)
+            except queue.Empty:
+                # Nothing arriving late can be older than now
+                self._advance_watermark(time.time())
+                continue
+
+            if not classifier_pool:
+                self._process_batch(items)
+                continue
+
+            if items:
+                classifier_pool.submit(items)
+
+            batch = classifier_pool.pop(
+                wait=not items or classifier_pool.is_full())
+
+            while batch:
+                self._process_batch(*batch)
+                batch = classifier_pool.pop()
+
+    def _process_batch(self, items, classified=None):
+        self._record_ingest(items)
+
+        for listener in self._ingest_listeners:
+            listener(items)
+
+        if classified is None:
+            classified = classify_batch(
+                self._button_input_parser, self._text_analyzer,
+                [(item[2], item[5]) for item in items if item[0] == 'chat'])
+
+        button_flags, hint_indexes, hint_keys, emote_counts = classified
+        line_index = 0
+
+        for item in items:
             if item[0] == 'chat':
-                self._process_chat_activity(item[1], item[2], item[3])
+                hint_index = hint_indexes[line_index]
+                self._process_item(item, (
+                    button_flags[line_index],
+                    hint_keys[hint_index] if hint_index >= 0 else None,
+                    emote_counts[line_index]
+                ))
+                line_index += 1
             else:
-                self._process_thread_activity(item[1], item[2])
+                self._process_item(item)
+
+    def _record_ingest(self, items):
+        self._lines_processed += len(items)
+        self._last_batch_size = len(items)
+
+        if not self._wall_clock:
+            return
 
-            if self._last_timestamp - self._last_compute_timestamp > SHORT_INTERVAL:
-                self._compute_events()
-                self._last_compute_timestamp = self._last_timestamp
+        # Time from being received to being processed, sampled once per
+        # batch from its oldest item to keep the cost off each line
+        for item in items:
+            if item[0] != 'bin_delta':
+                break
+        else:
+            return
+
+        timestamp = item[3] if item[0] == 'chat' else item[2]
+        current_time = time.time()
+
+        with self._ingest_lock:
+            self._ingest_lag.add(current_time, current_time - timestamp)
+
+    def ingest_stats(self):
+        with self._ingest_lock:
+            lag_digest = self._ingest_lag.digest(time.time())
+
+        return {
+            'lines_processed': self._lines_processed,
+            'queue_depth': self._input_queue.qsize(),
+            'last_batch_size': self._last_batch_size,
+            'lag_p50': lag_digest.quantile(0.5),
+            'lag_p90': lag_digest.quantile(0.9),
+            'lag_p99': lag_digest.quantile(0.99),
+        }
+
+    def _get_batch(self, block=True, timeout=None):
+        if block:
+            items = [self._input_queue.get(timeout=timeout)]
+        else:
+            items = []
+
+        while len(items) < MAX_BATCH_SIZE:
+            try:
+                items.append(self._input_queue.get_nowait())
+            except queue.Empty:
+                break
 
-    def _process_chat_activity(self, nick, text, timestamp=None):
+        return items
+
+    def _process_item(self, item, classification=None):
+        timestamp = item[3] if item[0] == 'chat' else item[2]
+
+        if item[0] == 'bin_delta':
+            # Counted even when late so that a node with a lagging clock
+            # holds back sealing until its bins can be merged
+            node_watermark = self._node_watermarks.setdefault(
+                item[1].get('node'), [0, 0])
+            node_watermark[0] = max(
+                node_watermark[0], timestamp + LIVE_INTERVAL)
+            node_watermark[1] = time.time()
+
+        if timestamp < self._sealed_until.get(LIVE_INTERVAL, 0):
+            if item[0] != 'live_thread':
+                self._late_count += 1
+                return
+
+            # Live thread updates fetched after a reconnect are few and
+            # each is a strong hint, so they are counted in the oldest open
+            # bin instead of being dropped
+            timestamp = self._sealed_until[LIVE_INTERVAL]
+            item = (item[0], item[1], timestamp)
+
+        if item[0] == 'chat':
+            self._process_chat_activity(
+                *item[1:], classification=classification)
+        elif item[0] == 'bin_delta':
+            self._process_bin_delta(item[1])
+        else:
+            self._process_thread_activity(item[1], item[2])
+
+        self._advance_watermark(self._last_timestamp)
+
+    def _process_chat_activity(self, nick, text, timestamp=None,
+                               position=None, tags=None, classification=None):
         if not timestamp:
             timestamp = time.time()
 
-        self._last_timestamp = timestamp
+        self._last_timestamp = max(self._last_timestamp, timestamp)
+
+        is_button, hint_key, emote_count = classification
 
         with self._thread_lock:
-            is_button = self._button_input_parser.parse_button(text)
-            self._activity.add_chat_data_point(is_button=is_button, timestamp=timestamp)
+            if position:
+                self._input_position = position
+
+            self._activity.add_chat_data_point(
+                is_button=is_button, timestamp=timestamp,
+                emote_count=emote_count)
 
-            chat_hint = self._text_analyzer.analyze_chat(text)
-            if chat_hint:
+            if hint_key:
                 if timestamp and timestamp >= self._text_analyzer.run_start_timestamp:
-                    _logger.debug('Chat hint: %s [%s]', chat_hint.string, chat_hint.group(0))
+                    _logger.debug('Chat hint: %s [%s]', text, hint_label(hint_key))
 
-                self._activity.add_hint_data_point(timestamp=timestamp)
+                self._activity.add_hint_data_point(
+                    timestamp=timestamp,
+                    hint_index=self._hint_index(hint_key))
 
     def _process_thread_activity(self, doc, timestamp=None):
         if not timestamp:
             timestamp = time.time()
 
-        self._last_timestamp = timestamp
+        self._last_timestamp = max(self._last_timestamp, timestamp)
 
         with self._thread_lock:
             hint = self._text_analyzer.analyze_live_thread(doc)
 
             if hint:
-                _logger.debug('Live hint: %s [%s]', hint.string, hint.group(0))
-                _logger.info('Live hint: %s', hint.group(0))
-                self._activity.add_hint_data_point(score=10.0, timestamp=timestamp)
+                _logger.debug('Live hint: %s [%s]', doc['body'], hint.text)
+                _logger.info('Live hint: %s', hint.text)
+                self._activity.add_hint_data_point(
+                    score=10.0, timestamp=timestamp,
+                    hint_index=self._hint_index(hint.key))
+
+    def _process_bin_delta(self, record):
+        # Nodes in a group watch the same chat, so their bins are merged by
+        # taking the largest counts, which also covers lines dropped by some
+        # of the nodes. Groups watch different chat and are summed.
+        timestamp = record['timestamp']
+        self._last_timestamp = max(
+            self._last_timestamp, timestamp + LIVE_INTERVAL)
+
+        key = (timestamp, record.get('group'))
+        maxima = self._bin_delta_maxima.get(key)
+
+        if maxima is None:
+            maxima = self._bin_delta_maxima[key] = {}
+
+        counts = {}
+        hint_counts = []
+
+        for field, typecode in DATA_POINT_FIELDS:
+            increase = record.get(field, 0) - maxima.get(field, 0)
+
+            if increase > 0:
+                maxima[field] = record[field]
+                counts[field] = increase
+
+        with self._thread_lock:
+            for hint_key, count in record.get('hint_counts', {}).items():
+                increase = count - maxima.get(hint_key, 0)
+
+                if increase > 0:
+                    maxima[hint_key] = count
+                    hint_counts.append((self._hint_index(hint_key), increase))
+
+            if counts or hint_counts:
+                self._activity.add_counts(timestamp, counts, hint_counts)
+
+        sealed_until = self._sealed_until.get(LIVE_INTERVAL, 0)
+
+        for key in tuple(self._bin_delta_maxima):
+            if key[0] < sealed_until:
+                del self._bin_delta_maxima[key]
+
+    def _hint_index(self, key):
+        # Indexes are only ever appended so the counts stay aligned when
+        # patterns are reloaded
+        index = self._hint_indexes.get(key)
+
+        if index is None:
+            index = self._hint_indexes[key] = len(self._hint_keys)
+            self._hint_keys.append(key)
+
+        return index
+
+    def _find_hint_index(self, label):
+        for index, key in enumerate(self._hint_keys):
+            if label in (key, hint_label(key)):
+                return index
+
+        raise ValueError('unknown hint')
+
+    def hint_breakdown(self, duration=LONG_INTERVAL, timestamp=None):
+        data_set = self._activity.data_sets[LIVE_INTERVAL]
+
+        if not timestamp:
+            timestamp = self._last_timestamp
+
+        counts = collections.Counter()
+
+        with self._thread_lock:
+            for data_point in data_set.iter_data_point(
+                    timestamp - duration, timestamp):
+                if data_point.hint_counts:
+                    for index, count in enumerate(data_point.hint_counts):
+                        if count:
+                            counts[hint_label(self._hint_keys[index])] += count
+
+        return dict(counts.most_common())
+
+    def activity_summary(self, start_timestamp, end_timestamp):
+        # Peak and mean lines/sec and hints/sec of the bins closed between
+        # the two hype event times
+        data_set = self._activity.data_sets[LIVE_INTERVAL]
+        start_timestamp -= LIVE_INTERVAL
+        end_timestamp -= LIVE_INTERVAL
+
+        with self._thread_lock:
+            rates = tuple(data_set.iter_rate(start_timestamp, end_timestamp))
+            hints = tuple(data_set.iter_hint(start_timestamp, end_timestamp))
+
+        if not rates:
+            return None, None, None, None
+
+        return max(rates), statistics.mean(rates), \
+            max(hints), statistics.mean(hints)
 
     def compute_averages(self, series='rate', median=False, timestamp=None):
         data_set = self._activity.data_sets[LIVE_INTERVAL]
@@ -292,6 +782,30 @@ class HypeCalculator(object):
             StdDevInfo(std_dev_short, std_dev_medium, std_dev_long)
         )
 
+    def percentiles(self, timestamp=None):
+        if not timestamp:
+            timestamp = self._last_timestamp
+
+        with self._thread_lock:
+            return self._sketches.percentiles(timestamp)
+
+    def typical_ratios(self, timestamp=None):
+        if not self._baseline:
+            return {}
+
+        if not timestamp:
+            timestamp = self._last_timestamp
+
+        ratios = {}
+
+        for series, median in (('rate', True), ('hint', False)):
+            average_info, std_dev_info = self.compute_averages(
+                series, median=median, timestamp=timestamp)
+            ratios[series] = self._baseline.typical_ratio(
+                timestamp, series, average_info.short)
+
+        return ratios
+
     def averages_string(self, series='rate', median=False):
         if not self._activity.has_data():
             return
@@ -325,26 +839,13 @@ class HypeCalculator(object):
         if not self._activity.has_data():
             return
 
-        data_sets = self._activity.data_sets
-
-        with self._thread_lock:
-            if series == 'rate':
-                short_iterable = data_sets[SHORT_INTERVAL].iter_rate()
-                medium_iterable = data_sets[MEDIUM_INTERVAL].iter_rate()
-            elif series == 'hint':
-                short_iterable = data_sets[SHORT_INTERVAL].iter_hint()
-                medium_iterable = data_sets[MEDIUM_INTERVAL].iter_hint()
-            else:
-                raise ValueError('unknown series')
-
-            data_list_short = tuple(short_iterable)[-60:]
-            data_list_medium = tuple(medium_iterable)
-
-        graph_short = text_graph(data_list_short)
-        graph_medium = text_graph(data_list_medium)
+        medium_end = (self._last_timestamp // MEDIUM_INTERVAL + 1) * MEDIUM_INTERVAL
+        short_end = (self._last_timestamp // SHORT_INTERVAL + 1) * SHORT_INTERVAL
 
-        max_short = max(data_list_short)
-        max_medium = max(data_list_medium)
+        graph_medium, max_medium = self.graph(
+            series, medium_end - 14400, medium_end, 24)
+        graph_short, max_short = self.graph(
+            series, short_end - 3600, short_end, 30)
 
         return '4h[{graph_medium}]{max_medium:>#4.01f} 1h[{graph_short}]{max_short:>#4.01f}'.format(
             graph_short=graph_short,
@@ -353,34 +854,211 @@ class HypeCalculator(object):
             max_medium=max_medium,
         )
 
-    def _compute_events(self):
-        for event_type in ('chat', 'hint'):
-            if event_type == 'chat':
-                average_info, std_dev_info = self.compute_averages(series='rate', median=True)
-            else:
-                average_info, std_dev_info = self.compute_averages(series='hint')
+    def graph(self, series, start_timestamp, end_timestamp, width,
+              aggregate='max'):
+        values = self.graph_values(
+            series, start_timestamp, end_timestamp, width * 2, aggregate)
+        max_value = max(values) if values else 0
+
+        return text_graph(values), max_value
+
+    def graph_values(self, series, start_timestamp, end_timestamp, count,
+                     aggregate='max'):
+        # Each value aggregates the bins of the coarsest resolution that
+        # still has at least one bin per value, so the cost depends on the
+        # count and not on the time range.
+        span = (end_timestamp - start_timestamp) / count
+        value_func = self._series_value_func(series)
+        data_set = self._pick_data_set(span, start_timestamp)
+        bin_size = data_set.bin_size
+
+        sealed_until = self._sealed_until.get(bin_size, 0)
+        values = []
+
+        with self._thread_lock:
+            for index in range(count):
+                value_start = start_timestamp + index * span
+                value_end = value_start + span
+                # Values are cached one by one since graph ranges usually
+                # end in bins that are still open and slide forward
+                cache_key = (series, value_start, span, aggregate, bin_size)
+
+                if cache_key in self._graph_cache:
+                    self._graph_cache.move_to_end(cache_key)
+                    values.append(self._graph_cache[cache_key])
+                    continue
+
+                bin_values = []
+                timestamp = int(value_start // bin_size * bin_size)
+
+                while True:
+                    data_point = data_set.get(timestamp)
+                    bin_values.append(
+                        value_func(data_point, bin_size) if data_point else 0)
+                    timestamp += bin_size
+
+                    if timestamp >= value_end:
+                        break
+
+                if aggregate == 'max':
+                    value = max(bin_values)
+                elif aggregate == 'mean':
+                    value = sum(bin_values) / len(bin_values)
+                else:
+                    raise ValueError('unknown aggregate')
+
+                values.append(value)
+
+                # Only values of sealed bins can no longer change
+                if value_end <= sealed_until:
+                    self._graph_cache[cache_key] = value
+
+            while len(self._graph_cache) > GRAPH_CACHE_MAX_LEN:
+                self._graph_cache.popitem(last=False)
+
+        return values
+
+    def _pick_data_set(self, span, start_timestamp):
+        data_sets = sorted(self._activity.data_sets.items())
+        chosen_data_set = data_sets[0][1]
+
+        for bin_size, data_set in data_sets:
+            if bin_size > span:
+                break
+
+            retention_start = self._last_timestamp - data_set.max_len * bin_size
+
+            if bin_size == data_sets[0][0] or retention_start <= start_timestamp:
+                chosen_data_set = data_set
+
+        return chosen_data_set
+
+    def _series_value_func(self, series):
+        if series == 'rate':
+            return lambda data_point, bin_size: data_point.line_count / bin_size
+        elif series == 'hint':
+            return lambda data_point, bin_size: data_point.hint_score / bin_size
+        elif series == 'emote':
+            return lambda data_point, bin_size: data_point.emote_count / bin_size
+        elif series.startswith('hint/'):
+            hint_index = self._find_hint_index(series[5:])
+
+            def value_func(data_point, bin_size):
+                hint_counts = data_point.hint_counts
+
+                if hint_counts and hint_index < len(hint_counts):
+                    return hint_counts[hint_index] / bin_size
+                else:
+                    return 0
+
+            return value_func
+        else:
+            raise ValueError('unknown series')
+
+    def _advance_watermark(self, timestamp):
+        watermark = None
+
+        if self._node_watermarks:
+            watermark = self._nodes_watermark()
+
+        if watermark is None:
+            watermark = timestamp - self._allowed_lateness
+
+        sealed_until = self._sealed_until.get(LIVE_INTERVAL)
+
+        if sealed_until and watermark < sealed_until + LIVE_INTERVAL:
+            return
+
+        for bin_size, data_set in sorted(self._activity.data_sets.items()):
+            self._seal_bins(data_set, watermark)
 
-            hype_event = self._hype_events.get(event_type)
+    def _nodes_watermark(self):
+        # When aggregating, nodes send bins in order once they are sealed,
+        # so a bin is complete when every node still sending has passed it.
+        # Clocks that lag only delay sealing instead of losing bins.
+        current_time = time.time()
+        ends = [
+            end for end, received_time in self._node_watermarks.values()
+            if current_time - received_time < NODE_TIMEOUT
+        ]
 
-            if not hype_event and average_info.change >= 1.0:
+        return min(ends) if ends else None
+
+    def _seal_bins(self, data_set, watermark):
+        bin_size = data_set.bin_size
+        boundary = int(watermark // bin_size * bin_size)
+        start_timestamp = self._sealed_until.get(bin_size)
+        self._sealed_until[bin_size] = max(boundary, start_timestamp or 0)
+
+        if not start_timestamp or boundary <= start_timestamp:
+            return
+
+        # Bins without activity are sealed too, but not for long gaps
+        # such as restarts
+        gap_timestamp = max(
+            start_timestamp, boundary - max(LONG_INTERVAL, bin_size))
+
+        if gap_timestamp > start_timestamp:
+            for timestamp in sorted(data_set):
+                if start_timestamp <= timestamp < gap_timestamp:
+                    self._bin_sealed(bin_size, data_set[timestamp])
+
+        for timestamp in range(gap_timestamp, boundary, bin_size):
+            data_point = data_set.get(timestamp) or DataPoint(timestamp)
+            self._bin_sealed(bin_size, data_point)
+
+    def _bin_sealed(self, bin_size, data_point):
+        if bin_size == LIVE_INTERVAL:
+            self._bin_closed(data_point)
+
+        with self._thread_lock:
+            self._sketches.add_data_point(bin_size, data_point)
+
+        if self._baseline:
+            self._baseline.add_data_point(bin_size, data_point)
+
+        for listener in self._sealed_bin_listeners:
+            listener(bin_size, data_point)
+
+    def _bin_closed(self, data_point):
+        end_time = data_point.timestamp + LIVE_INTERVAL
+        values = {
+            'rate': data_point.line_count / LIVE_INTERVAL,
+            'hint': data_point.hint_score / LIVE_INTERVAL,
+        }
+
+        for detector in self._detectors:
+            result = detector.update(values[detector.series], end_time)
+
+            if result == 'begin':
+                self._event_begun(end_time, detector.event_type)
+            elif result == 'end':
+                self._event_ended(end_time, detector.event_type)
+
+        # Chat and hint events are combined into one hype event that lasts
+        # until both have ended
+        for detector in self._change_detectors:
+            event_type = detector.event_type
+            result = detector.update(values[detector.series], end_time)
+
+            if result == 'begin':
                 hype_event = HypeEvent()
-                hype_event.begin_time = self._last_timestamp
-                hype_event.begin_threshold = average_info.short
-                hype_event.end_threshold = average_info.long
+                hype_event.begin_time = end_time
+                hype_event.begin_threshold = detector.begin_threshold
+                hype_event.end_threshold = detector.end_threshold
 
                 if not self._hype_events:
-                    self._event_begun(self._last_timestamp, event_type)
+                    self._event_begun(end_time, event_type)
 
                 self._hype_events[event_type] = hype_event
 
-            elif hype_event and not hype_event.end_time and \
-                    average_info.short < hype_event.end_threshold:
-                hype_event.end_time = self._last_timestamp
+            elif result == 'end' and event_type in self._hype_events:
+                self._hype_events[event_type].end_time = end_time
 
                 del self._hype_events[event_type]
 
                 if not self._hype_events:
-                    self._event_ended(self._last_timestamp, event_type)
+                    self._event_ended(end_time, event_type)
 
     def _event_begun(self, begin_time, event_type):
         _logger.info(
@@ -390,11 +1068,10 @@ class HypeCalculator(object):
             format_duration(begin_time - self._text_analyzer.run_start_timestamp)
         )
 
-        with self._thread_lock:
-            self._recent_hype_events.append(('begin', event_type, begin_time))
-
-            while len(self._recent_hype_events) > 100:
-                del self._recent_hype_events[0]
+        self._append_hype_event((
+            'begin', event_type, begin_time,
+            self.hint_breakdown(SHORT_INTERVAL, begin_time)
+        ))
 
     def _event_ended(self, end_time, event_type):
         _logger.info(
@@ -404,5 +1081,15 @@ class HypeCalculator(object):
             format_duration(end_time - self._text_analyzer.run_start_timestamp)
         )
 
-        with self._thread_lock:
-            self._recent_hype_events.append(('end', event_type, end_time))
+        self._append_hype_event((
+            'end', event_type, end_time,
+            self.hint_breakdown(SHORT_INTERVAL, end_time)
+        ))
+
+    def _append_hype_event(self, event):
+        if not self._history:
+            with self._thread_lock:
+                self._recent_hype_events.append(event)
+
+        for listener in self._hype_event_listeners:
+            listener(event)
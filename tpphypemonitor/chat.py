@@ -3,7 +3,6 @@ import random
 import sched
 import time
 
-import arrow
 import irc.client
 import irc.strings
 
@@ -39,31 +38,33 @@ class TwitchClient(IRCClient):
             return
 
         nick = irc.strings.lower(event.source.nick)
+        tags = dict((tag['key'], tag['value']) for tag in event.tags or ())
 
-        self._message_callback(nick, event.arguments[0])
+        self._message_callback(nick, event.arguments[0], tags)
 
 
 class TwitchInputSource(InputSourceThread):
-    def __init__(self, server, channel):
+    def __init__(self, server, channel, port=6667):
         super().__init__()
         self._client = None
         self._server = server
         self._channel = channel
+        self._port = port
         self._running = False
 
     def run(self):
         self._running = True
 
-        def feed_calculator(nick, text):
+        def feed_calculator(nick, text, tags):
             if random.random() < 0.1:
                 _logger.debug('Chat: %s: %s', nick, text)
-            self._calculator.add_chat_activity(nick, text)
+            self._calculator.add_chat_activity(nick, text, tags=tags)
 
         self._client = TwitchClient(self._channel, feed_calculator)
         nickname = 'justinfan{}'.format(random.randint(0, 1000000))
 
         _logger.info('Connecting...')
-        self._client.autoconnect(self._server, 6667, nickname)
+        self._client.autoconnect(self._server, self._port, nickname)
 
         while self._running:
             self._client.reactor.process_once(0.2)
@@ -0,0 +1,103 @@
+import array
+import collections
+import logging
+
+from tpphypemonitor.heuristics import parse_emotes
+
+_logger = logging.getLogger(__name__)
+
+# Below this many chat lines in a batch, classifying inline is cheaper than
+# sending the lines to a worker and back
+MIN_POOL_BATCH_SIZE = 200
+MAX_BATCH_SIZE = 2000
+
+_worker_classifiers = None
+
+
+def classify_batch(button_input_parser, text_analyzer, lines):
+    # Lines are (text, tags). Returns button flags, hint key indexes, the
+    # hint keys and emote counts, with one array item per line.
+    texts = [text for text, tags in lines]
+    emote_counts_list = []
+    emote_totals = array.array('l')
+
+    for text, tags in lines:
+        if tags is not None and 'emotes' in tags:
+            emote_counts = parse_emotes(tags['emotes'])
+            emote_counts_list.append(emote_counts)
+            emote_totals.append(sum(emote_counts.values()))
+        else:
+            emote_counts_list.append(None)
+            emote_totals.append(0)
+
+    button_flags = button_input_parser.classify_batch(texts)
+    hint_indexes, hint_keys = text_analyzer.classify_batch(
+        texts, emote_counts_list)
+
+    return button_flags, hint_indexes, hint_keys, emote_totals
+
+
+def _init_worker(button_input_parser, text_analyzer):
+    global _worker_classifiers
+    _worker_classifiers = (button_input_parser, text_analyzer)
+
+
+def _classify_lines(lines):
+    button_input_parser, text_analyzer = _worker_classifiers
+
+    if text_analyzer.patterns_filename:
+        text_analyzer.reload_patterns()
+
+    return classify_batch(button_input_parser, text_analyzer, lines)
+
+
+# Classifies batches of queue items in worker processes. Batches are
+# returned in the order they were submitted. Small batches are not sent to
+# the workers and are classified inline when they are applied.
+class ClassifierPool(object):
+    def __init__(self, button_input_parser, text_analyzer, workers,
+                 min_batch_size=MIN_POOL_BATCH_SIZE):
+        import multiprocessing
+
+        # Spawned since the calculator runs alongside other threads
+        context = multiprocessing.get_context('spawn')
+        self._pool = context.Pool(
+            workers, _init_worker, (button_input_parser, text_analyzer))
+        self._min_batch_size = min_batch_size
+        self._max_pending = workers * 2
+        self._pending = collections.deque()
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def is_full(self):
+        return len(self._pending) >= self._max_pending
+
+    def submit(self, items):
+        lines = [(item[2], item[5]) for item in items if item[0] == 'chat']
+
+        if len(lines) >= self._min_batch_size:
+            result = self._pool.apply_async(_classify_lines, (lines,))
+        else:
+            result = None
+
+        self._pending.append((items, result))
+
+    def pop(self, wait=False):
+        # Returns the items and classifications of the oldest batch, or None
+        # if it is not ready. Classifications are None for inline batches.
+        if not self._pending:
+            return
+
+        items, result = self._pending[0]
+
+        if result is not None and not wait and not result.ready():
+            return
+
+        self._pending.popleft()
+
+        return items, result.get() if result is not None else None
+
+    def close(self):
+        self._pool.terminate()
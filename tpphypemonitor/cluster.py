@@ -0,0 +1,182 @@
+import collections
+import json
+import logging
+import socket
+import threading
+import time
+
+from tpphypemonitor.calc import DATA_POINT_FIELDS, LIVE_INTERVAL, \
+    NODE_TIMEOUT
+from tpphypemonitor.source import InputSourceThread
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 6700
+DEFAULT_GROUP = 'default'
+RECONNECT_INTERVAL = 5
+# The aggregator stops waiting for a node after NODE_TIMEOUT and seals past
+# it, so older bins would be dropped as late after a reconnect
+SEND_BACKLOG_MAX_LEN = (NODE_TIMEOUT + RECONNECT_INTERVAL) // LIVE_INTERVAL + 1
+CONNECT_TIMEOUT = 10
+JSON_SEPARATORS = (',', ':')
+
+
+def parse_address(address, default_port=DEFAULT_PORT):
+    host, sep, port = address.rpartition(':')
+
+    if not sep:
+        return address, default_port
+
+    return host, int(port)
+
+
+# Sends each sealed live bin of a node's calculator to the aggregator as one
+# JSON line. Only bins are sent, so the traffic doesn't depend on the chat
+# rate. Empty bins are sent too since the aggregator seals bins once every
+# node has sent them. Bins are queued while disconnected and sent again in
+# order when the connection is back, as long as the aggregator can still
+# merge them.
+class BinDeltaSender(object):
+    def __init__(self, address, calculator, node_id=None,
+                 group=DEFAULT_GROUP):
+        self._address = address
+        self._calculator = calculator
+        self._node_id = node_id or '{}-{}'.format(
+            socket.gethostname(), int(time.time()))
+        self._group = group
+        self._backlog = collections.deque(maxlen=SEND_BACKLOG_MAX_LEN)
+        self._condition = threading.Condition()
+        self._socket = None
+
+        self._thread = threading.Thread(target=self._send_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_data_point(self, bin_size, data_point):
+        if bin_size != LIVE_INTERVAL:
+            return
+
+        record = {
+            'type': 'bin',
+            'node': self._node_id,
+            'group': self._group,
+            'timestamp': data_point.timestamp,
+        }
+
+        for field, typecode in DATA_POINT_FIELDS:
+            record[field] = getattr(data_point, field)
+
+        if data_point.hint_counts:
+            # Hint indexes differ between nodes so the keys are sent
+            hint_keys = self._calculator.hint_keys
+            record['hint_counts'] = dict(
+                (hint_keys[index], count)
+                for index, count in enumerate(data_point.hint_counts)
+                if count
+            )
+
+        data = self._encode(record)
+
+        with self._condition:
+            if len(self._backlog) == self._backlog.maxlen:
+                _logger.warning('Aggregator backlog full, dropping oldest bin')
+
+            self._backlog.append(data)
+            self._condition.notify()
+
+    def _encode(self, record):
+        return (json.dumps(record, separators=JSON_SEPARATORS) + '\n')\
+            .encode('utf8')
+
+    def _send_forever(self):
+        while True:
+            try:
+                if not self._socket:
+                    self._connect()
+
+                with self._condition:
+                    while not self._backlog:
+                        self._condition.wait()
+
+                    data = self._backlog[0]
+
+                self._socket.sendall(data)
+            except OSError as error:
+                _logger.warning('Could not send to aggregator %s: %s',
+                                self._address, error)
+
+                if self._socket:
+                    self._socket.close()
+                    self._socket = None
+
+                time.sleep(RECONNECT_INTERVAL)
+                continue
+
+            with self._condition:
+                # Unless the backlog overflowed while sending
+                if self._backlog and self._backlog[0] is data:
+                    self._backlog.popleft()
+
+    def _connect(self):
+        _logger.info('Connecting to aggregator %s', self._address)
+        self._socket = socket.create_connection(
+            self._address, timeout=CONNECT_TIMEOUT)
+        self._socket.settimeout(None)
+
+        # An empty bin just before the current one, so the aggregator waits
+        # for this node's bins from now on
+        timestamp = int(time.time() // LIVE_INTERVAL * LIVE_INTERVAL)
+        self._socket.sendall(self._encode({
+            'type': 'bin',
+            'node': self._node_id,
+            'group': self._group,
+            'timestamp': timestamp - LIVE_INTERVAL,
+        }))
+
+
+# Accepts connections from nodes and queues the bins they send in the
+# calculator. The calculator merges the bins of all nodes, so detection,
+# stats and the other outputs run on the merged view as they do for chat.
+class BinDeltaServer(InputSourceThread):
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+        super().__init__()
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.listen(16)
+
+    @property
+    def port(self):
+        return self._socket.getsockname()[1]
+
+    def run(self):
+        _logger.info('Aggregating bins on port %s', self.port)
+
+        while True:
+            connection, address = self._socket.accept()
+            _logger.info('Node connected from %s', address)
+            thread = threading.Thread(
+                target=self._handle_node, args=(connection, address))
+            thread.daemon = True
+            thread.start()
+
+    def _handle_node(self, connection, address):
+        try:
+            with connection, connection.makefile('rb') as file:
+                for line in file:
+                    # A partial line is sent again after reconnecting
+                    if not line.endswith(b'\n'):
+                        break
+
+                    try:
+                        record = json.loads(line.decode('utf8'))
+                    except ValueError:
+                        _logger.warning('Bad bin from %s: %r', address, line)
+                        continue
+
+                    if record.get('type') == 'bin':
+                        self._calculator.add_bin_delta(record)
+        except OSError as error:
+            _logger.info('Node %s disconnected: %s', address, error)
+        else:
+            _logger.info('Node %s disconnected', address)
@@ -0,0 +1,321 @@
+import bisect
+import collections
+import math
+
+SERIES_EVENT_TYPES = {
+    'rate': 'chat',
+    'hint': 'hint',
+}
+
+
+class HypeDetector(object):
+    name = None
+
+    def __init__(self, series='rate', warmup=90):
+        self._series = series
+        self._warmup = warmup
+        self._count = 0
+        self._active = False
+
+    @property
+    def series(self):
+        return self._series
+
+    @property
+    def event_type(self):
+        return '{}-{}'.format(SERIES_EVENT_TYPES[self._series], self.name)
+
+    @property
+    def active(self):
+        return self._active
+
+    def restore(self, saved_detector):
+        # Continue from the state of a checkpoint. Attributes that are not
+        # pickled, such as shared stores, are kept.
+        self.__dict__.update(saved_detector.__dict__)
+
+    def update(self, value, timestamp=None):
+        # Called with the value of each closed bin. Returns 'begin' or 'end'
+        # when the hype state changes.
+        self._count += 1
+        active = self._update(value, timestamp)
+
+        if self._count <= self._warmup:
+            return
+
+        if active and not self._active:
+            self._active = True
+            return 'begin'
+        elif not active and self._active:
+            self._active = False
+            return 'end'
+
+    def _update(self, value, timestamp):
+        raise NotImplementedError()
+
+
+class EWMACrossoverDetector(HypeDetector):
+    name = 'ewma'
+
+    def __init__(self, series='rate', short_span=6, long_span=90,
+                 begin_ratio=2.0, end_ratio=1.2, min_value=0.05, **kwargs):
+        super().__init__(series, **kwargs)
+        self._short_alpha = 2 / (short_span + 1)
+        self._long_alpha = 2 / (long_span + 1)
+        self._begin_ratio = begin_ratio
+        self._end_ratio = end_ratio
+        self._min_value = min_value
+        self._short = None
+        self._long = None
+
+    def _update(self, value, timestamp):
+        if self._short is None:
+            self._short = self._long = value
+
+        self._short += self._short_alpha * (value - self._short)
+        self._long += self._long_alpha * (value - self._long)
+
+        if self._short < self._min_value:
+            return False
+
+        if self._active:
+            return self._short >= self._long * self._end_ratio
+        else:
+            return self._short >= self._long * self._begin_ratio
+
+
+class ZScoreDetector(HypeDetector):
+    name = 'zscore'
+
+    def __init__(self, series='rate', span=90, begin_score=3.0,
+                 end_score=1.0, **kwargs):
+        super().__init__(series, **kwargs)
+        self._alpha = 2 / (span + 1)
+        self._begin_score = begin_score
+        self._end_score = end_score
+        self._mean = None
+        self._variance = 0
+
+    def _update(self, value, timestamp):
+        if self._mean is None:
+            self._mean = value
+
+        score = self._score(value)
+
+        # Exponentially weighted mean and variance
+        diff = value - self._mean
+        increment = self._alpha * diff
+        self._mean += increment
+        self._variance = (1 - self._alpha) * (self._variance + diff * increment)
+
+        if self._active:
+            return score >= self._end_score
+        else:
+            return score >= self._begin_score
+
+    def _score(self, value):
+        std_dev = math.sqrt(self._variance)
+
+        if not std_dev:
+            return 0
+
+        return (value - self._mean) / std_dev
+
+
+class CUSUMDetector(HypeDetector):
+    name = 'cusum'
+
+    def __init__(self, series='rate', span=90, drift=1.0, threshold=6.0,
+                 **kwargs):
+        super().__init__(series, **kwargs)
+        self._alpha = 2 / (span + 1)
+        self._drift = drift
+        self._threshold = threshold
+        self._mean = None
+        self._variance = 0
+        self._sum = 0
+
+    def _update(self, value, timestamp):
+        if self._count <= self._warmup or self._mean is None:
+            # The plain mean and variance of the warmup bins seed the
+            # reference level
+            count = min(self._count, self._warmup) or 1
+            diff = value - (self._mean or 0)
+            self._mean = (self._mean or 0) + diff / count
+            self._variance += \
+                (diff * (value - self._mean) - self._variance) / count
+            return False
+
+        std_dev = math.sqrt(self._variance)
+
+        if std_dev:
+            self._sum = max(
+                0, self._sum + (value - self._mean) / std_dev - self._drift)
+            self._sum = min(self._sum, self._threshold * 2)
+
+        # The reference level is held while hype is ongoing so the
+        # cumulative sum can fall back to zero at its end.
+        if not self._active:
+            diff = value - self._mean
+            increment = self._alpha * diff
+            self._mean += increment
+            self._variance = (1 - self._alpha) * \
+                (self._variance + diff * increment)
+
+        if self._active:
+            return self._sum > 0
+        else:
+            return self._sum >= self._threshold
+
+
+class BaselineDetector(HypeDetector):
+    # Compares a short EWMA against the typical value for the hour of the
+    # week from a BaselineStore.
+    name = 'baseline'
+
+    def __init__(self, series='rate', baseline=None, short_span=6,
+                 begin_ratio=3.0, end_ratio=1.5, min_value=0.05, warmup=6):
+        super().__init__(series, warmup=warmup)
+        self._baseline = baseline
+        self._short_alpha = 2 / (short_span + 1)
+        self._begin_ratio = begin_ratio
+        self._end_ratio = end_ratio
+        self._min_value = min_value
+        self._short = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_baseline']
+        return state
+
+    def _update(self, value, timestamp):
+        if self._short is None:
+            self._short = value
+
+        self._short += self._short_alpha * (value - self._short)
+
+        if self._short < self._min_value or not self._baseline:
+            return False
+
+        ratio = self._baseline.typical_ratio(timestamp, self._series, self._short)
+
+        if ratio is None:
+            return False
+        elif self._active:
+            return ratio >= self._end_ratio
+        else:
+            return ratio >= self._begin_ratio
+
+
+class RollingWindow(object):
+    def __init__(self, size, median=False):
+        self._values = collections.deque(maxlen=size)
+        self._sorted_values = [] if median else None
+        self._sum = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, value):
+        if len(self._values) == self._values.maxlen:
+            old_value = self._values[0]
+            self._sum -= old_value
+
+            if self._sorted_values is not None:
+                del self._sorted_values[
+                    bisect.bisect_left(self._sorted_values, old_value)]
+
+        self._values.append(value)
+        self._sum += value
+
+        if self._sorted_values is not None:
+            bisect.insort(self._sorted_values, value)
+
+    def mean(self):
+        if not self._values:
+            return 0
+
+        return self._sum / len(self._values)
+
+    def median(self):
+        values = self._sorted_values
+
+        if not values:
+            return 0
+
+        middle = len(values) // 2
+
+        if len(values) % 2:
+            return values[middle]
+        else:
+            return (values[middle - 1] + values[middle]) / 2
+
+
+class PercentChangeDetector(HypeDetector):
+    # Short and long window averages of the closed bins, updated
+    # incrementally. Begins when the short average is at least double the
+    # long average and ends when it falls below the long average at the
+    # beginning.
+    name = 'change'
+
+    def __init__(self, series='rate', median=False, short_size=6,
+                 long_size=90, begin_change=1.0, warmup=0):
+        super().__init__(series, warmup=warmup)
+        self._median = median
+        self._short_window = RollingWindow(short_size, median)
+        self._long_window = RollingWindow(long_size, median)
+        self._begin_change = begin_change
+        self.begin_threshold = None
+        self.end_threshold = None
+
+    @property
+    def event_type(self):
+        return SERIES_EVENT_TYPES[self._series]
+
+    def _update(self, value, timestamp):
+        self._short_window.append(value)
+        self._long_window.append(value)
+
+        if self._median:
+            avg_short = self._short_window.median()
+            avg_long = self._long_window.median()
+        else:
+            avg_short = self._short_window.mean()
+            avg_long = self._long_window.mean()
+
+        if self._active:
+            return avg_short >= self.end_threshold
+
+        if avg_long != 0:
+            change = (avg_short - avg_long) / avg_long
+        elif avg_short > 0:
+            change = float('inf')
+        else:
+            change = 0
+
+        if change >= self._begin_change:
+            self.begin_threshold = avg_short
+            self.end_threshold = avg_long
+            return True
+
+        return False
+
+
+DETECTOR_CLASSES = {
+    detector_class.name: detector_class
+    for detector_class in (EWMACrossoverDetector, ZScoreDetector,
+                           CUSUMDetector, BaselineDetector)
+}
+
+
+def create_detectors(names, series_names=('rate', 'hint'), baseline=None):
+    detectors = []
+
+    for name in names:
+        for series in series_names:
+            if name == BaselineDetector.name:
+                detectors.append(BaselineDetector(series, baseline=baseline))
+            else:
+                detectors.append(DETECTOR_CLASSES[name](series))
+
+    return detectors
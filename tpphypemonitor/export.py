@@ -0,0 +1,250 @@
+import array
+import ast
+import json
+import os
+import struct
+import threading
+
+from tpphypemonitor.calc import BIN_SIZES, DATA_POINT_FIELDS
+from tpphypemonitor.history import COMBINED_EVENT_TYPES
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# Fixed header size leaves room for the shape to grow without moving the data
+NPY_HEADER_SIZE = 128
+NPY_DESCR = {
+    'q': '<i8',
+    'd': '<f8',
+}
+EVENT_TYPE_LENGTH = 16
+EXPORTED_TAIL_LEN = 16
+
+
+# Append-only one dimensional .npy file that can be opened with
+# numpy.load(filename, mmap_mode='r') while it grows.
+class NpyAppender(object):
+    def __init__(self, filename, typecode):
+        self._filename = filename
+        self._typecode = typecode
+
+        if typecode in NPY_DESCR:
+            self._descr = NPY_DESCR[typecode]
+            self._item_size = array.array(typecode).itemsize
+        else:
+            assert typecode == 'U'
+            self._descr = '<U{}'.format(EVENT_TYPE_LENGTH)
+            self._item_size = EVENT_TYPE_LENGTH * 4
+
+        if os.path.exists(filename):
+            self._length = self._read_header()
+            self._file = open(filename, 'r+b')
+            self._file.truncate(NPY_HEADER_SIZE + self._length * self._item_size)
+        else:
+            self._length = 0
+            self._file = open(filename, 'w+b')
+            self._write_header()
+
+    def __len__(self):
+        return self._length
+
+    def _read_header(self):
+        with open(self._filename, 'rb') as file:
+            data = file.read(NPY_HEADER_SIZE)
+
+        if not data.startswith(NPY_MAGIC):
+            raise ValueError('Not an npy file: {}'.format(self._filename))
+
+        header_len = struct.unpack('<H', data[8:10])[0]
+        header = ast.literal_eval(data[10:10 + header_len].decode('latin1'))
+
+        if header['descr'] != self._descr:
+            raise ValueError('Unexpected dtype {} in {}'.format(
+                header['descr'], self._filename))
+
+        return header['shape'][0]
+
+    def _write_header(self):
+        header = "{{'descr': '{}', 'fortran_order': False, 'shape': ({},), }}"\
+            .format(self._descr, self._length)
+        header_len = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+        header = header.ljust(header_len - 1) + '\n'
+
+        self._file.seek(0)
+        self._file.write(NPY_MAGIC)
+        self._file.write(struct.pack('<H', header_len))
+        self._file.write(header.encode('latin1'))
+
+    def last_value(self):
+        if not self._length:
+            return
+
+        values = self.read(self._length - 1)
+        return values[0]
+
+    def read(self, index=0):
+        self._file.seek(NPY_HEADER_SIZE + index * self._item_size)
+        data = self._file.read()
+
+        if self._typecode == 'U':
+            return [
+                data[offset:offset + self._item_size].decode('utf-32-le')
+                .rstrip('\0')
+                for offset in range(0, len(data), self._item_size)
+            ]
+        else:
+            values = array.array(self._typecode)
+            values.frombytes(data)
+            return values
+
+    def append(self, values):
+        if not values:
+            return
+
+        if self._typecode == 'U':
+            data = b''.join(
+                value[:EVENT_TYPE_LENGTH].ljust(EVENT_TYPE_LENGTH, '\0')
+                .encode('utf-32-le')
+                for value in values
+            )
+        else:
+            data = array.array(self._typecode, values).tobytes()
+
+        self._file.seek(NPY_HEADER_SIZE + self._length * self._item_size)
+        self._file.write(data)
+        self._length += len(values)
+        self._write_header()
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# Only sealed bins and complete hype events are appended so exports can
+# be resumed after restarts and read while they grow.
+class BinExporter(object):
+    def __init__(self, directory, bin_sizes=BIN_SIZES):
+        self._directory = directory
+        self._bin_sizes = bin_sizes
+        self._lock = threading.Lock()
+        self._pending = dict((bin_size, []) for bin_size in bin_sizes)
+        self._next_timestamps = {}
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._columns = {}
+
+        for bin_size in bin_sizes:
+            columns = [('timestamp', self._open('bins', bin_size, 'timestamp', 'd'))]
+
+            for field, typecode in DATA_POINT_FIELDS:
+                columns.append(
+                    (field, self._open('bins', bin_size, field, typecode)))
+
+            self._columns[bin_size] = columns
+
+            last_timestamp = columns[0][1].last_value()
+
+            if last_timestamp is not None:
+                self._next_timestamps[bin_size] = last_timestamp + bin_size
+
+        self._event_columns = (
+            self._open('hype_events', None, 'begin', 'd'),
+            self._open('hype_events', None, 'end', 'd'),
+            self._open('hype_events', None, 'type', 'U'),
+        )
+
+        self._write_manifest()
+
+    def _open(self, prefix, bin_size, field, typecode):
+        if bin_size:
+            name = '{}-{}.{}.npy'.format(prefix, bin_size, field)
+        else:
+            name = '{}.{}.npy'.format(prefix, field)
+
+        return NpyAppender(os.path.join(self._directory, name), typecode)
+
+    def _write_manifest(self):
+        doc = {
+            'bin_sizes': list(self._bin_sizes),
+            'bin_fields': ['timestamp'] + [field for field, typecode in DATA_POINT_FIELDS],
+            'hype_event_fields': ['begin', 'end', 'type'],
+        }
+
+        path = os.path.join(self._directory, 'manifest.json')
+        with open(path + '-new', 'w') as file:
+            json.dump(doc, file)
+
+        os.rename(path + '-new', path)
+
+    def add_data_point(self, bin_size, data_point):
+        if bin_size not in self._pending or \
+                data_point.timestamp < self._next_timestamps.get(bin_size, 0):
+            return
+
+        with self._lock:
+            self._pending[bin_size].append(data_point)
+
+    def export(self, calculator):
+        with self._lock:
+            pending = self._pending
+            self._pending = dict((bin_size, []) for bin_size in self._bin_sizes)
+
+        for bin_size, data_points in pending.items():
+            for field, column in self._columns[bin_size]:
+                column.append(
+                    [getattr(data_point, field) for data_point in data_points])
+
+        self._export_hype_events(calculator.recent_hype_events)
+
+    def _export_hype_events(self, hype_events):
+        begin_column, end_column, type_column = self._event_columns
+        last_end_time = end_column.last_value()
+
+        if last_end_time is None:
+            last_end_time = float('-inf')
+
+        # Intervals ending at the last end time may not all have been
+        # exported yet
+        tail_index = max(0, len(end_column) - EXPORTED_TAIL_LEN)
+        exported = set(zip(
+            type_column.read(tail_index), end_column.read(tail_index)))
+
+        begins = []
+        ends = []
+        types = []
+        begin_times = {}
+
+        for event in hype_events:
+            kind, event_type, event_time = event[:3]
+
+            if kind == 'begin':
+                begin_times[event_type] = event_time
+                continue
+
+            if event_type not in begin_times and \
+                    event_type in COMBINED_EVENT_TYPES:
+                for other_event_type in COMBINED_EVENT_TYPES:
+                    if other_event_type in begin_times:
+                        event_type = other_event_type
+
+            begin_time = begin_times.pop(event_type, None)
+
+            if begin_time is None or event_time < last_end_time or \
+                    (event_type, event_time) in exported:
+                continue
+
+            begins.append(begin_time)
+            ends.append(event_time)
+            types.append(event_type)
+
+        begin_column.append(begins)
+        end_column.append(ends)
+        type_column.append(types)
+
+    def close(self):
+        for columns in self._columns.values():
+            for field, column in columns:
+                column.close()
+
+        for column in self._event_columns:
+            column.close()
@@ -0,0 +1,203 @@
+import logging
+import random
+import socket
+import time
+
+from tpphypemonitor.source import InputSourceThread
+
+_logger = logging.getLogger(__name__)
+
+RECONNECT_SUCCESS_THRESHOLD = 60
+RECONNECT_MIN_INTERVAL = 2
+RECONNECT_MAX_INTERVAL = 300
+KEEP_ALIVE = 60
+RECV_SIZE = 65536
+DEFAULT_TAG_KEYS = (b'emotes',)
+
+
+class ConnectionLost(Exception):
+    pass
+
+
+# Minimal Twitch IRC reader that only understands what the monitor needs.
+# Lines are split and sliced as bytes and only PRIVMSG to the channel is
+# decoded, instead of building an irc.client Event for every line.
+class TwitchChatReader(object):
+    def __init__(self, server, channel, message_callback, port=6667,
+                 tag_keys=DEFAULT_TAG_KEYS):
+        self._server = server
+        self._port = port
+        self._channel = channel.lower().encode('utf8')
+        self._message_callback = message_callback
+        self._tag_keys = frozenset(tag_keys)
+        self._socket = None
+        self._running = False
+        self._reconnect_time = RECONNECT_MIN_INTERVAL
+        self._login_time = 0
+
+    def run(self):
+        self._running = True
+
+        while self._running:
+            try:
+                self._connect()
+                self._read_forever()
+            except (OSError, ConnectionLost):
+                # stop() closes the socket under the read
+                if self._running:
+                    _logger.exception('Connection lost.')
+            finally:
+                self._close()
+
+            if self._running:
+                self._sleep_reconnect()
+
+    def stop(self):
+        self._running = False
+        self._close()
+
+    def _connect(self):
+        _logger.info('Connecting...')
+        self._login_time = 0
+        self._socket = socket.create_connection(
+            (self._server, self._port), timeout=KEEP_ALIVE)
+        nickname = 'justinfan{}'.format(random.randint(0, 1000000))
+
+        self._send(
+            b'CAP REQ :twitch.tv/tags twitch.tv/commands',
+            'NICK {}'.format(nickname).encode('ascii'),
+        )
+
+    def _close(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def _sleep_reconnect(self):
+        # Back off only if the connection did not last
+        if self._login_time and \
+                time.time() - self._login_time > RECONNECT_SUCCESS_THRESHOLD:
+            self._reconnect_time = RECONNECT_MIN_INTERVAL
+        else:
+            self._reconnect_time = min(
+                RECONNECT_MAX_INTERVAL, self._reconnect_time * 2)
+
+        _logger.info('Reconnecting in %s seconds.', self._reconnect_time)
+        time.sleep(self._reconnect_time)
+
+    def _send(self, *lines):
+        self._socket.sendall(b''.join(line + b'\r\n' for line in lines))
+
+    def _read_forever(self):
+        buffer = b''
+        ping_sent = False
+
+        while self._running:
+            try:
+                data = self._socket.recv(RECV_SIZE)
+            except socket.timeout:
+                if ping_sent:
+                    raise ConnectionLost('Keep alive timed out')
+
+                self._send(b'PING :keep-alive')
+                ping_sent = True
+                continue
+
+            if not data:
+                raise ConnectionLost('Server closed connection')
+
+            ping_sent = False
+            lines = (buffer + data).split(b'\r\n')
+            buffer = lines.pop()
+
+            for line in lines:
+                self._handle_line(line)
+
+    def _handle_line(self, line):
+        if line.startswith(b'@'):
+            index = line.find(b' ')
+            tags = line[1:index]
+            index += 1
+        else:
+            tags = None
+            index = 0
+
+        if line.startswith(b'PING', index):
+            self._send(b'PONG' + line[index + 4:])
+            return
+
+        if not line.startswith(b':', index):
+            return
+
+        prefix_end = line.find(b' ', index)
+        command_end = line.find(b' ', prefix_end + 1)
+
+        if command_end < 0:
+            # Commands such as RECONNECT have no parameters
+            command_end = len(line)
+
+        command = line[prefix_end + 1:command_end]
+
+        if command == b'PRIVMSG':
+            self._handle_privmsg(line, tags, index, prefix_end, command_end)
+        elif command == b'001':
+            _logger.info('Logged in to server.')
+            self._login_time = time.time()
+            self._send(b'JOIN ' + self._channel)
+        elif command == b'RECONNECT':
+            raise ConnectionLost('Server requested reconnect')
+
+    def _handle_privmsg(self, line, tags, prefix_start, prefix_end,
+                        command_end):
+        channel_end = line.find(b' ', command_end + 1)
+
+        if line[command_end + 1:channel_end].lower() != self._channel:
+            return
+
+        nick_end = line.find(b'!', prefix_start, prefix_end)
+
+        if nick_end < 0:
+            return
+
+        nick = line[prefix_start + 1:nick_end].lower().decode('utf8', 'replace')
+        text = line[channel_end + 2:].decode('utf8', 'replace')
+
+        if tags and self._tag_keys:
+            tags = self._parse_tags(tags)
+        else:
+            tags = None
+
+        self._message_callback(nick, text, tags)
+
+    def _parse_tags(self, tags):
+        result = {}
+
+        for tag in tags.split(b';'):
+            key, sep, value = tag.partition(b'=')
+
+            if key in self._tag_keys:
+                result[key.decode('ascii')] = value.decode('utf8', 'replace')
+
+        return result
+
+
+class FastTwitchInputSource(InputSourceThread):
+    def __init__(self, server, channel, port=6667):
+        super().__init__()
+        self._server = server
+        self._channel = channel
+        self._port = port
+        self._reader = None
+
+    def run(self):
+        def feed_calculator(nick, text, tags):
+            if random.random() < 0.1:
+                _logger.debug('Chat: %s: %s', nick, text)
+            self._calculator.add_chat_activity(nick, text, tags=tags)
+
+        self._reader = TwitchChatReader(
+            self._server, self._channel, feed_calculator, port=self._port)
+        self._reader.run()
+
+    def stop(self):
+        self._reader.stop()
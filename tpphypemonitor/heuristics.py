@@ -1,5 +1,14 @@
+import array
+import bisect
+import collections
+import functools
+import json
+import logging
+import os
 import re
 
+_logger = logging.getLogger(__name__)
+
 elapsed_time_pattern = re.compile(r'\[?\s*(\d+)\s?d\s*(\d+)\s?h\s*(\d+)\s*m',
                                   re.IGNORECASE)
 
@@ -23,16 +32,196 @@ IMPORTANT_CHAT_PATTERNS = (
     r'\bvictory riot\b',
     r'\bFailFish\b',
 )
+# Emote IDs from the Twitch emotes tag that are also chat patterns above
+IMPORTANT_CHAT_EMOTES = {
+    '88': 'PogChamp',
+    '360': 'FailFish',
+}
+
+
+def parse_emotes(emotes_tag):
+    # The tag looks like "88:0-7,12-19/360:21-28"
+    emote_counts = {}
+
+    if not emotes_tag:
+        return emote_counts
+
+    for emote in emotes_tag.split('/'):
+        emote_id, sep, positions = emote.partition(':')
+        emote_counts[emote_id] = positions.count(',') + 1
+
+    return emote_counts
+
+
+Hint = collections.namedtuple('Hint', ['key', 'text'])
+PatternSet = collections.namedtuple(
+    'PatternSet',
+    ['chat_patterns', 'live_thread_patterns', 'chat_emote_patterns',
+     'chat_phrase_patterns']
+)
+
+
+def hint_label(key):
+    # "chat:\\bPogChamp\\b" -> "PogChamp"
+    return key.split(':', 1)[-1].replace('\\b', '')
+
+
+def make_pattern_set(chat_patterns=IMPORTANT_CHAT_PATTERNS,
+                     live_thread_patterns=IMPORTANT_LIVE_THREAD_PATTERNS,
+                     chat_emotes=IMPORTANT_CHAT_EMOTES):
+    chat_emote_patterns = {}
+
+    for emote_id, name in chat_emotes.items():
+        # Emotes without a matching pattern are not hints, as in the text
+        for pattern in chat_patterns:
+            if re.search(pattern, name):
+                chat_emote_patterns[emote_id] = (pattern, name)
+                break
+
+    emote_patterns = set(
+        pattern for pattern, name in chat_emote_patterns.values())
+
+    return PatternSet(
+        tuple(chat_patterns),
+        tuple(live_thread_patterns),
+        chat_emote_patterns,
+        tuple(pattern for pattern in chat_patterns
+              if pattern not in emote_patterns)
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_line_pattern(pattern):
+    # Anchors to the whole string and lookarounds can see past the line
+    # separator, so those patterns are searched line by line
+    if any(token in pattern for token in ('\\A', '\\Z', '(?<', '(?=', '(?!')):
+        return
+
+    return re.compile(pattern, re.MULTILINE)
+
+
+def _search_line(patterns, text):
+    for pattern_index, pattern in enumerate(patterns):
+        if re.search(pattern, text):
+            return pattern_index
+
+    return -1
+
+
+def search_lines(patterns, texts):
+    # Returns the index of the first pattern found in each text, or -1.
+    # The texts are joined by newlines so each pattern scans all of them in
+    # one call; texts that a match spans into are searched again alone.
+    results = array.array('h', [-1]) * len(texts)
+    recheck_indexes = set()
+    line_indexes = []
+    line_starts = []
+    offset = 0
+
+    for index, text in enumerate(texts):
+        if '\n' in text:
+            recheck_indexes.add(index)
+        else:
+            line_indexes.append(index)
+            line_starts.append(offset)
+            offset += len(text) + 1
+
+    joined_text = '\n'.join(texts[index] for index in line_indexes)
+    remaining = len(line_indexes)
+
+    for pattern_index, pattern in enumerate(patterns):
+        if not remaining:
+            break
+
+        compiled_pattern = _compile_line_pattern(pattern)
+
+        if compiled_pattern is None:
+            for index in line_indexes:
+                if results[index] < 0 and re.search(pattern, texts[index]):
+                    results[index] = pattern_index
+                    remaining -= 1
+
+            continue
+
+        for match in compiled_pattern.finditer(joined_text):
+            line = bisect.bisect_right(line_starts, match.start()) - 1
+
+            if '\n' in match.group(0):
+                end_line = bisect.bisect_right(line_starts, match.end() - 1) - 1
+                recheck_indexes.update(line_indexes[line:end_line + 2])
+                continue
+
+            index = line_indexes[line]
+
+            if results[index] < 0:
+                results[index] = pattern_index
+                remaining -= 1
+
+    for index in recheck_indexes:
+        results[index] = _search_line(patterns, texts[index])
+
+    return results
+
+
+def load_pattern_set(filename):
+    with open(filename) as file:
+        doc = json.load(file)
+
+    return make_pattern_set(
+        doc.get('chat_patterns', IMPORTANT_CHAT_PATTERNS),
+        doc.get('live_thread_patterns', IMPORTANT_LIVE_THREAD_PATTERNS),
+        doc.get('chat_emotes', IMPORTANT_CHAT_EMOTES),
+    )
 
 
 class TextAnalyzer(object):
-    def __init__(self, run_start_timestamp):
+    def __init__(self, run_start_timestamp, patterns_filename=None):
         self._run_start_timestamp = run_start_timestamp
+        self._patterns_filename = patterns_filename
+        self._patterns_mtime = None
+        self._patterns_missing = False
+        self._pattern_set = make_pattern_set()
+
+        if patterns_filename:
+            self.reload_patterns()
 
     @property
     def run_start_timestamp(self):
         return self._run_start_timestamp
 
+    @property
+    def patterns_filename(self):
+        return self._patterns_filename
+
+    def reload_patterns(self):
+        # Hint keys are the patterns themselves, so counts of patterns
+        # that are kept continue across reloads
+        try:
+            mtime = os.path.getmtime(self._patterns_filename)
+        except OSError as error:
+            # Editors may replace the file, so the current patterns are kept
+            if not self._patterns_missing:
+                _logger.warning('Could not check patterns %s: %s',
+                                self._patterns_filename, error)
+                self._patterns_missing = True
+
+            return
+
+        self._patterns_missing = False
+
+        if mtime == self._patterns_mtime:
+            return
+
+        try:
+            self._pattern_set = load_pattern_set(self._patterns_filename)
+        except (OSError, ValueError, re.error):
+            _logger.exception('Could not load patterns %s',
+                              self._patterns_filename)
+        else:
+            _logger.info('Loaded patterns %s', self._patterns_filename)
+
+        self._patterns_mtime = mtime
+
     def analyze_live_thread(self, doc):
         timestamp = doc['created_utc']
         text = doc['body']
@@ -55,13 +244,75 @@ class TextAnalyzer(object):
         if IMPORTANT_MARKER not in text:
             return
 
-        for pattern in IMPORTANT_LIVE_THREAD_PATTERNS:
+        for pattern in self._pattern_set.live_thread_patterns:
             match = re.search(pattern, text)
             if match:
-                return match
+                return Hint('live_thread:' + pattern, match.group(0))
+
+    def classify_batch(self, texts, emote_counts_list=None):
+        # Returns an array of indexes into the returned tuple of hint keys,
+        # or -1 for texts without a hint. Identical texts are only searched
+        # once.
+        pattern_set = self._pattern_set
+        results = array.array('h', [-1]) * len(texts)
+        keys = []
+        key_indexes = {}
+        phrase_lines = collections.OrderedDict()
+        chat_lines = collections.OrderedDict()
+
+        def key_index(key):
+            if key not in key_indexes:
+                key_indexes[key] = len(keys)
+                keys.append(key)
+
+            return key_indexes[key]
+
+        for index, text in enumerate(texts):
+            emote_counts = emote_counts_list[index] \
+                if emote_counts_list else None
+
+            if emote_counts is None:
+                chat_lines.setdefault(text, []).append(index)
+                continue
+
+            for emote_id in emote_counts:
+                if emote_id in pattern_set.chat_emote_patterns:
+                    pattern, name = pattern_set.chat_emote_patterns[emote_id]
+                    results[index] = key_index('chat:' + pattern)
+                    break
+            else:
+                phrase_lines.setdefault(text, []).append(index)
+
+        for patterns, lines in ((pattern_set.chat_phrase_patterns, phrase_lines),
+                                (pattern_set.chat_patterns, chat_lines)):
+            unique_texts = tuple(lines)
+
+            for text, pattern_index in zip(
+                    unique_texts, search_lines(patterns, unique_texts)):
+                if pattern_index >= 0:
+                    result = key_index('chat:' + patterns[pattern_index])
+
+                    for index in lines[text]:
+                        results[index] = result
+
+        return results, tuple(keys)
+
+    def analyze_chat(self, text, emote_counts=None):
+        pattern_set = self._pattern_set
+
+        # Emotes are taken from the tags when available so only the
+        # remaining phrases need to be searched in the text
+        if emote_counts is not None:
+            for emote_id in emote_counts:
+                if emote_id in pattern_set.chat_emote_patterns:
+                    pattern, name = pattern_set.chat_emote_patterns[emote_id]
+                    return Hint('chat:' + pattern, name)
+
+            patterns = pattern_set.chat_phrase_patterns
+        else:
+            patterns = pattern_set.chat_patterns
 
-    def analyze_chat(self, text):
-        for pattern in IMPORTANT_CHAT_PATTERNS:
+        for pattern in patterns:
             match = re.search(pattern, text)
             if match:
-                return match
+                return Hint('chat:' + pattern, match.group(0))
@@ -0,0 +1,239 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+_logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = 100
+TOP_HINTS_COUNT = 5
+# The combined chat and hint event ends with the type of whichever ended last
+COMBINED_EVENT_TYPES = ('chat', 'hint')
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hype_events (
+    id INTEGER PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    begin_time REAL NOT NULL,
+    end_time REAL,
+    run_start_timestamp REAL,
+    peak_rate REAL,
+    average_rate REAL,
+    peak_hint_rate REAL,
+    average_hint_rate REAL,
+    top_hints TEXT,
+    begin_hints TEXT,
+    UNIQUE (event_type, begin_time)
+);
+CREATE INDEX IF NOT EXISTS hype_events_begin_time
+    ON hype_events (begin_time);
+CREATE INDEX IF NOT EXISTS hype_events_event_type
+    ON hype_events (event_type, begin_time);
+CREATE INDEX IF NOT EXISTS hype_events_run_start_timestamp
+    ON hype_events (run_start_timestamp, begin_time);
+'''
+COLUMNS = (
+    'event_type', 'begin_time', 'end_time', 'run_start_timestamp',
+    'peak_rate', 'average_rate', 'peak_hint_rate', 'average_hint_rate',
+    'top_hints', 'begin_hints'
+)
+
+
+def _top_hints_json(hint_breakdown):
+    return json.dumps(
+        sorted(hint_breakdown.items(), key=lambda item: -item[1])
+        [:TOP_HINTS_COUNT])
+
+
+def _connect(filename):
+    connection = sqlite3.connect(filename, timeout=30)
+    # Readers such as the CLI don't block the writer
+    connection.execute('PRAGMA journal_mode=WAL')
+    return connection
+
+
+# Hype events kept in SQLite. Statements are queued by the hype event
+# listener and written by a separate thread in batched transactions.
+class HypeHistory(object):
+    def __init__(self, filename, run_start_timestamp=None, calculator=None):
+        self._filename = filename
+        self._run_start_timestamp = run_start_timestamp
+        self._calculator = calculator
+        self._queue = queue.Queue()
+
+        connection = _connect(filename)
+
+        with connection:
+            connection.executescript(SCHEMA)
+            columns = set(
+                row[1] for row in
+                connection.execute('PRAGMA table_info(hype_events)'))
+
+            # Databases from before the hints at begin were kept
+            if 'begin_hints' not in columns:
+                connection.execute(
+                    'ALTER TABLE hype_events ADD COLUMN begin_hints TEXT')
+
+        # Events that were still ongoing when last stopped
+        self._begin_times = dict(connection.execute(
+            'SELECT event_type, begin_time FROM hype_events '
+            'WHERE end_time IS NULL'
+        ))
+        connection.close()
+
+        self._thread = threading.Thread(target=self._write_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_hype_event(self, event):
+        kind, event_type, event_time, hint_breakdown = event
+
+        if kind == 'begin':
+            self._begin_times[event_type] = event_time
+            self._queue.put((
+                'INSERT OR IGNORE INTO hype_events '
+                '(event_type, begin_time, run_start_timestamp, begin_hints) '
+                'VALUES (?, ?, ?, ?)',
+                (event_type, event_time, self._run_start_timestamp,
+                 _top_hints_json(hint_breakdown))
+            ))
+            return
+
+        if event_type not in self._begin_times and \
+                event_type in COMBINED_EVENT_TYPES:
+            for other_event_type in COMBINED_EVENT_TYPES:
+                if other_event_type in self._begin_times:
+                    event_type = other_event_type
+
+        begin_time = self._begin_times.pop(event_type, None)
+
+        if begin_time is None:
+            _logger.warning('No begin for hype event %s ending %s',
+                            event_type, event_time)
+            return
+
+        if self._calculator:
+            summary = self._calculator.activity_summary(begin_time, event_time)
+            hint_breakdown = self._calculator.hint_breakdown(
+                event_time - begin_time, event_time)
+        else:
+            summary = (None, None, None, None)
+
+        top_hints = _top_hints_json(hint_breakdown)
+
+        self._queue.put((
+            'UPDATE hype_events SET end_time = ?, peak_rate = ?, '
+            'average_rate = ?, peak_hint_rate = ?, average_hint_rate = ?, '
+            'top_hints = ? WHERE event_type = ? AND begin_time = ?',
+            (event_time,) + tuple(summary) +
+            (top_hints, event_type, begin_time)
+        ))
+
+    def _write_forever(self):
+        connection = _connect(self._filename)
+        running = True
+
+        while running:
+            items = [self._queue.get()]
+
+            while len(items) < WRITE_BATCH_SIZE:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                with connection:
+                    for item in items:
+                        if item is None:
+                            running = False
+                        else:
+                            connection.execute(*item)
+            except sqlite3.Error:
+                _logger.exception('Could not write hype events')
+            finally:
+                for item in items:
+                    self._queue.task_done()
+
+        connection.close()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def recent_events(self, limit):
+        # The newest begins and ends as (kind, event type, time, hints)
+        # tuples, oldest first. Queued writes are waited for so events
+        # just added are included.
+        self._queue.join()
+        events = []
+
+        for row in query_hype_events(self._filename, limit=limit):
+            events.append((
+                'begin', row['event_type'], row['begin_time'],
+                dict(row['begin_hints'])
+            ))
+
+            if row['end_time'] is not None:
+                events.append((
+                    'end', row['event_type'], row['end_time'],
+                    dict(row['top_hints'])
+                ))
+
+        events.sort(key=lambda event: event[2])
+
+        return events[-limit:]
+
+
+def query_hype_events(filename, since=None, until=None, event_type=None,
+                      run_start_timestamp=None, run_day=None, limit=None):
+    conditions = []
+    params = []
+
+    if since is not None:
+        conditions.append('begin_time >= ?')
+        params.append(since)
+
+    if until is not None:
+        conditions.append('begin_time < ?')
+        params.append(until)
+
+    if event_type:
+        conditions.append('event_type = ?')
+        params.append(event_type)
+
+    if run_day is not None:
+        conditions.append('run_start_timestamp = ? AND '
+                          'begin_time >= ? AND begin_time < ?')
+        day_start = run_start_timestamp + run_day * 86400
+        params.extend((run_start_timestamp, day_start,
+                       day_start + 86400))
+
+    sql = 'SELECT {} FROM hype_events'.format(', '.join(COLUMNS))
+
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+
+    sql += ' ORDER BY begin_time'
+
+    if limit:
+        sql = 'SELECT * FROM ({} DESC LIMIT ?) ORDER BY begin_time'\
+            .format(sql)
+        params.append(limit)
+
+    connection = _connect(filename)
+
+    try:
+        rows = connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+
+    results = []
+
+    for row in rows:
+        result = dict(zip(COLUMNS, row))
+        result['top_hints'] = json.loads(result['top_hints'] or '[]')
+        result['begin_hints'] = json.loads(result['begin_hints'] or '[]')
+        results.append(result)
+
+    return results
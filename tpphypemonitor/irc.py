@@ -14,14 +14,17 @@ _logger = logging.getLogger(__name__)
 
 
 class IRCClient(irc.client.SimpleIRCClient):
-    def __init__(self, reconnect_min_interval=RECONNECT_MIN_INTERVAL):
+    def __init__(self, reconnect_min_interval=RECONNECT_MIN_INTERVAL,
+                 rate_limit=IRC_RATE_LIMIT):
         super().__init__()
         self._reconnect_min_interval = reconnect_min_interval
         self._reconnect_time = reconnect_min_interval
         self._last_connect = 0
 
         irc.client.ServerConnection.buffer_class.errors = 'replace'
-        self.connection.set_rate_limit(IRC_RATE_LIMIT)
+
+        if rate_limit:
+            self.connection.set_rate_limit(rate_limit)
 
         self.reactor.execute_every(KEEP_ALIVE, self._keep_alive)
 
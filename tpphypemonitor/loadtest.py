@@ -0,0 +1,373 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+SEND_INTERVAL = 0.01
+RECV_SIZE = 4096
+SERVER_NAME = b'tmi.twitch.tv'
+SYNTHETIC_TEXTS = (
+    'a', 'b', 'up', 'down', 'left', 'right', 'start9', 'a2b2', 'democracy',
+    'anarchy', 'PogChamp', 'we did it', 'FailFish why', 'hello chat',
+    'left2right2', 'select',
+)
+
+
+def synthetic_messages():
+    for index in itertools.count():
+        text = SYNTHETIC_TEXTS[index % len(SYNTHETIC_TEXTS)]
+
+        if index % 7 == 0:
+            text = '{} {}'.format(text, index)
+
+        yield 'user{}'.format(index % 5000), text
+
+
+def log_messages(filenames, max_lines=100000):
+    from tpphypemonitor.simulation import ChatLogReader
+
+    messages = [
+        (nick, text) for timestamp, nick, text, position in
+        itertools.islice(ChatLogReader(filenames).items(), max_lines)
+    ]
+
+    if not messages:
+        raise ValueError('No chat lines in {}'.format(filenames))
+
+    return itertools.cycle(messages)
+
+
+def format_privmsg(channel, nick, text):
+    emotes = '88:0-7' if text.startswith('PogChamp') else ''
+
+    return '@badges=;color=;display-name={nick};emotes={emotes};' \
+           'tmi-sent-ts={sent_ts} :{nick}!{nick}@{nick}.tmi.twitch.tv ' \
+           'PRIVMSG {channel} :{text}\r\n'.format(
+               nick=nick, emotes=emotes, channel=channel, text=text,
+               sent_ts=int(time.time() * 1000)).encode('utf8')
+
+
+# Twitch IRC stand-in that answers the login, CAP, JOIN and PING, then
+# sends PRIVMSG lines to each joined client at a rate that starts at
+# `rate` lines/sec and increases by `ramp` lines/sec every second up to
+# `max_rate`.
+class FakeTwitchServer(object):
+    def __init__(self, messages, host='127.0.0.1', port=0,
+                 channel='#twitchplayspokemon', rate=100, ramp=0,
+                 max_rate=None):
+        self._messages = messages
+        self._channel = channel
+        self._rate = rate
+        self._ramp = ramp
+        self._max_rate = max_rate
+        self._messages_lock = threading.Lock()
+        self._sent_count = 0
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.listen(5)
+
+    @property
+    def port(self):
+        return self._socket.getsockname()[1]
+
+    @property
+    def sent_count(self):
+        return self._sent_count
+
+    def current_rate(self, elapsed_time):
+        rate = self._rate + self._ramp * elapsed_time
+
+        if self._max_rate:
+            rate = min(rate, self._max_rate)
+
+        return rate
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def serve_forever(self):
+        while True:
+            connection, address = self._socket.accept()
+            _logger.info('Client connected from %s', address)
+            thread = threading.Thread(
+                target=self._handle_client, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def _handle_client(self, connection):
+        try:
+            if self._handshake(connection):
+                self._send_messages(connection)
+        except OSError as error:
+            _logger.info('Client disconnected: %s', error)
+        finally:
+            connection.close()
+
+    def _handshake(self, connection):
+        buffer = b''
+        nick = b'justinfan'
+
+        while True:
+            data = connection.recv(RECV_SIZE)
+
+            if not data:
+                return False
+
+            lines = (buffer + data).split(b'\n')
+            buffer = lines.pop()
+
+            for line in lines:
+                line = line.rstrip(b'\r')
+                command, sep, params = line.partition(b' ')
+
+                if command == b'NICK':
+                    nick = params.lstrip(b':')
+                    connection.sendall(
+                        b':' + SERVER_NAME + b' 001 ' + nick +
+                        b' :Welcome, GLHF!\r\n' +
+                        b':' + SERVER_NAME + b' 376 ' + nick +
+                        b' :>\r\n')
+                elif command == b'CAP':
+                    connection.sendall(
+                        b':' + SERVER_NAME + b' CAP * ACK ' +
+                        params.partition(b' ')[2] + b'\r\n')
+                elif command == b'PING':
+                    connection.sendall(
+                        b':' + SERVER_NAME + b' PONG ' + SERVER_NAME + b' ' +
+                        params + b'\r\n')
+                elif command == b'JOIN':
+                    connection.sendall(
+                        b':' + nick + b'!' + nick + b'@' + nick + b'.' +
+                        SERVER_NAME + b' JOIN ' + params + b'\r\n')
+                    return True
+
+    def _send_messages(self, connection):
+        # Replies to the client are not needed while streaming, but PING
+        # must not fill the client's send buffer
+        reader = threading.Thread(target=self._drain, args=(connection,))
+        reader.daemon = True
+        reader.start()
+
+        channel = self._channel
+        time_start = prev_time = time.monotonic()
+        due = 0
+        sent = 0
+
+        while True:
+            current_time = time.monotonic()
+            due += self.current_rate(current_time - time_start) * \
+                (current_time - prev_time)
+            prev_time = current_time
+            count = int(due) - sent
+
+            if count > 0:
+                with self._messages_lock:
+                    messages = list(itertools.islice(self._messages, count))
+
+                # Blocks when the client falls behind reading
+                connection.sendall(b''.join(
+                    format_privmsg(channel, nick, text)
+                    for nick, text in messages))
+                sent += count
+                self._sent_count += count
+
+            time.sleep(SEND_INTERVAL)
+
+    def _drain(self, connection):
+        try:
+            while connection.recv(RECV_SIZE):
+                pass
+        except OSError:
+            pass
+
+
+def _process_usage(pid):
+    # CPU seconds and resident memory in bytes from /proc
+    try:
+        with open('/proc/{}/stat'.format(pid)) as file:
+            fields = file.read().rsplit(')', 1)[1].split()
+
+        with open('/proc/{}/statm'.format(pid)) as file:
+            resident_pages = int(file.read().split()[1])
+    except OSError:
+        return None, None
+
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    cpu_time = (int(fields[11]) + int(fields[12])) / clock_ticks
+
+    return cpu_time, resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _read_stats(filename):
+    try:
+        with open(filename) as file:
+            return json.load(file)['stats']['ingest']
+    except (OSError, ValueError, KeyError):
+        return
+
+
+def _format_value(value, format_str='{:.3f}'):
+    return format_str.format(value) if value is not None else '-'
+
+
+def run_load_test(args):
+    if args.chat_log:
+        messages = log_messages(args.chat_log)
+    else:
+        messages = synthetic_messages()
+
+    server = FakeTwitchServer(
+        messages, rate=args.rate, ramp=args.ramp, max_rate=args.max_rate)
+    server.start()
+
+    temp_dir = tempfile.mkdtemp()
+    stats_filename = os.path.join(temp_dir, 'stats.json')
+    command = [
+        sys.executable, '-m', 'tpphypemonitor',
+        '--server', '127.0.0.1', '--port', str(server.port),
+        '--print-summary-interval', '0',
+        '--stats-output-filename', stats_filename,
+        '--stats-output-interval', str(args.interval),
+    ] + args.monitor_args + ['irc']
+
+    if args.fast:
+        command.append('--fast')
+
+    _logger.info('Running %s', ' '.join(command))
+    process = subprocess.Popen(command)
+    time_start = time.monotonic()
+    prev_time = time_start
+    prev_sent = 0
+    prev_processed = 0
+    prev_cpu_time = 0
+    behind_rate = None
+
+    print('time sent/s processed/s queue lag_p50 lag_p90 lag_p99 cpu% rss_mb')
+
+    try:
+        while time.monotonic() - time_start < args.duration:
+            time.sleep(args.interval)
+
+            if process.poll() is not None:
+                raise Exception('Monitor exited with {}'.format(
+                    process.returncode))
+
+            current_time = time.monotonic()
+            interval = current_time - prev_time
+            stats = _read_stats(stats_filename) or {}
+            processed = stats.get('lines_processed', 0)
+            sent = server.sent_count
+            cpu_time, rss = _process_usage(process.pid)
+
+            sent_rate = (sent - prev_sent) / interval
+            processed_rate = (processed - prev_processed) / interval
+            cpu_percent = (cpu_time - prev_cpu_time) / interval * 100 \
+                if cpu_time is not None else None
+
+            print('{:.0f} {:.0f} {:.0f} {} {} {} {} {} {}'.format(
+                current_time - time_start, sent_rate, processed_rate,
+                stats.get('queue_depth', '-'),
+                _format_value(stats.get('lag_p50')),
+                _format_value(stats.get('lag_p90')),
+                _format_value(stats.get('lag_p99')),
+                _format_value(cpu_percent, '{:.0f}'),
+                _format_value(rss / 1024 / 1024 if rss else None, '{:.0f}'),
+            ))
+            sys.stdout.flush()
+
+            lag = stats.get('lag_p99')
+
+            if behind_rate is None and lag is not None and \
+                    lag > args.max_lag:
+                behind_rate = processed_rate
+                print('Falling behind at {:.0f} lines/sec (server sending '
+                      '{:.0f} lines/sec)'.format(
+                          processed_rate,
+                          server.current_rate(current_time - time_start)))
+
+            prev_time = current_time
+            prev_sent = sent
+            prev_processed = processed
+            prev_cpu_time = cpu_time or 0
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if behind_rate is None:
+        print('Kept up for {:.0f} seconds'.format(args.duration))
+
+
+def run_server(args):
+    if args.chat_log:
+        messages = log_messages(args.chat_log)
+    else:
+        messages = synthetic_messages()
+
+    server = FakeTwitchServer(
+        messages, port=args.port, rate=args.rate, ramp=args.ramp,
+        max_rate=args.max_rate)
+    _logger.info('Listening on port %s', server.port)
+    server.serve_forever()
+
+
+def parse_args(argv=None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rate', type=float, default=100)
+    arg_parser.add_argument('--ramp', type=float, default=0)
+    arg_parser.add_argument('--max-rate', type=float)
+    arg_parser.add_argument('--chat-log', nargs='+')
+    arg_parser.add_argument('--debug', action='store_const',
+                            dest='log_level',
+                            default=logging.INFO, const=logging.DEBUG)
+
+    subparsers = arg_parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    server_parser = subparsers.add_parser('server')
+    server_parser.add_argument('--port', type=int, default=6667)
+    server_parser.set_defaults(func=run_server)
+
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--duration', type=float, default=60)
+    run_parser.add_argument('--interval', type=float, default=5)
+    run_parser.add_argument('--max-lag', type=float, default=5)
+    run_parser.add_argument('--fast', action='store_true')
+    run_parser.set_defaults(func=run_load_test)
+
+    # Options not known here are passed on to the monitor
+    args, monitor_args = arg_parser.parse_known_args(argv)
+
+    if monitor_args and monitor_args[0] == '--':
+        monitor_args = monitor_args[1:]
+
+    if monitor_args and args.command != 'run':
+        arg_parser.error('unrecognized arguments: {}'.format(
+            ' '.join(monitor_args)))
+
+    args.monitor_args = monitor_args
+
+    return args
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=args.log_level)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import bisect
+import json
+import logging
+import os
+
+import arrow
+
+_logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.index.json'
+INDEX_INTERVAL = 60
+
+
+def index_filename(filename):
+    return filename + INDEX_SUFFIX
+
+
+def build_index(filename):
+    _logger.info('Building index for %s', filename)
+
+    stat_result = os.stat(filename)
+    entries = []
+    prev_prefix = None
+    offset = 0
+
+    with open(filename, 'rb') as file:
+        for line in file:
+            line_offset = offset
+            offset += len(line)
+
+            if not line.strip() or line.startswith(b'#'):
+                break
+
+            # Only the first line of each minute needs its date parsed
+            prefix = line[:16]
+
+            if prefix == prev_prefix:
+                continue
+
+            prev_prefix = prefix
+            datetime_str = line.split(b' ', 1)[0].decode('ascii', 'replace')
+            timestamp = arrow.get(datetime_str).timestamp
+            timestamp = timestamp // INDEX_INTERVAL * INDEX_INTERVAL
+
+            if not entries or entries[-1][0] != timestamp:
+                entries.append((timestamp, line_offset))
+
+    doc = {
+        'size': stat_result.st_size,
+        'mtime': stat_result.st_mtime,
+        'entries': entries,
+    }
+
+    path = index_filename(filename)
+    with open(path + '-new', 'w') as file:
+        json.dump(doc, file)
+
+    os.rename(path + '-new', path)
+
+    return doc
+
+
+def load_index(filename):
+    path = index_filename(filename)
+    stat_result = os.stat(filename)
+
+    if os.path.exists(path):
+        try:
+            with open(path) as file:
+                doc = json.load(file)
+        except ValueError:
+            _logger.warning('Corrupt index %s', path)
+        else:
+            if doc['size'] == stat_result.st_size and \
+                    doc['mtime'] == stat_result.st_mtime:
+                return doc
+
+    return build_index(filename)
+
+
+# Returns None if the file has no lines at or after the timestamp.
+def find_offset(filename, timestamp):
+    entries = load_index(filename)['entries']
+
+    if not entries or entries[-1][0] + INDEX_INTERVAL <= timestamp:
+        return
+
+    timestamps = [entry[0] for entry in entries]
+    index = bisect.bisect_right(timestamps, timestamp) - 1
+
+    if index < 0:
+        return 0
+
+    return entries[index][1]
@@ -0,0 +1,358 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b'TPPREC1\n'
+SEGMENT_SUFFIX = '.rec'
+INDEX_SUFFIX = '.index'
+SEGMENT_MAX_SIZE = 64 * 1024 * 1024
+SEGMENT_MAX_DURATION = 3600
+BLOCK_MAX_RECORDS = 4096
+BLOCK_MAX_DURATION = 10
+COMPRESS_LEVEL = 3
+# Magic, compressed nicks size, compressed records size, record count,
+# first and last timestamp
+BLOCK_HEADER = struct.Struct('<4sIIIdd')
+BLOCK_MAGIC = b'BLK1'
+# Block offset, first and last timestamp
+INDEX_ENTRY = struct.Struct('<Qdd')
+CHAT_RECORD = struct.Struct('<BdIII')
+LIVE_THREAD_RECORD = struct.Struct('<BdI')
+CHAT_TYPE = 1
+LIVE_THREAD_TYPE = 2
+NO_TAGS = 0xffffffff
+
+
+def _segment_filenames(directory):
+    return sorted(glob.glob(os.path.join(directory, '*' + SEGMENT_SUFFIX)))
+
+
+def _encode_tags(tags):
+    # NUL can't appear in IRC lines so it separates keys and values
+    return '\0'.join(
+        '{}\0{}'.format(key, value if value is not None else '')
+        for key, value in tags.items()
+    ).encode('utf8')
+
+
+def _decode_tags(data):
+    if not data:
+        return {}
+
+    parts = data.decode('utf8').split('\0')
+    return dict(zip(parts[::2], parts[1::2]))
+
+
+# Writes queue items from the calculator to segments of zlib compressed
+# blocks. Nicks are numbered per segment and each block lists the nicks it
+# introduces, so a block can be decoded after reading only the nick lists
+# of the blocks before it.
+class RecordingWriter(object):
+    def __init__(self, directory, segment_max_size=SEGMENT_MAX_SIZE,
+                 segment_max_duration=SEGMENT_MAX_DURATION):
+        self._directory = directory
+        self._segment_max_size = segment_max_size
+        self._segment_max_duration = segment_max_duration
+        self._file = None
+        self._index_file = None
+        self._sequence = 0
+        self._segment_timestamp = None
+        self._nick_ids = {}
+        self._new_nicks = []
+        self._records = []
+        self._record_count = 0
+        self._block_timestamps = None
+        # Closed from the main thread while the process thread adds items
+        self._lock = threading.Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        filenames = _segment_filenames(directory)
+
+        if filenames:
+            name = os.path.basename(filenames[-1])
+            self._sequence = int(name.split('-')[1].split('.')[0])
+
+    def add_items(self, items):
+        with self._lock:
+            self._add_items(items)
+
+    def _add_items(self, items):
+        for item in items:
+            if item[0] == 'chat':
+                timestamp = item[3]
+            elif item[0] == 'live_thread':
+                timestamp = item[2]
+            else:
+                continue
+
+            if self._block_timestamps and (
+                    self._record_count >= BLOCK_MAX_RECORDS or
+                    timestamp - self._block_timestamps[0] >=
+                    BLOCK_MAX_DURATION):
+                self._flush()
+
+            if not self._file or \
+                    self._file.tell() >= self._segment_max_size or \
+                    timestamp - self._segment_timestamp >= \
+                    self._segment_max_duration:
+                self._flush()
+                self._new_segment(timestamp)
+
+            if item[0] == 'chat':
+                self._add_chat(*item[1:])
+            else:
+                self._add_live_thread(item[1], item[2])
+
+            self._record_count += 1
+
+            if self._block_timestamps:
+                self._block_timestamps[1] = max(
+                    self._block_timestamps[1], timestamp)
+            else:
+                self._block_timestamps = [timestamp, timestamp]
+
+    def _add_chat(self, nick, text, timestamp, position=None, tags=None):
+        nick_id = self._nick_ids.get(nick)
+
+        if nick_id is None:
+            nick_id = self._nick_ids[nick] = len(self._nick_ids)
+            self._new_nicks.append(nick)
+
+        text = text.encode('utf8')
+
+        if tags is None:
+            tags_data = b''
+            tags_length = NO_TAGS
+        else:
+            tags_data = _encode_tags(tags)
+            tags_length = len(tags_data)
+
+        self._records.append(CHAT_RECORD.pack(
+            CHAT_TYPE, timestamp, nick_id, len(text), tags_length))
+        self._records.append(text)
+        self._records.append(tags_data)
+
+    def _add_live_thread(self, doc, timestamp):
+        data = json.dumps(doc).encode('utf8')
+        self._records.append(LIVE_THREAD_RECORD.pack(
+            LIVE_THREAD_TYPE, timestamp, len(data)))
+        self._records.append(data)
+
+    def _new_segment(self, timestamp):
+        self._close()
+
+        self._sequence += 1
+        path = os.path.join(self._directory, 'segment-{:06d}{}'.format(
+            self._sequence, SEGMENT_SUFFIX))
+
+        _logger.debug('New recording segment %s', path)
+
+        self._file = open(path, 'wb')
+        self._file.write(FILE_MAGIC)
+        self._index_file = open(path + INDEX_SUFFIX, 'wb')
+        self._segment_timestamp = timestamp
+        self._nick_ids = {}
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._block_timestamps:
+            return
+
+        nicks_data = zlib.compress(
+            '\n'.join(self._new_nicks).encode('utf8'), COMPRESS_LEVEL) \
+            if self._new_nicks else b''
+        records_data = zlib.compress(b''.join(self._records), COMPRESS_LEVEL)
+        offset = self._file.tell()
+
+        self._file.write(BLOCK_HEADER.pack(
+            BLOCK_MAGIC, len(nicks_data), len(records_data),
+            self._record_count,
+            self._block_timestamps[0], self._block_timestamps[1]))
+        self._file.write(nicks_data)
+        self._file.write(records_data)
+        self._file.flush()
+
+        self._index_file.write(INDEX_ENTRY.pack(
+            offset, self._block_timestamps[0], self._block_timestamps[1]))
+        self._index_file.flush()
+
+        self._new_nicks = []
+        self._records = []
+        self._record_count = 0
+        self._block_timestamps = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        self._flush()
+
+        if self._file:
+            self._file.close()
+            self._index_file.close()
+            self._file = None
+            self._index_file = None
+
+
+def _read_index(filename):
+    # Rebuilt from the block headers if the index is missing or behind
+    entries = []
+
+    if os.path.exists(filename + INDEX_SUFFIX):
+        with open(filename + INDEX_SUFFIX, 'rb') as file:
+            data = file.read()
+
+        entries = [
+            INDEX_ENTRY.unpack_from(data, offset)
+            for offset in range(0, len(data) - INDEX_ENTRY.size + 1,
+                                INDEX_ENTRY.size)
+        ]
+
+    with open(filename, 'rb') as file:
+        if entries:
+            offset = entries[-1][0]
+            file.seek(offset)
+            header = _read_block_header(file)
+
+            if not header:
+                return entries[:-1]
+
+            offset += BLOCK_HEADER.size + header[1] + header[2]
+        else:
+            if file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError('Not a recording: {}'.format(filename))
+
+            offset = len(FILE_MAGIC)
+
+        while True:
+            file.seek(offset)
+            header = _read_block_header(file)
+
+            if not header:
+                break
+
+            entries.append((offset, header[4], header[5]))
+            offset += BLOCK_HEADER.size + header[1] + header[2]
+
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+
+    # Drop a block that was only partly written
+    while entries and entries[-1][0] >= size:
+        entries.pop()
+
+    return entries
+
+
+def _read_block_header(file):
+    data = file.read(BLOCK_HEADER.size)
+
+    if len(data) < BLOCK_HEADER.size:
+        return
+
+    header = BLOCK_HEADER.unpack(data)
+
+    if header[0] != BLOCK_MAGIC:
+        return
+
+    return header
+
+
+class RecordingReader(object):
+    def __init__(self, directory, timestamp_start=None):
+        self._directory = directory
+        self._timestamp_start = timestamp_start
+
+    def items(self):
+        # Items are in the same form as the calculator's queue items but
+        # with the timestamp second: ('chat', timestamp, nick, text,
+        # position, tags) and ('live_thread', timestamp, doc).
+        for filename in _segment_filenames(self._directory):
+            yield from self._iter_segment(filename)
+
+    def _iter_segment(self, filename):
+        entries = _read_index(filename)
+        timestamp_start = self._timestamp_start
+
+        if not entries:
+            return
+
+        if timestamp_start:
+            last_timestamps = [entry[2] for entry in entries]
+            start_index = bisect.bisect_left(last_timestamps, timestamp_start)
+        else:
+            start_index = 0
+
+        if start_index >= len(entries):
+            return
+
+        nicks = []
+
+        with open(filename, 'rb') as file:
+            for index, entry in enumerate(entries):
+                file.seek(entry[0])
+                header = _read_block_header(file)
+                magic, nicks_size, records_size, record_count, \
+                    first_timestamp, last_timestamp = header
+
+                if nicks_size:
+                    nicks.extend(zlib.decompress(file.read(nicks_size))
+                                 .decode('utf8').split('\n'))
+
+                if index < start_index:
+                    continue
+
+                records_data = file.read(records_size)
+
+                if len(records_data) < records_size:
+                    break
+
+                for item in self._iter_records(
+                        zlib.decompress(records_data), nicks):
+                    if not timestamp_start or item[1] >= timestamp_start:
+                        yield item
+
+    def _iter_records(self, data, nicks):
+        offset = 0
+        end = len(data)
+
+        while offset < end:
+            record_type = data[offset]
+
+            if record_type == CHAT_TYPE:
+                record_type, timestamp, nick_id, text_length, tags_length = \
+                    CHAT_RECORD.unpack_from(data, offset)
+                offset += CHAT_RECORD.size
+                text = data[offset:offset + text_length].decode('utf8')
+                offset += text_length
+
+                if tags_length == NO_TAGS:
+                    tags = None
+                else:
+                    tags = _decode_tags(data[offset:offset + tags_length])
+                    offset += tags_length
+
+                yield 'chat', timestamp, nicks[nick_id], text, None, tags
+            elif record_type == LIVE_THREAD_TYPE:
+                record_type, timestamp, length = \
+                    LIVE_THREAD_RECORD.unpack_from(data, offset)
+                offset += LIVE_THREAD_RECORD.size
+                doc = json.loads(data[offset:offset + length].decode('utf8'))
+                offset += length
+
+                yield 'live_thread', timestamp, doc
+            else:
+                raise ValueError('Unknown record type {}'.format(record_type))
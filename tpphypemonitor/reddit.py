@@ -1,3 +1,4 @@
+import collections
 import json
 import logging
 import sched
@@ -13,36 +14,48 @@ _logger = logging.getLogger(__name__)
 
 RECONNECT_MIN_INTERVAL = 2
 RECONNECT_MAX_INTERVAL = 300
+BASE_URL = 'https://www.reddit.com'
+HEADERS = {'User-Agent': 'tpp-hype-monitor'}
+BACKFILL_PAGE_SIZE = 100
+BACKFILL_MAX_PAGES = 10
+SEEN_UPDATES_MAX_LEN = 1000
 
 
 class LiveThreadInputSource(InputSourceThread):
-    def __init__(self, thread_id):
+    def __init__(self, thread_id, base_url=BASE_URL):
         super().__init__()
         self._thread_id = thread_id
+        self._base_url = base_url
         self._reconnect_time = RECONNECT_MIN_INTERVAL
+        self._about_doc = None
+        self._about_headers = {}
+        self._last_update_name = None
+        self._seen_update_names = collections.OrderedDict()
 
     def run(self):
+        try:
+            import pycurl
+        except ImportError:
+            pass
+        else:
+            # The curl client keeps connections alive between requests
+            tornado.httpclient.AsyncHTTPClient.configure(
+                'tornado.curl_httpclient.CurlAsyncHTTPClient')
+
         tornado.ioloop.IOLoop.current().run_sync(self._run)
 
     @tornado.gen.coroutine
     def _run(self):
         client = tornado.httpclient.AsyncHTTPClient()
-        about_url = 'https://www.reddit.com/live/{}/about.json'.format(self._thread_id)
 
         while True:
             _logger.info('Get Live Thread info')
-            response = yield client.fetch(about_url)
-
-            if response.code != 200:
-                _logger.error('Live thread info failed. %s %s', response.code,
-                              response.reason)
-                yield self._sleep_failure()
-                continue
 
             try:
-                doc = json.loads(response.body.decode('utf8', 'replace'))
-            except ValueError:
-                _logger.exception('Json parse error')
+                doc = yield self._fetch_about(client)
+                yield self._backfill(client)
+            except (tornado.httpclient.HTTPError, OSError, ValueError):
+                _logger.exception('Live thread info failed')
                 yield self._sleep_failure()
                 continue
 
@@ -50,7 +63,7 @@ class LiveThreadInputSource(InputSourceThread):
 
             try:
                 conn = yield tornado.websocket.websocket_connect(websocket_url)
-            except tornado.websocket.WebSocketError:
+            except (tornado.websocket.WebSocketError, OSError):
                 _logger.exception('Connect websocket error')
                 yield self._sleep_failure()
                 continue
@@ -63,17 +76,111 @@ class LiveThreadInputSource(InputSourceThread):
                 if msg is None:
                     break
 
+                # Most messages are viewer counts so don't decode those
+                if '"update"' not in msg:
+                    continue
+
                 doc = json.loads(msg)
 
                 if doc['type'] == 'update':
-                    post_doc = doc['payload']['data']
-                    _logger.debug('Post: %s: %s', post_doc['author'], post_doc['body'])
-
-                    self._calculator.add_live_thread_activity(post_doc)
+                    self._feed_update(doc['payload']['data'])
 
             _logger.info('Websocket disconnected.')
             yield tornado.gen.sleep(self._reconnect_time)
 
+    @tornado.gen.coroutine
+    def _fetch_about(self, client):
+        about_url = '{}/live/{}/about.json'.format(
+            self._base_url, self._thread_id)
+
+        try:
+            response = yield client.fetch(
+                about_url, headers=dict(self._about_headers, **HEADERS))
+        except tornado.httpclient.HTTPError as error:
+            if error.code == 304 and self._about_doc:
+                return self._about_doc
+            raise
+
+        self._about_doc = json.loads(response.body.decode('utf8', 'replace'))
+        self._about_headers = {}
+
+        if 'Etag' in response.headers:
+            self._about_headers['If-None-Match'] = response.headers['Etag']
+        if 'Last-Modified' in response.headers:
+            self._about_headers['If-Modified-Since'] = \
+                response.headers['Last-Modified']
+
+        return self._about_doc
+
+    @tornado.gen.coroutine
+    def _fetch_updates(self, client, before=None, limit=BACKFILL_PAGE_SIZE):
+        url = '{}/live/{}.json?limit={}'.format(
+            self._base_url, self._thread_id, limit)
+
+        if before:
+            url += '&before={}'.format(before)
+
+        response = yield client.fetch(url, headers=HEADERS)
+        doc = json.loads(response.body.decode('utf8', 'replace'))
+
+        # Newest first
+        return [child['data'] for child in doc['data']['children']]
+
+    @tornado.gen.coroutine
+    def _backfill(self, client):
+        if not self._last_update_name:
+            # Nothing seen yet, so only remember where the thread is at
+            updates = yield self._fetch_updates(client, limit=1)
+
+            for post_doc in updates:
+                self._mark_seen(post_doc)
+
+            return
+
+        for dummy in range(BACKFILL_MAX_PAGES):
+            updates = yield self._fetch_updates(
+                client, before=self._last_update_name)
+
+            if not updates:
+                break
+
+            _logger.info('Backfill %d updates', len(updates))
+
+            for post_doc in reversed(updates):
+                self._feed_update(post_doc, backfill=True)
+
+            if len(updates) < BACKFILL_PAGE_SIZE:
+                break
+
+    def _feed_update(self, post_doc, backfill=False):
+        if not self._mark_seen(post_doc):
+            return
+
+        _logger.debug('Post: %s: %s', post_doc['author'], post_doc['body'])
+
+        if backfill:
+            # Counted when they were posted. The calculator counts those
+            # older than the sealed bins in the oldest open bin.
+            timestamp = post_doc.get('created_utc')
+        else:
+            timestamp = None
+
+        self._calculator.add_live_thread_activity(post_doc, timestamp)
+
+    def _mark_seen(self, post_doc):
+        name = post_doc.get('name') or 'LiveUpdate_{}'.format(post_doc['id'])
+
+        if name in self._seen_update_names:
+            return False
+
+        self._seen_update_names[name] = True
+        self._last_update_name = name
+
+        while len(self._seen_update_names) > SEEN_UPDATES_MAX_LEN:
+            self._seen_update_names.popitem(last=False)
+
+        return True
+
     @tornado.gen.coroutine
     def _sleep_failure(self):
         self._reconnect_time *= 2
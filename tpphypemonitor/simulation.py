@@ -1,10 +1,15 @@
+import collections
+import heapq
 import json
 import logging
+import os
 import sched
+import threading
 
 import arrow
 import time
 
+import tpphypemonitor.logindex
 from tpphypemonitor.source import InputSourceThread
 
 
@@ -12,22 +17,30 @@ _logger = logging.getLogger(__name__)
 
 
 class ChatLogReader(object):
-    def __init__(self, filenames, timestamp_start=None):
+    def __init__(self, filenames, timestamp_start=None, follow=False,
+                 position=None, poll_interval=1.0):
         super().__init__()
         self._filenames = list(sorted(filenames))
+        self._seen_filenames = set(self._filenames)
         self._current_file = None
+        self._current_filename = None
         self._timestamp_start = timestamp_start
+        self._follow = follow
+        self._poll_interval = poll_interval
+        self._position = position
 
     def items(self):
         timestamp_start = self._timestamp_start
 
         while True:
-            self._open_next_file()
-            for line in self._current_file:
+            if not self._open_next_file():
+                return
+
+            for line, position in self._iter_lines():
                 line = line.strip()
 
                 if not line or line.startswith('#'):
-                    self._current_file = None
+                    self._close_current_file()
                     break
 
                 datetime_str, command, rest = line.split(' ', 2)
@@ -45,18 +58,113 @@ class ChatLogReader(object):
                 if timestamp < timestamp_start:
                     continue
 
-                yield timestamp, nick, text
+                yield timestamp, nick, text, position
+
+    def _iter_lines(self):
+        file = self._current_file
+
+        while True:
+            offset = file.tell()
+            line = file.readline()
+
+            if line.endswith(b'\n'):
+                yield line.decode('utf8', 'replace'), \
+                    (self._current_filename, file.tell())
+                continue
+
+            # Partial or no line: rewind so it is read again when complete
+            file.seek(offset)
+
+            if not self._follow:
+                if line:
+                    yield line.decode('utf8', 'replace'), \
+                        (self._current_filename, offset + len(line))
+                self._close_current_file()
+                return
+
+            if self._scan_new_files():
+                _logger.info('File %s rotated', self._current_filename)
+                self._close_current_file()
+                return
+
+            time.sleep(self._poll_interval)
+
+    def _scan_new_files(self):
+        extensions = set(
+            os.path.splitext(filename)[1] for filename in self._seen_filenames)
+        directories = set(
+            os.path.dirname(filename) for filename in self._seen_filenames)
+        new_filenames = []
+
+        for directory in directories:
+            for name in os.listdir(directory or '.'):
+                filename = os.path.join(directory, name)
+
+                if os.path.splitext(name)[1] not in extensions or \
+                        filename in self._seen_filenames:
+                    continue
+
+                if filename > self._current_filename:
+                    new_filenames.append(filename)
+
+        self._seen_filenames.update(new_filenames)
+        self._filenames.extend(new_filenames)
+        self._filenames.sort()
+
+        return bool(new_filenames)
 
     def _open_next_file(self):
-        if not self._filenames:
-            raise ValueError('End of simulation')
+        if self._position:
+            filename, offset = self._position
+            self._position = None
+
+            if filename in self._filenames:
+                index = self._filenames.index(filename)
+                del self._filenames[:index + 1]
+                _logger.info('Resume file %s at %s', filename, offset)
+                self._current_file = open(filename, 'rb')
+                self._current_file.seek(offset)
+                self._current_filename = filename
+                return True
+            else:
+                _logger.warning('Resume file %s not found', filename)
+
+        while not self._filenames:
+            if not self._follow or not self._current_filename:
+                _logger.info('No more files')
+                return False
+
+            time.sleep(self._poll_interval)
+            self._scan_new_files()
+
+        while self._filenames:
+            filename = self._filenames.pop(0)
+            offset = 0
+
+            if self._timestamp_start and not self._follow:
+                offset = tpphypemonitor.logindex.find_offset(
+                    filename, self._timestamp_start)
+
+                if offset is None:
+                    _logger.info('Skip file %s', filename)
+                    continue
+
+            _logger.info('Open file %s', filename)
+            self._current_file = open(filename, 'rb')
+            self._current_file.seek(offset)
+            self._current_filename = filename
+            return True
 
-        filename = self._filenames.pop(0)
-        _logger.info('Open file %s', filename)
-        self._current_file = open(filename, 'r')
+        _logger.info('No more files')
+        return False
+
+    def _close_current_file(self):
+        if self._current_file:
+            self._current_file.close()
+            self._current_file = None
 
     def stop(self):
-        self._current_file.close()
+        self._close_current_file()
 
 
 class LiveThreadReader(object):
@@ -83,34 +191,140 @@ class LiveThreadReader(object):
                 yield timestamp, doc
 
 
+# Reads items in a thread. The consumer takes everything read so far at
+# once, so items are batched while it is busy but a followed log that
+# blocks for new lines doesn't hold back the items already read.
+class ReadaheadIterator(object):
+    def __init__(self, iterable, max_items=10000):
+        self._iterable = iterable
+        self._max_items = max_items
+        self._items = []
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for item in self._iterable:
+                with self._condition:
+                    while len(self._items) >= self._max_items:
+                        self._condition.wait()
+
+                    self._items.append(item)
+                    self._condition.notify()
+        except Exception as error:
+            _logger.exception('Readahead error')
+            self._error = error
+
+        with self._condition:
+            self._done = True
+            self._condition.notify()
+
+    def __iter__(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._done:
+                    self._condition.wait()
+
+                items = self._items
+                self._items = []
+                done = self._done
+                self._condition.notify()
+
+            yield from items
+
+            if done:
+                if self._error:
+                    raise self._error
+
+                return
+
+
 class SimulationInputSource(InputSourceThread):
-    def __init__(self, chat_log_reader, live_thread_reader=None, time_scale=1.0):
+    def __init__(self, chat_log_readers, live_thread_readers=(),
+                 time_scale=1.0, dedup=False, readahead=True,
+                 dedup_window=5, recording_readers=()):
         super().__init__()
-        self._chat_log_reader = chat_log_reader
-        self._live_thread_reader = live_thread_reader
+        self._chat_log_readers = chat_log_readers
+        self._live_thread_readers = live_thread_readers
+        self._recording_readers = recording_readers
         self._time_scale = time_scale
+        self._dedup = dedup
+        self._readahead = readahead
+        self._dedup_window = dedup_window
+
+    def _iter_stream(self, index, items):
+        if self._readahead:
+            items = ReadaheadIterator(items)
+
+        for sequence, item in enumerate(items):
+            # The stream index and sequence keep the merge stable without
+            # comparing the items themselves
+            yield item[1], index, sequence, item
+
+    def _iter_chat(self, reader):
+        for timestamp, nick, text, position in reader.items():
+            yield 'chat', timestamp, nick, text, position, None
+
+    def _iter_live_thread(self, reader):
+        for timestamp, doc in reader.items():
+            yield 'live_thread', timestamp, doc
 
     def _iter_readers(self):
-        if not self._live_thread_reader:
-            for timestamp, nick, text in self._chat_log_reader.items():
-                yield 'chat', timestamp, nick, text
-        else:
-            chat_iter = self._chat_log_reader.items()
-            live_thread_iter = self._live_thread_reader.items()
-            chat_timestamp = None
-            live_thread_timestamp = None
-            while True:
-                if not chat_timestamp:
-                    chat_timestamp, chat_nick, chat_text = next(chat_iter)
-                if not live_thread_timestamp:
-                    live_thread_timestamp, doc = next(live_thread_iter)
-
-                if chat_timestamp < live_thread_timestamp:
-                    yield 'chat', chat_timestamp, chat_nick, chat_text
-                    chat_timestamp = None
-                else:
-                    yield 'live_thread', live_thread_timestamp, doc
-                    live_thread_timestamp = None
+        streams = []
+
+        for reader in self._chat_log_readers:
+            streams.append(self._iter_chat(reader))
+
+        for reader in self._live_thread_readers:
+            streams.append(self._iter_live_thread(reader))
+
+        for reader in self._recording_readers:
+            streams.append(reader.items())
+
+        merged_iter = heapq.merge(*(
+            self._iter_stream(index, stream)
+            for index, stream in enumerate(streams)
+        ))
+
+        if self._dedup:
+            merged_iter = self._iter_dedup(merged_iter)
+
+        for timestamp, index, sequence, item in merged_iter:
+            yield item
+
+    def _iter_dedup(self, merged_iter):
+        # Drop items seen from another stream within the window, as
+        # happens with overlapping loggers of the same channel
+        seen = {}
+        seen_keys = collections.deque()
+
+        for merged_item in merged_iter:
+            timestamp, index, sequence, item = merged_item
+
+            if item[0] == 'chat':
+                key = ('chat', item[2], item[3])
+            else:
+                key = ('live_thread', item[2].get('id') or item[2].get('body'))
+
+            while seen_keys and seen_keys[0][0] < timestamp - self._dedup_window:
+                old_timestamp, old_key = seen_keys.popleft()
+
+                if seen.get(old_key, (None,))[0] == old_timestamp:
+                    del seen[old_key]
+
+            previous = seen.get(key)
+
+            if previous and previous[1] != index:
+                continue
+
+            seen[key] = (timestamp, index)
+            seen_keys.append((timestamp, key))
+
+            yield merged_item
 
     def run(self):
         scheduler = sched.scheduler()
@@ -131,10 +345,15 @@ class SimulationInputSource(InputSourceThread):
                 if item_type == 'chat':
                     nick = item[2]
                     text = item[3]
-                    self._calculator.add_chat_activity(nick, text, timestamp)
+                    position = item[4]
+                    tags = item[5]
+                    self._calculator.add_chat_activity(
+                        nick, text, timestamp, position=position, tags=tags)
                 else:
                     doc = item[2]
                     self._calculator.add_live_thread_activity(doc, timestamp)
 
             scheduler.enterabs(next_timestamp, 0, func)
             scheduler.run()
+
+        _logger.info('End of simulation')
@@ -0,0 +1,196 @@
+import collections
+import math
+
+COMPRESSION = 100
+PERCENTILES = (50, 90, 99)
+SKETCH_BIN_SIZES = (10, 60)
+# Name, span and number of slots. Windowed horizons keep one digest per slot
+# and merge the slots when queried, so old values can be dropped without
+# raw bins.
+HORIZONS = (
+    ('hour', 3600, 12),
+    ('day', 86400, 24),
+    ('run', None, 1),
+)
+
+
+# Merging t-digest (Dunning) with the arcsine scale function. Memory is
+# bounded by the compression regardless of how many values are added.
+class TDigest(object):
+    def __init__(self, compression=COMPRESSION):
+        self._compression = compression
+        self._means = []
+        self._weights = []
+        self._buffer = []
+        self._count = 0
+        self._min = float('inf')
+        self._max = float('-inf')
+
+    def __len__(self):
+        return self._count
+
+    def add(self, value, weight=1):
+        self._buffer.append((value, weight))
+        self._count += weight
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+
+        if len(self._buffer) >= self._compression * 5:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self._buffer.extend(zip(other._means, other._weights))
+        self._count += other._count
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        self._compress()
+
+    def _k_limit(self, quantile):
+        # Quantile where the next centroid must end
+        k = self._compression / (2 * math.pi) * math.asin(2 * quantile - 1) + 1
+
+        if k >= self._compression / 4:
+            return 1.0
+
+        return (math.sin(k * 2 * math.pi / self._compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+
+        items = sorted(self._buffer + list(zip(self._means, self._weights)))
+        self._buffer = []
+        means = []
+        weights = []
+        total = self._count
+        cumulative = 0
+        limit = self._k_limit(0)
+        mean, weight = items[0]
+
+        for item_mean, item_weight in items[1:]:
+            if (cumulative + weight + item_weight) / total <= limit:
+                weight += item_weight
+                mean += (item_mean - mean) * item_weight / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                cumulative += weight
+                limit = self._k_limit(cumulative / total)
+                mean, weight = item_mean, item_weight
+
+        means.append(mean)
+        weights.append(weight)
+        self._means = means
+        self._weights = weights
+
+    def quantile(self, quantile):
+        self._compress()
+
+        if not self._count:
+            return
+
+        means = self._means
+        weights = self._weights
+        target = quantile * self._count
+
+        # Centroid means are placed at the middle of their weight
+        prev_center = 0
+        prev_mean = self._min
+        cumulative = 0
+
+        for mean, weight in zip(means, weights):
+            center = cumulative + weight / 2
+
+            if target < center:
+                if center == prev_center:
+                    return mean
+
+                fraction = (target - prev_center) / (center - prev_center)
+                return prev_mean + (mean - prev_mean) * fraction
+
+            prev_center = center
+            prev_mean = mean
+            cumulative += weight
+
+        if self._count == prev_center:
+            return self._max
+
+        fraction = (target - prev_center) / (self._count - prev_center)
+        return prev_mean + (self._max - prev_mean) * fraction
+
+
+class WindowedDigest(object):
+    def __init__(self, span=None, slot_count=1, compression=COMPRESSION):
+        self._span = span
+        self._slot_size = span // slot_count if span else None
+        self._compression = compression
+        self._slots = collections.OrderedDict()
+
+    def add(self, timestamp, value):
+        if self._span:
+            slot = int(timestamp // self._slot_size * self._slot_size)
+
+            while self._slots and \
+                    next(iter(self._slots)) <= timestamp - self._span:
+                self._slots.popitem(last=False)
+        else:
+            slot = 0
+
+        digest = self._slots.get(slot)
+
+        if digest is None:
+            digest = self._slots[slot] = TDigest(self._compression)
+
+        digest.add(value)
+
+    def digest(self, timestamp):
+        result = TDigest(self._compression)
+
+        for slot, digest in self._slots.items():
+            if not self._span or slot > timestamp - self._span:
+                result.merge(digest)
+
+        return result
+
+
+class SketchSet(object):
+    def __init__(self, bin_sizes=SKETCH_BIN_SIZES, horizons=HORIZONS):
+        self._sketches = {}
+
+        for bin_size in bin_sizes:
+            for name, span, slot_count in horizons:
+                for series in ('rate', 'hint'):
+                    self._sketches[(bin_size, name, series)] = \
+                        WindowedDigest(span, slot_count)
+
+        self._horizon_names = tuple(name for name, span, slot_count in horizons)
+        self._bin_sizes = bin_sizes
+
+    def add_data_point(self, bin_size, data_point):
+        if bin_size not in self._bin_sizes:
+            return
+
+        values = (
+            ('rate', data_point.line_count / bin_size),
+            ('hint', data_point.hint_score / bin_size),
+        )
+
+        for name in self._horizon_names:
+            for series, value in values:
+                self._sketches[(bin_size, name, series)].add(
+                    data_point.timestamp, value)
+
+    def percentiles(self, timestamp, percentiles=PERCENTILES):
+        # Nested as bin size, horizon, series, then percentile
+        result = {}
+
+        for (bin_size, name, series), sketch in sorted(self._sketches.items()):
+            digest = sketch.digest(timestamp)
+            result.setdefault(bin_size, {}).setdefault(name, {})[series] = \
+                dict(
+                    ('p{}'.format(percentile), digest.quantile(percentile / 100))
+                    for percentile in percentiles
+                )
+
+        return result
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from tpphypemonitor.calc import BIN_SIZES, DATA_POINT_FIELDS
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+SEGMENT_MAX_SIZE = 16 * 1024 * 1024
+SEGMENT_MAX_DURATION = 86400
+JSON_SEPARATORS = (',', ':')
+SEEK_CHUNK_SIZE = 4096
+
+
+def _segment_name(sequence):
+    return 'segment-{:06d}.ndjson'.format(sequence)
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILENAME)
+
+    if not os.path.exists(path):
+        return {'segments': []}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+# Newline delimited JSON records of sealed bins, hype event begins and ends,
+# and stats snapshots. Records are only appended and segments are listed in
+# the manifest in order, so readers can resume from a (segment, offset)
+# position.
+class BinStreamWriter(object):
+    def __init__(self, directory, bin_sizes=BIN_SIZES,
+                 segment_max_size=SEGMENT_MAX_SIZE,
+                 segment_max_duration=SEGMENT_MAX_DURATION):
+        self._directory = directory
+        self._bin_sizes = bin_sizes
+        self._segment_max_size = segment_max_size
+        self._segment_max_duration = segment_max_duration
+        self._lock = threading.Lock()
+        self._next_timestamps = {}
+        self._file = None
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._manifest = _read_manifest(directory)
+
+        if self._manifest['segments']:
+            self._open_last_segment()
+
+    def _open_last_segment(self):
+        segment = self._manifest['segments'][-1]
+        path = os.path.join(self._directory, segment['name'])
+        offset = 0
+
+        with open(path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+
+                offset += len(line)
+                record = json.loads(line.decode('utf8'))
+
+                if record['type'] == 'bin':
+                    self._next_timestamps[record['bin_size']] = \
+                        record['timestamp'] + record['bin_size']
+
+        self._file = open(path, 'r+b')
+        # Drop a partial line from an unclean shutdown
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def _new_segment(self, timestamp):
+        if self._file:
+            self._file.close()
+
+        segments = self._manifest['segments']
+        sequence = segments[-1]['sequence'] + 1 if segments else 1
+        segment = {
+            'name': _segment_name(sequence),
+            'sequence': sequence,
+            'timestamp': timestamp,
+        }
+
+        self._file = open(os.path.join(self._directory, segment['name']), 'wb')
+        segments.append(segment)
+        self._write_manifest()
+
+        _logger.debug('New stream segment %s', segment['name'])
+
+    def _write_manifest(self):
+        doc = {
+            'bin_sizes': list(self._bin_sizes),
+            'bin_fields': ['timestamp'] + [field for field, typecode in DATA_POINT_FIELDS],
+            'segments': self._manifest['segments'],
+        }
+
+        path = os.path.join(self._directory, MANIFEST_FILENAME)
+        with open(path + '-new', 'w') as file:
+            json.dump(doc, file)
+
+        os.rename(path + '-new', path)
+
+    def _write(self, timestamp, record):
+        data = (json.dumps(record, separators=JSON_SEPARATORS) + '\n')\
+            .encode('utf8')
+
+        with self._lock:
+            if not self._file:
+                self._new_segment(timestamp)
+            else:
+                segment_timestamp = self._manifest['segments'][-1]['timestamp']
+
+                if self._file.tell() >= self._segment_max_size or \
+                        timestamp - segment_timestamp >= self._segment_max_duration:
+                    self._new_segment(timestamp)
+
+            self._file.write(data)
+            self._file.flush()
+
+    def add_data_point(self, bin_size, data_point):
+        if bin_size not in self._bin_sizes or \
+                data_point.timestamp < self._next_timestamps.get(bin_size, 0):
+            return
+
+        self._next_timestamps[bin_size] = data_point.timestamp + bin_size
+
+        record = {
+            'type': 'bin',
+            'bin_size': bin_size,
+            'timestamp': data_point.timestamp,
+        }
+
+        for field, typecode in DATA_POINT_FIELDS:
+            record[field] = getattr(data_point, field)
+
+        self._write(data_point.timestamp, record)
+
+    def add_hype_event(self, event):
+        kind, event_type, event_time, hint_breakdown = event
+
+        self._write(event_time, {
+            'type': 'hype',
+            'kind': kind,
+            'event_type': event_type,
+            'timestamp': event_time,
+            'hint_breakdown': hint_breakdown,
+        })
+
+    def add_stats(self, timestamp, stats):
+        self._write(timestamp, {
+            'type': 'stats',
+            'timestamp': timestamp,
+            'utc_timestamp': time.time(),
+            'stats': stats,
+        })
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class BinStreamReader(object):
+    def __init__(self, directory, position=None):
+        self._directory = directory
+        self._position = tuple(position) if position else None
+
+    @property
+    def position(self):
+        # Segment name and byte offset after the last record read
+        return self._position
+
+    def seek_end(self):
+        # Skip to the end of the newest segment without reading the records
+        segments = _read_manifest(self._directory)['segments']
+
+        if not segments:
+            return
+
+        name = segments[-1]['name']
+
+        with open(os.path.join(self._directory, name), 'rb') as file:
+            offset = file.seek(0, os.SEEK_END)
+
+            # Not past a partial line that is still being written
+            while offset:
+                start = max(0, offset - SEEK_CHUNK_SIZE)
+                file.seek(start)
+                data = file.read(offset - start)
+                index = data.rfind(b'\n')
+
+                if index >= 0:
+                    offset = start + index + 1
+                    break
+
+                offset = start
+
+        self._position = (name, offset)
+
+    def read(self, max_records=None):
+        segment_names = [
+            segment['name']
+            for segment in _read_manifest(self._directory)['segments']
+        ]
+
+        if not segment_names:
+            return []
+
+        if not self._position or self._position[0] not in segment_names:
+            if self._position:
+                _logger.warning('Stream segment %s no longer exists',
+                                self._position[0])
+
+            self._position = (segment_names[0], 0)
+
+        records = []
+
+        while max_records is None or len(records) < max_records:
+            name, offset = self._position
+            offset = self._read_segment(name, offset, records, max_records)
+            self._position = (name, offset)
+            index = segment_names.index(name)
+
+            if max_records and len(records) >= max_records or \
+                    index + 1 == len(segment_names):
+                break
+
+            # Earlier segments are complete once a new one is listed
+            self._position = (segment_names[index + 1], 0)
+
+        return records
+
+    def _read_segment(self, name, offset, records, max_records):
+        with open(os.path.join(self._directory, name), 'rb') as file:
+            file.seek(offset)
+
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+
+                offset += len(line)
+                records.append(json.loads(line.decode('utf8')))
+
+                if max_records and len(records) >= max_records:
+                    break
+
+        return offset
+
+    def tail(self, poll_interval=1.0):
+        while True:
+            records = self.read()
+
+            for record in records:
+                yield record
+
+            if not records:
+                time.sleep(poll_interval)
@@ -34,6 +34,7 @@ def format_duration(seconds):
 
 
 def stats_doc(calculator):
+    hint_breakdown = calculator.hint_breakdown()
     datetime_current = datetime.datetime.utcfromtimestamp(calculator.last_timestamp or 0)
     duration = format_duration(calculator.duration)
 
@@ -44,14 +45,64 @@ def stats_doc(calculator):
         averages_str=calculator.averages_string(median=True),
         hint_averages_str=calculator.averages_string('hint'),
         chat_graph=calculator.graph_string(),
-        hint_graph=calculator.graph_string('hint')
+        hint_graph=calculator.graph_string('hint'),
+        late_count=calculator.late_count,
+        hint_breakdown=hint_breakdown,
+        hint_breakdown_graphs=dict(
+            (label, calculator.graph_string('hint/' + label))
+            for label in tuple(hint_breakdown)[:3]
+        ),
+        vs_typical=calculator.typical_ratios(),
+        percentiles=calculator.percentiles(),
+        ingest=calculator.ingest_stats(),
     )
 
 
+def format_hint_breakdown(hint_breakdown, max_count=5):
+    return ' '.join(
+        '{}:{}'.format(label, count)
+        for label, count in tuple(hint_breakdown.items())[:max_count]
+    )
+
+
+def format_typical_ratios(ratios):
+    return ' '.join(
+        '{} {}'.format(
+            name, '{:.1f}x'.format(ratios[series])
+            if ratios.get(series) is not None else '--')
+        for name, series in (('chat', 'rate'), ('hint', 'hint'))
+    )
+
+
+def format_percentiles(percentiles, bin_size=10, series='rate'):
+    parts = []
+
+    for name in ('hour', 'day', 'run'):
+        values = percentiles[bin_size][name][series]
+        parts.append('{} {}'.format(name, '/'.join(
+            '{:.2f}'.format(values[key]) if values[key] is not None else '--'
+            for key in ('p50', 'p90', 'p99')
+        )))
+
+    return ' '.join(parts)
+
+
 def format_summary(calculator):
-    return '{date} ({duration})\n' \
+    doc = stats_doc(calculator)
+
+    text = '{date} ({duration})\n' \
            'Lines/sec {averages_str}\n' \
            'Hints/sec {hint_averages_str}\n' \
            'Chat {chat_graph}\n' \
-           'Hint {hint_graph}'\
-        .format(**stats_doc(calculator))
+           'Hint {hint_graph}\n' \
+           'Hint breakdown {hint_breakdown_str}\n' \
+           'Lines/sec p50/p90/p99 {percentiles_str}'\
+        .format(hint_breakdown_str=format_hint_breakdown(doc['hint_breakdown']),
+                percentiles_str=format_percentiles(doc['percentiles']),
+                **doc)
+
+    if doc['vs_typical']:
+        text += '\nVs typical {}'.format(
+            format_typical_ratios(doc['vs_typical']))
+
+    return text